@@ -1,17 +1,58 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
+import asyncio
+import hashlib
+import logging
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from pydantic_settings import BaseSettings
-from typing import List, Optional, AsyncGenerator
+from typing import Any, AsyncGenerator, Dict, List, Optional
 import httpx # For async HTTP requests
 import openai
-import os
 import uvicorn
 import json
 from fastapi.middleware.cors import CORSMiddleware
 
+from common.admission import (AdmissionConfig, AdmissionController, Overloaded, client_key,
+                              request_client_key, stream_until_disconnect)
+from common.cache import SearchCache, SearchCacheConfig, cache_key
+from common.context import ContextAssembler, ContextConfig
+from common.fetch import FetchConfig, PageFetcher
+from common.http import HTTPPoolConfig, PooledHTTPClient
+from common.llm import LLMClientRegistry
+from common.resilience import CircuitOpen, ResilienceConfig, ResilientCaller
+from common.search import SearchBackend, create_provider
+from common.semantic_cache import SemanticAnswerCache, SemanticCacheConfig, chunk_text, guess_locale
+from common.serve import resolve_workers, serve
+from common.shared import default_store_url, open_store
+from common.singleflight import SingleFlight, StreamFanout
+from common.sse import SSEEncoder, TextDelta, coalesce
+from common.tavily import TAVILY_BASE_URL
+from common.telemetry import Registry, result_bytes
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled client for all Tavily calls, kept open for the app's lifetime
+    await http_client.start()
+    try:
+        yield
+    finally:
+        await http_client.aclose()
+        await llm_clients.aclose()
+        search_cache.close()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # 允许跨域
 app.add_middleware(
@@ -28,6 +69,8 @@ app.add_middleware(
 class SearchRequest(BaseModel):
     query: str
     top_k: Optional[int] = 5
+    use_cache: bool = True
+    locale: Optional[str] = None  # Guessed from the query when omitted
 
 class SearchSource(BaseModel): # Will be used within the data part of an SSE event
     title: str
@@ -35,58 +78,301 @@ class SearchSource(BaseModel): # Will be used within the data part of an SSE eve
 
 class Settings(BaseSettings):
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "your_openai_api_key")
-    OPENAI_BASE_URL: str = os.getenv("OPENAI_BASE_URL")
+    OPENAI_BASE_URL: Optional[str] = os.getenv("OPENAI_BASE_URL")
     TAVILY_API_KEY: str = os.getenv("TAVILY_API_KEY", "your_tavily_api_key")
     OPENAI_MODEL_NAME: str = os.getenv("OPENAI_MODEL_NAME", "gpt-3.5-turbo")
+    TAVILY_BASE_URL: str = TAVILY_BASE_URL
+    # LLM client and its own connection pool; roles only change request parameters
+    LLM_ROLES: Dict[str, Dict[str, Any]] = {}  # JSON, e.g. {"summary": {"temperature": 0.2, "max_tokens": 768}}
+    LLM_MAX_CONNECTIONS: int = 50
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    LLM_KEEPALIVE_EXPIRY: float = 60.0
+    LLM_HTTP2: bool = True
+    LLM_CONNECT_TIMEOUT: float = 5.0
+    LLM_READ_TIMEOUT: float = 120.0  # Longest wait for the next bytes of a completion, including the first token
+    LLM_WRITE_TIMEOUT: float = 10.0
+    LLM_POOL_TIMEOUT: float = 10.0
+
+    # Search providers: comma-separated names, in order of preference ("tavily", "local", or registered ones)
+    SEARCH_PROVIDERS: str = "tavily"
+    SEARCH_MODE: str = "fallback"  # "fallback", "race" (first good results win) or "merge" (rank fusion)
+    SEARCH_RACE_MIN_RESULTS: int = 0  # Good results that end a race; 0 = top_k
+    SEARCH_MERGE_TIMEOUT: float = 10.0  # Seconds to wait for slow providers in merge mode
+    LOCAL_SEARCH_PATH: str = "docs"  # Directory of .md/.txt/.html files for the "local" provider
+    LOCAL_INDEX_DIR: Optional[str] = None  # Where the local index is stored; <LOCAL_SEARCH_PATH>/.index when unset
+    LOCAL_INDEX_DENSE: bool = False  # Also rank by embedding similarity (memory-mapped vectors)
+    LOCAL_INDEX_REFRESH_INTERVAL: float = 60.0  # Seconds between scans for changed files; 0 = only the first search
+
+    # Shared HTTP connection pool
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    HTTP2: bool = True
+    HTTP_CONNECT_TIMEOUT: float = 5.0
+    HTTP_READ_TIMEOUT: float = 10.0
+    HTTP_WRITE_TIMEOUT: float = 10.0
+    HTTP_POOL_TIMEOUT: float = 5.0
+
+    # Search-result cache
+    SEARCH_CACHE_MAX_ENTRIES: int = 1024
+    SEARCH_CACHE_TTL: float = 600.0
+    SEARCH_CACHE_STALE_TTL: float = 3600.0
+    SEARCH_CACHE_PATH: Optional[str] = None  # SQLite file for a persistent tier; memory only when unset
+
+    # Share one upstream call between concurrent identical requests
+    COALESCE_REQUESTS: bool = True
+
+    # Context assembly: bound the snippets sent to the summarizer
+    CONTEXT_TOKEN_BUDGET: int = 3000
+    CONTEXT_PASSAGE_TOKENS: int = 200
+    CONTEXT_DEDUP_THRESHOLD: float = 0.8
+    CONTEXT_TOKENIZER: Optional[str] = None  # tiktoken encoding, e.g. "cl100k_base"; estimated when unset
+
+    # Page fetching: summarize the top pages' text rather than the search snippets
+    FETCH_PAGES: bool = False
+    FETCH_TOP_K: int = 3  # Results whose pages are fetched
+    FETCH_MAX_BYTES: int = 1_000_000  # Per page; larger bodies are cut off
+    FETCH_MAX_CHARS: int = 20000  # Extracted text kept per page
+    FETCH_PER_HOST: int = 2  # Concurrent downloads per host
+    FETCH_CONCURRENCY: int = 8  # Concurrent downloads overall
+    FETCH_TIMEOUT: float = 5.0  # Seconds for the whole stage; slower pages are skipped
+    FETCH_CACHE_DIR: Optional[str] = None  # Disk cache of extracted text, keyed by URL and revalidated by ETag
+    FETCH_CACHE_TTL: float = 3600.0  # Seconds a cached page is used without revalidation
+
+    # Semantic answer cache: reuse summaries of paraphrased queries
+    SEMANTIC_CACHE_ENABLED: bool = False
+    SEMANTIC_CACHE_THRESHOLD: float = 0.8
+    SEMANTIC_CACHE_MATCH_TERMS: bool = True  # A hit must also mention the same numbers and names
+    SEMANTIC_CACHE_TTL: float = 3600.0
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 2048  # Per locale
+
+    # Admission control: concurrency limits (0 = unlimited), overall and per client key
+    ADMISSION_MAX_REQUESTS: int = 64
+    ADMISSION_MAX_REQUESTS_PER_KEY: int = 8
+    ADMISSION_MAX_SEARCHES: int = 32
+    ADMISSION_MAX_SEARCHES_PER_KEY: int = 8
+    ADMISSION_MAX_LLM_CALLS: int = 32
+    ADMISSION_MAX_LLM_CALLS_PER_KEY: int = 4
+    ADMISSION_MAX_QUEUE: int = 128  # Callers allowed to wait for a slot; beyond that, 429
+    ADMISSION_MAX_WAIT: float = 10.0  # Seconds; callers that would wait longer get 429 with Retry-After
+    # Upstream rate limits in requests per second (0 = unlimited)
+    TAVILY_RATE_LIMIT: float = 0.0
+    TAVILY_RATE_BURST: int = 10
+    OPENAI_RATE_LIMIT: float = 0.0
+    OPENAI_RATE_BURST: int = 10
+    DISCONNECT_POLL_INTERVAL: float = 0.5  # Seconds between client-disconnect checks while streaming
+
+    # Upstream resilience: retries with jittered backoff, hedged searches, circuit breakers
+    SEARCH_RETRY_ATTEMPTS: int = 3  # Total attempts per search, including the first
+    SEARCH_RETRY_BASE_DELAY: float = 0.2
+    SEARCH_RETRY_MAX_DELAY: float = 2.0
+    SEARCH_HEDGE: bool = True  # Send a backup search when the first is slower than usual
+    SEARCH_HEDGE_QUANTILE: float = 0.95
+    SEARCH_HEDGE_DELAY: float = 1.0  # Seconds, until enough latencies are known
+    SEARCH_HEDGE_MIN_DELAY: float = 0.05
+    LLM_RETRY_ATTEMPTS: int = 2  # Retries only happen before the first token is streamed
+    LLM_RETRY_BASE_DELAY: float = 0.5  # Longer than for searches: an overloaded model recovers slowly
+    LLM_RETRY_MAX_DELAY: float = 4.0
+    BREAKER_FAILURE_THRESHOLD: int = 5  # Consecutive failures that open a provider's circuit; 0 disables
+    BREAKER_RECOVERY_TIME: float = 30.0  # Seconds a provider is skipped before a trial call
+
+    # SSE output: batch answer chunks into fewer, larger frames
+    SSE_COALESCE_INTERVAL_MS: float = 20.0  # 0 sends each chunk alone
+    SSE_COALESCE_MAX_BYTES: int = 512
+
+    # Instrumentation: Prometheus metrics on /metrics
+    LLM_STREAM_USAGE: bool = True  # Ask for token usage on streamed completions (stream_options.include_usage)
+
+    # Serving: WORKERS=0 runs the development server with auto-reload
+    HOST: str = "0.0.0.0"
+    PORT: int = 8000
+    WORKERS: int = 0  # N > 0: production mode with N preloaded worker processes; -1: one per CPU
+    GRACEFUL_SHUTDOWN_TIMEOUT: float = 30.0  # Seconds workers get to finish in-flight requests
+    # Store shared by the workers for the search cache, answer cache and in-flight searches:
+    # sqlite:///path.db or redis://host:6379/0. With several workers it defaults to a SQLite file in the temp dir
+    SHARED_STORE_URL: Optional[str] = None
 
     class Config:
         env_file = ".env"
         case_sensitive = True
 
 settings = Settings()
-openai_client = openai.AsyncOpenAI(
+
+# Exposed on /metrics; every worker process reports its own
+metrics = Registry("aisearch_")
+search_seconds = metrics.histogram("search_duration_seconds", "Wall time of a search, cache included")
+search_results = metrics.histogram("search_results", "Results returned by a search",
+                                   buckets=(0, 1, 2, 5, 10, 20, 50, 100))
+search_bytes = metrics.histogram("search_result_bytes", "Text bytes in the results of a search",
+                                 buckets=(1e3, 4e3, 16e3, 64e3, 256e3, 1e6, 4e6))
+search_errors = metrics.counter("search_errors_total", "Failed searches")
+llm_seconds = metrics.histogram("llm_duration_seconds", "Wall time of the summary call, from request to last token")
+llm_ttft_seconds = metrics.histogram("llm_time_to_first_token_seconds", "Time to the summary's first streamed token")
+llm_tokens = metrics.counter("llm_tokens_total", "Summary tokens, prompt (in) and completion (out)", ["direction"])
+llm_errors = metrics.counter("llm_errors_total", "Failed summary calls")
+llm_clients = LLMClientRegistry(
     api_key=settings.OPENAI_API_KEY,
-    base_url=settings.OPENAI_BASE_URL if settings.OPENAI_BASE_URL else None,
+    base_url=settings.OPENAI_BASE_URL,
+    model=settings.OPENAI_MODEL_NAME,
+    config=HTTPPoolConfig(
+        max_connections=settings.LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+        http2=settings.LLM_HTTP2,
+        connect_timeout=settings.LLM_CONNECT_TIMEOUT,
+        read_timeout=settings.LLM_READ_TIMEOUT,
+        write_timeout=settings.LLM_WRITE_TIMEOUT,
+        pool_timeout=settings.LLM_POOL_TIMEOUT,
+    ),
+    roles=settings.LLM_ROLES,
+    max_retries=0,  # llm_resilience retries, so attempts and breaker state are counted in one place
+)
+http_client = PooledHTTPClient(HTTPPoolConfig(
+    max_connections=settings.HTTP_MAX_CONNECTIONS,
+    max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+    http2=settings.HTTP2,
+    connect_timeout=settings.HTTP_CONNECT_TIMEOUT,
+    read_timeout=settings.HTTP_READ_TIMEOUT,
+    write_timeout=settings.HTTP_WRITE_TIMEOUT,
+    pool_timeout=settings.HTTP_POOL_TIMEOUT,
+))
+# Each worker process opens its own connection to the store, so it is safe to create before forking
+shared_store = None
+if settings.SHARED_STORE_URL or resolve_workers(settings.WORKERS) > 1:
+    shared_store = open_store(settings.SHARED_STORE_URL or default_store_url("aisearch", settings.PORT), "aisearch")
+search_cache = SearchCache(SearchCacheConfig(
+    max_entries=settings.SEARCH_CACHE_MAX_ENTRIES,
+    ttl=settings.SEARCH_CACHE_TTL,
+    stale_ttl=settings.SEARCH_CACHE_STALE_TTL,
+    disk_path=settings.SEARCH_CACHE_PATH,
+), store=shared_store)
+answer_cache = SemanticAnswerCache(SemanticCacheConfig(
+    threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+    match_terms=settings.SEMANTIC_CACHE_MATCH_TERMS,
+    ttl=settings.SEMANTIC_CACHE_TTL,
+    max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+), store=shared_store) if settings.SEMANTIC_CACHE_ENABLED else None
+context_assembler = ContextAssembler(ContextConfig(
+    token_budget=settings.CONTEXT_TOKEN_BUDGET,
+    passage_tokens=settings.CONTEXT_PASSAGE_TOKENS,
+    dedup_threshold=settings.CONTEXT_DEDUP_THRESHOLD,
+    tokenizer=settings.CONTEXT_TOKENIZER,
+))
+page_fetcher = PageFetcher(lambda: http_client.client, FetchConfig(
+    top_k=settings.FETCH_TOP_K,
+    max_bytes=settings.FETCH_MAX_BYTES,
+    max_chars=settings.FETCH_MAX_CHARS,
+    per_host=settings.FETCH_PER_HOST,
+    concurrency=settings.FETCH_CONCURRENCY,
+    timeout=settings.FETCH_TIMEOUT,
+    cache_dir=settings.FETCH_CACHE_DIR,
+    cache_ttl=settings.FETCH_CACHE_TTL,
+)) if settings.FETCH_PAGES else None
+search_flight = SingleFlight(store=shared_store)
+summary_fanout = StreamFanout()
+admission = AdmissionController(AdmissionConfig(
+    limits={
+        "request": (settings.ADMISSION_MAX_REQUESTS, settings.ADMISSION_MAX_REQUESTS_PER_KEY),
+        "search": (settings.ADMISSION_MAX_SEARCHES, settings.ADMISSION_MAX_SEARCHES_PER_KEY),
+        "llm": (settings.ADMISSION_MAX_LLM_CALLS, settings.ADMISSION_MAX_LLM_CALLS_PER_KEY),
+    },
+    max_queue=settings.ADMISSION_MAX_QUEUE,
+    max_wait=settings.ADMISSION_MAX_WAIT,
+    rates={
+        "tavily": (settings.TAVILY_RATE_LIMIT, settings.TAVILY_RATE_BURST),
+        "openai": (settings.OPENAI_RATE_LIMIT, settings.OPENAI_RATE_BURST),
+    },
+))
+# Constructor arguments of the built-in providers; registered providers are built without any
+PROVIDER_OPTIONS = {
+    "tavily": dict(client=lambda: http_client.client, api_key=settings.TAVILY_API_KEY,
+                   base_url=settings.TAVILY_BASE_URL, search_depth="basic"),
+    "local": dict(path=settings.LOCAL_SEARCH_PATH, index_dir=settings.LOCAL_INDEX_DIR, dense=settings.LOCAL_INDEX_DENSE,
+                  refresh_interval=settings.LOCAL_INDEX_REFRESH_INTERVAL),
+}
+search_backend = SearchBackend(
+    [create_provider(name, **PROVIDER_OPTIONS.get(name, {}))
+     for name in (n.strip() for n in settings.SEARCH_PROVIDERS.split(",")) if name],
+    mode=settings.SEARCH_MODE,
+    race_min_results=settings.SEARCH_RACE_MIN_RESULTS,
+    merge_timeout=settings.SEARCH_MERGE_TIMEOUT,
+    resilience=ResilienceConfig(
+        retry_attempts=settings.SEARCH_RETRY_ATTEMPTS,
+        retry_base_delay=settings.SEARCH_RETRY_BASE_DELAY,
+        retry_max_delay=settings.SEARCH_RETRY_MAX_DELAY,
+        hedge=settings.SEARCH_HEDGE,
+        hedge_quantile=settings.SEARCH_HEDGE_QUANTILE,
+        hedge_delay=settings.SEARCH_HEDGE_DELAY,
+        hedge_min_delay=settings.SEARCH_HEDGE_MIN_DELAY,
+        breaker_failure_threshold=settings.BREAKER_FAILURE_THRESHOLD,
+        breaker_recovery_time=settings.BREAKER_RECOVERY_TIME,
+    ),
+    # Every attempt, including retries and hedges, counts against the provider's rate limit
+    before_attempt=admission.throttle,
 )
+llm_resilience = ResilientCaller("openai", ResilienceConfig(
+    retry_attempts=settings.LLM_RETRY_ATTEMPTS,
+    retry_base_delay=settings.LLM_RETRY_BASE_DELAY,
+    retry_max_delay=settings.LLM_RETRY_MAX_DELAY,
+    breaker_failure_threshold=settings.BREAKER_FAILURE_THRESHOLD,
+    breaker_recovery_time=settings.BREAKER_RECOVERY_TIME,
+))
 
 # ------------------
-# Call Tavily Search API (Async)
+# Search the configured providers (Async)
 # ------------------
-async def search_web_async(query: str, top_k: int = 5) -> List[dict]:
-    url = "https://api.tavily.com/search"
-    headers = {"Content-Type": "application/json"}
-    payload = {
-        "api_key": settings.TAVILY_API_KEY,
-        "query": query,
-        "search_depth": "basic",
-        "include_answer": False,
-        "include_raw_content": False,
-        "max_results": top_k
-    }
-    async with httpx.AsyncClient() as client:
+async def search_web_async(query: str, top_k: int = 5, use_cache: bool = True) -> List[dict]:
+    key = cache_key(query, "basic", top_k, search_backend.key)
+
+    async def fetch():
+        if not settings.COALESCE_REQUESTS:
+            return await _fetch_search_results(query, top_k)
+        return await search_flight.do(key, lambda: _fetch_search_results(query, top_k))
+
+    start = time.perf_counter()
+    try:
+        results = await search_cache.get_or_fetch(key, fetch, use_cache)
+    except Exception:
+        search_errors.inc()
+        raise
+    search_seconds.observe(time.perf_counter() - start)
+    search_results.observe(len(results))
+    search_bytes.observe(result_bytes(results))
+    return results
+
+
+async def _fetch_search_results(query: str, top_k: int) -> List[dict]:
+    try:
+        async with admission.slot("search"):
+            response = await search_backend.search(query, top_k)
+    except Overloaded as exc:
+        raise HTTPException(status_code=429, detail=str(exc), headers={"Retry-After": str(int(exc.retry_after))})
+    except CircuitOpen as exc:
+        raise HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": str(int(exc.retry_after))})
+    except httpx.RequestError as exc:
+        raise HTTPException(status_code=503, detail=f"Search service request failed: {exc}")
+    except httpx.HTTPStatusError as exc:
+        error_detail = f"Search failed with status {exc.response.status_code}"
         try:
-            response = await client.post(url, json=payload, headers=headers, timeout=10.0)
-            response.raise_for_status()
-        except httpx.RequestError as exc:
-            raise HTTPException(status_code=503, detail=f"Tavily service request failed: {exc}")
-        except httpx.HTTPStatusError as exc:
-            error_detail = f"Tavily search failed with status {exc.response.status_code}"
-            try:
-                error_content = exc.response.json()
-                error_detail += f": {error_content.get('error', 'Unknown error')}"
-            except json.JSONDecodeError:
-                error_detail += f": {exc.response.text}"
-            raise HTTPException(status_code=exc.response.status_code, detail=error_detail)
-    return response.json().get("results", [])
+            error_content = exc.response.json()
+            error_detail += f": {error_content.get('error', 'Unknown error')}"
+        except json.JSONDecodeError:
+            error_detail += f": {exc.response.text}"
+        raise HTTPException(status_code=exc.response.status_code, detail=error_detail)
+    return response.get("results", [])
 
 # ------------------
 # Use OpenAI to generate and stream summary (Async Generator)
 # This generator now raises exceptions on API error to be caught by its caller.
 # ------------------
 
-async def generate_summary_stream_content(query: str, snippets: List[str]) -> AsyncGenerator[str, None]:
+async def generate_summary_stream_content(query: str, snippets: List[str],
+                                          citations: Optional[List[int]] = None) -> AsyncGenerator[str, None]:
+    # citations[i] is the source number of snippets[i]; defaults to 1..n
+    citations = citations or list(range(1, len(snippets) + 1))
     numbered_snippets = [
-        f"[[citation:{i + 1}]] {snippet}" for i, snippet in enumerate(snippets)
+        f"[[citation:{citation}]] {snippet}" for citation, snippet in zip(citations, snippets)
     ]
 
     prompt = f"""
@@ -104,30 +390,80 @@ Snippets:
 Answer in 3-5 bullet points, with clarity. Only provide the answer to the query based on the snippets. Do not add any conversational filler before or after the answer.
 Remember, don't blindly repeat the contexts verbatim. And here is the user question:
 """
-    stream = await openai_client.chat.completions.create(
-        model=settings.OPENAI_MODEL_NAME,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.5,
-        max_tokens=512,
-        stream=True
-    )
-    async for chunk in stream:
-        if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
-            yield chunk.choices[0].delta.content
+    async def attempt():
+        await admission.throttle("openai")
+        return await llm_clients.client.chat.completions.create(
+            messages=[{"role": "user", "content": prompt}],
+            stream=True,
+            **({"stream_options": {"include_usage": True}} if settings.LLM_STREAM_USAGE else {}),
+            **llm_clients.params("summary", temperature=0.5, max_tokens=512),
+        )
+
+    async with admission.slot("llm"):
+        # Timed from the admitted call, so queueing for the slot is not counted
+        start = time.perf_counter()
+        chunks, usage = 0, None
+        try:
+            # Only opening the stream is retried: nothing has reached the client yet
+            stream = await llm_resilience.call(attempt, hedge=False)
+            # Closing the stream (also on cancellation) drops the upstream connection right away
+            async with stream:
+                async for chunk in stream:
+                    usage = chunk.usage or usage
+                    if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                        if not chunks:
+                            llm_ttft_seconds.observe(time.perf_counter() - start)
+                        chunks += 1
+                        yield chunk.choices[0].delta.content
+        except Exception:
+            llm_errors.inc()
+            raise
+        llm_seconds.observe(time.perf_counter() - start)
+        # Without reported usage, count streamed chunks; roughly one token each
+        llm_tokens.inc(usage.prompt_tokens if usage else 0, direction="in")
+        llm_tokens.inc(usage.completion_tokens if usage else chunks, direction="out")
+
+
+def summary_stream(query: str, snippets: List[str], citations: List[int]) -> AsyncGenerator[str, None]:
+    """
+    Stream the summary, sharing one OpenAI call between identical concurrent requests.
+    Late joiners replay the chunks produced so far, then follow the live stream.
+    """
+    if not settings.COALESCE_REQUESTS:
+        return generate_summary_stream_content(query, snippets, citations)
+    key = hashlib.sha256(json.dumps([query, snippets, citations], ensure_ascii=False).encode("utf-8")).hexdigest()
+    return summary_fanout.subscribe(key, lambda: generate_summary_stream_content(query, snippets, citations))
 
 
 # ------------------
 # Main Streaming Endpoint /search/summary (SSE Formatted)
 # ------------------
-async def stream_response_generator(query: str, top_k: int) -> AsyncGenerator[str, None]:
-    # Helper to format SSE messages
-    def format_sse_event(event_name: str, data: any) -> str:
-        json_data = json.dumps(data)
-        return f"event: {event_name}\ndata: {json_data}\n\n"
+sse_encoder = SSEEncoder()
+
+
+def format_sse_event(event_name: str, data: any) -> str:
+    """Format one SSE message."""
+    return sse_encoder.encode(event_name, data)
+
+
+async def stream_response_generator(query: str, top_k: int, use_cache: bool = True,
+                                    locale: Optional[str] = None) -> AsyncGenerator[str, None]:
+    """SSE messages for a summary; answer chunks are ``TextDelta`` so ``coalesce`` can batch them."""
+
+    # 0. Serve a cached answer for the same or a paraphrased question
+    locale = locale or guess_locale(query)
+    if answer_cache is not None and use_cache:
+        cached = await asyncio.to_thread(answer_cache.lookup, query, locale)
+        if cached is not None:
+            yield format_sse_event("sources", cached.sources)
+            for text in chunk_text(cached.answer):
+                yield TextDelta("answer_chunk", text)
+            yield format_sse_event("done", {"message": "Stream completed successfully."})
+            return
 
     # 1. Get search results
     try:
-        results = await search_web_async(query, top_k)
+        results = await search_web_async(query, top_k, use_cache)
     except HTTPException as e:
         yield format_sse_event("error", {"message": f"Search failed: {e.detail}", "status_code": e.status_code})
         return
@@ -149,18 +485,29 @@ async def stream_response_generator(query: str, top_k: int) -> AsyncGenerator[st
     sources_data = [SearchSource(title=r.get("title", ""), url=r.get("url", "")).model_dump() for r in results]
     yield format_sse_event("sources", sources_data)
 
-    # 3. Prepare snippets and stream summary
-    snippets = [r.get("content", r.get("snippet", "")) for r in results if r.get("content") or r.get("snippet")]
+    # 3. Prepare snippets and stream summary: de-duplicated, ranked and packed into
+    # the token budget, keeping each passage's source number for citations.
+    # With page fetching on, the top results' page text replaces their snippets
+    if page_fetcher is not None:
+        results = await page_fetcher.enrich(results)
+    passages = context_assembler.assemble(query, results)
+    snippets = [p.text for p in passages]
+    citations = [p.citation for p in passages]
     if not snippets:
         # Send as an answer_chunk or a specific event like "info"
         yield format_sse_event("answer_chunk", "Could not extract snippets from search results to generate a summary.")
         yield format_sse_event("done", {"message": "Stream completed due to no snippets."})
         return
 
+    answer_parts = []
     try:
-        async for summary_chunk_content in generate_summary_stream_content(query, snippets):
+        async for summary_chunk_content in summary_stream(query, snippets, citations):
+            answer_parts.append(summary_chunk_content)
             # The data for answer_chunk is the text string itself
-            yield format_sse_event("answer_chunk", summary_chunk_content)
+            yield TextDelta("answer_chunk", summary_chunk_content)
+    except CircuitOpen as e:
+        logger.warning("AI API unavailable: %s", e)
+        yield format_sse_event("error", {"message": str(e), "status_code": 503})
     except openai.APIStatusError as e:
         error_data = {
             "message": f"AI API status error: {e.status_code}",
@@ -182,14 +529,96 @@ async def stream_response_generator(query: str, top_k: int) -> AsyncGenerator[st
         print(f"An unexpected error occurred during OpenAI streaming: {e}")
         yield format_sse_event("error", {"message": f"Unexpected error during summary generation: {str(e)}"})
     else: # Only yield "done" if the stream completed without OpenAI errors
+        if answer_cache is not None:
+            await asyncio.to_thread(answer_cache.store, query, "".join(answer_parts), sources_data, locale)
         yield format_sse_event("done", {"message": "Stream completed successfully."})
 
 
 @app.post("/search/summary")
-async def search_summary_sse_endpoint(request: SearchRequest):
+async def search_summary_sse_endpoint(http_request: Request, request: SearchRequest):
+    # Admit the request (or answer 429) before streaming starts
+    client_key.set(request_client_key(http_request.headers, http_request.client.host if http_request.client else None))
+    try:
+        permit = await admission.acquire("request")
+    except Overloaded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(int(e.retry_after))})
+
+    # Upstream search and summary are cancelled as soon as the client disconnects
+    events = coalesce(stream_response_generator(request.query, request.top_k, request.use_cache, request.locale),
+                      sse_encoder, interval=settings.SSE_COALESCE_INTERVAL_MS / 1000,
+                      max_bytes=settings.SSE_COALESCE_MAX_BYTES)
     return StreamingResponse(
-        stream_response_generator(request.query, request.top_k),
+        stream_until_disconnect(http_request, events, settings.DISCONNECT_POLL_INTERVAL, permit),
+        background=BackgroundTask(permit.release),
         media_type="text/event-stream" # SSE media type
     )
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Search and summary latency, time to first token, tokens and result sizes, in the Prometheus format."""
+    return PlainTextResponse(metrics.render(), media_type=metrics.content_type)
+
+
+@app.get("/stats/http_pool")
+async def http_pool_stats():
+    """Connection-pool occupancy of the shared Tavily client."""
+    return http_client.stats()
+
+
+@app.get("/stats/llm_pool")
+async def llm_pool_stats():
+    """Connection reuse and occupancy of the shared LLM client, and the settings of each role."""
+    return llm_clients.stats()
+
+
+@app.get("/stats/admission")
+async def admission_stats():
+    """Concurrency, queue depth, wait times and rejections of admission control, plus upstream rate limits."""
+    return admission.stats()
+
+
+@app.get("/stats/resilience")
+async def resilience_stats():
+    """Retries, hedges, latency and circuit-breaker state per upstream provider."""
+    return {**search_backend.resilience_stats(), "openai": llm_resilience.stats()}
+
+
+@app.get("/stats/search")
+async def search_provider_stats():
+    """Calls, errors, wins and latency per search provider."""
+    return search_backend.stats()
+
+
+@app.get("/stats/fetch")
+async def fetch_stats():
+    """Pages fetched, cache hits, bytes and latency of the page fetch stage."""
+    if page_fetcher is None:
+        return {"enabled": False}
+    return {"enabled": True, **page_fetcher.stats()}
+
+
+@app.get("/stats/cache")
+async def search_cache_stats():
+    """Hit/miss/eviction counters of the search-result cache."""
+    return search_cache.stats_dict()
+
+
+@app.get("/stats/answer_cache")
+async def answer_cache_stats():
+    """Hit/miss counters of the semantic answer cache."""
+    return answer_cache.stats() if answer_cache is not None else {"enabled": False}
+
+
+@app.get("/stats/coalescing")
+async def coalescing_stats():
+    """How many requests shared an in-flight search or summary stream."""
+    return {"search": search_flight.stats(), "summary": summary_fanout.stats()}
+
+
 if __name__ == "__main__":
-    uvicorn.run("__main__:app", host="0.0.0.0", port=8000, reload=True, workers=1)
+    if settings.WORKERS:
+        serve(app, settings.HOST, settings.PORT, resolve_workers(settings.WORKERS),
+              settings.GRACEFUL_SHUTDOWN_TIMEOUT, warm_up=search_backend.warm_up)
+    else:
+        uvicorn.run("__main__:app", host=settings.HOST, port=settings.PORT, reload=True, workers=1)
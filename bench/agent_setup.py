@@ -0,0 +1,87 @@
+"""
+Micro-benchmark of per-request agent setup in DeepSearch.
+
+"before" rebuilds the search Tool and compiles a ReAct graph per request
+(the old behaviour). "after" only builds the per-request inputs for the
+graphs compiled at startup. No network calls are made.
+
+    python bench/agent_setup.py --iterations 200
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "deepsearch")]
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("TAVILY_API_KEY", "bench")
+
+from langchain_core.messages import HumanMessage, SystemMessage  # noqa: E402
+from langchain_core.tools import Tool  # noqa: E402
+from langgraph.prebuilt import create_react_agent  # noqa: E402
+
+from app.core.agents.reporter import ReporterAgent  # noqa: E402
+from app.core.agents.researcher import ResearcherAgent  # noqa: E402
+
+STATE = {
+    "query": "What is the tallest building in the world?",
+    "search_keyword": "tallest building in the world",
+    "locale": "en",
+    "current_time": "Mon Jan 01 2024 00:00:00",
+    "search_result": "Burj Khalifa is 828 m tall.",
+}
+
+
+def _time(fn, iterations: int):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return statistics.mean(samples), statistics.median(samples)
+
+
+def main(iterations: int) -> None:
+    researcher = ResearcherAgent()
+    reporter = ReporterAgent()
+
+    def researcher_before():
+        prompt = researcher.prompt_template.render(query=STATE["query"], locale="en",
+                                                   CURRENT_TIME=STATE["current_time"])
+        tool = Tool(name="web_search_tool", func=researcher._search, coroutine=researcher._asearch,
+                    description="Useful for when you need to search the web for information about the user query")
+        create_react_agent(model=researcher.llm, tools=[tool])
+        return [SystemMessage(content=prompt), HumanMessage(content=STATE["query"]),
+                HumanMessage(content=STATE["search_keyword"])]
+
+    def researcher_after():
+        prompt = researcher.prompt_template.render(query=STATE["query"], locale="en",
+                                                   CURRENT_TIME=STATE["current_time"])
+        return ([SystemMessage(content=prompt), HumanMessage(content=STATE["query"]),
+                 HumanMessage(content=STATE["search_keyword"])], researcher._request_config(STATE))
+
+    def reporter_before():
+        prompt = reporter.prompt_template.render(query=STATE["query"], search_results=STATE["search_result"],
+                                                 locale="en", CURRENT_TIME=STATE["current_time"])
+        create_react_agent(model=reporter.llm, prompt=prompt, tools=[])
+        return [SystemMessage(content=prompt)]
+
+    def reporter_after():
+        prompt = reporter.prompt_template.render(query=STATE["query"], search_results=STATE["search_result"],
+                                                 locale="en", CURRENT_TIME=STATE["current_time"])
+        return [SystemMessage(content=prompt)]
+
+    print(f"{'case':<22}{'mean_us':>12}{'median_us':>12}")
+    for name, fn in [("researcher/before", researcher_before), ("researcher/after", researcher_after),
+                     ("reporter/before", reporter_before), ("reporter/after", reporter_after)]:
+        fn()  # warm up
+        mean, median = _time(fn, iterations)
+        print(f"{name:<22}{mean:>12.1f}{median:>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    main(parser.parse_args().iterations)
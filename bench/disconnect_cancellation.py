@@ -0,0 +1,120 @@
+"""
+Check that closing an SSE connection mid-answer stops the upstream LLM stream.
+
+Starts the OpenAI and Tavily stubs, runs each app in a subprocess pointed at
+them, opens a streaming query whose answer would take ``--answer-seconds``,
+disconnects after the first streamed token and measures how long the stub's
+completion stream stays open afterwards. Exits non-zero if any app takes
+longer than ``--bound`` seconds.
+
+    python bench/disconnect_cancellation.py --bound 2
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from common.stubs import openai as openai_stub  # noqa: E402
+from common.stubs import tavily as tavily_stub  # noqa: E402
+from common.stubs.server import BackgroundServer, free_port  # noqa: E402
+
+APPS = {
+    # name: (directory, streaming endpoint, request body, marker of the first streamed token)
+    "aisearch": ("aisearch", "/search/summary", {"query": "How tall is the Burj Khalifa?", "use_cache": False},
+                 "event: answer_chunk"),
+    "deepsearch": ("deepsearch", "/api/query_stream",
+                   {"query": "How tall is the Burj Khalifa in Dubai?", "use_cache": False}, '"type":"stream"'),
+}
+
+
+def start_app(directory: str, port: int, openai_url: str, tavily_url: str, poll_interval: float) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "bench",
+        "TAVILY_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"{openai_url}/v1",
+        "TAVILY_BASE_URL": tavily_url,
+        "DISCONNECT_POLL_INTERVAL": str(poll_interval),
+        "PYTHONPATH": ROOT,
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=os.path.join(ROOT, directory), env=env,
+    )
+
+
+async def wait_ready(url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(f"{url}/docs")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not start")
+
+
+async def check(name: str, url: str, streams: list, bound: float) -> bool:
+    _, path, body, marker = APPS[name]
+    before = len(streams)
+    async with httpx.AsyncClient(base_url=url, timeout=30) as client:
+        async with client.stream("POST", path, json=body) as response:
+            async for line in response.aiter_lines():
+                if marker in line:
+                    break
+            closed_at = time.monotonic()
+        # Leaving the block closes the connection mid-answer
+
+    record = None
+    deadline = closed_at + bound + 5
+    while time.monotonic() < deadline:
+        open_streams = [s for s in streams[before:] if s["ended"] is None]
+        ended = [s for s in streams[before:] if s["ended"] is not None]
+        if ended and not open_streams:
+            record = max(ended, key=lambda s: s["ended"])
+            break
+        await asyncio.sleep(0.02)
+    if record is None:
+        print(f"{name:<12} FAIL  upstream stream still open after {bound + 5:.1f}s")
+        return False
+    lag = max(0.0, record["ended"] - closed_at)
+    ok = not record["completed"] and lag <= bound
+    print(f"{name:<12} {'ok' if ok else 'FAIL':<5} upstream closed {lag * 1000:.0f} ms after disconnect, "
+          f"{record['sent']} tokens sent, completed={record['completed']}")
+    return ok
+
+
+async def main(args) -> int:
+    tokens = int(args.answer_seconds / args.token_delay)
+    openai_app = openai_stub.create_app(token_delay=args.token_delay, tokens=tokens)
+    with BackgroundServer(openai_app) as llm, BackgroundServer(tavily_stub.create_app()) as search:
+        results = []
+        for name in args.apps:
+            port = free_port()
+            process = start_app(APPS[name][0], port, llm.url, search.url, args.poll_interval)
+            try:
+                await wait_ready(f"http://127.0.0.1:{port}")
+                results.append(await check(name, f"http://127.0.0.1:{port}", openai_app.state.streams, args.bound))
+            finally:
+                process.terminate()
+                process.wait(timeout=10)
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--apps", nargs="+", default=list(APPS), choices=list(APPS))
+    parser.add_argument("--bound", type=float, default=2.0, help="Seconds allowed between disconnect and upstream close")
+    parser.add_argument("--answer-seconds", type=float, default=20.0)
+    parser.add_argument("--token-delay", type=float, default=0.05)
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    sys.exit(asyncio.run(main(parser.parse_args())))
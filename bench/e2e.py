@@ -0,0 +1,337 @@
+"""
+End-to-end latency and throughput of both apps against stub OpenAI and Tavily servers.
+
+Starts the stubs and the apps as local uvicorn processes (each app in its own
+interpreter, so its CPU time and memory can be read from ``/proc``), then for
+every scenario and concurrency level sends ``--requests`` requests from
+``--concurrency`` virtual users. Each user has its own API key, so per-key
+admission limits behave as they would with real clients. Every request uses a
+distinct query with caching off, so each one reaches the stubs.
+
+Reported per scenario and level: time to first byte, time to first answer
+token (streaming endpoints), total latency percentiles, requests/s, error
+count, and the app's CPU time and peak RSS. ``--output`` writes the run as
+JSON; ``--baseline`` compares against an earlier run's JSON, e.g. from the
+previous commit.
+
+``--workers N`` launches each app in its production mode (``python main.py``
+with ``WORKERS=N``) instead of a single uvicorn process; CPU time and RSS are
+then summed over the workers. Comparing ``--workers 1`` with ``--workers 4``
+at the same concurrency shows how throughput scales with cores.
+
+    python bench/e2e.py --concurrency 1 8 32 --requests 200 --output after.json --baseline before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from common.metrics import LatencyTracker  # noqa: E402
+from common.stubs.server import free_port  # noqa: E402
+
+SCENARIOS = {
+    # name: (app directory, path, request body, marker of the first answer token or None)
+    "summary": ("aisearch", "/search/summary",
+                lambda i: {"query": f"How tall is the Burj Khalifa in Dubai? ({i})", "use_cache": False},
+                "event: answer_chunk"),
+    "query": ("deepsearch", "/api/query",
+              lambda i: {"query": f"How tall is the Burj Khalifa in Dubai? ({i})", "use_cache": False},
+              None),
+    "query_stream": ("deepsearch", "/api/query_stream",
+                     lambda i: {"query": f"How tall is the Burj Khalifa in Dubai? ({i})", "use_cache": False},
+                     '"type":"stream"'),
+}
+ERROR_MARKER = "event: error"
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def start_process(args: List[str], cwd: str, env: Dict[str, str], quiet: bool = True) -> subprocess.Popen:
+    output = subprocess.DEVNULL if quiet else None
+    return subprocess.Popen([sys.executable, *args], cwd=cwd, env={**os.environ, "PYTHONPATH": ROOT, **env},
+                            stdout=output, stderr=output)
+
+
+async def wait_ready(url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(f"{url}/docs")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not start; rerun with --verbose to see its output")
+
+
+def process_tree(pid: int) -> List[int]:
+    """``pid`` and its direct children, e.g. a server and its workers (Linux only)."""
+    pids = [pid]
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return pids
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            pids.append(int(entry))
+    return pids
+
+
+def total(values: List[Optional[float]]) -> Optional[float]:
+    known = [v for v in values if v is not None]
+    return sum(known) if known else None
+
+
+def cpu_seconds(pid: int) -> Optional[float]:
+    """User plus system CPU time of a process (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+async def sample_rss(pids: List[int], peak: Dict[str, float], interval: float = 0.05) -> None:
+    while True:
+        rss = total([rss_mb(pid) for pid in pids])
+        if rss is not None:
+            peak["rss"] = max(peak.get("rss", 0.0), rss)
+        await asyncio.sleep(interval)
+
+
+async def one_request(client: httpx.AsyncClient, scenario: str, i: int, key: str) -> Dict[str, Any]:
+    _, path, body, marker = SCENARIOS[scenario]
+    record: Dict[str, Any] = {"ttfb": None, "ttft": None, "total": None, "error": None}
+    start = time.perf_counter()
+    seen = ""
+    try:
+        async with client.stream("POST", path, json=body(i), headers={"X-API-Key": key}) as response:
+            async for chunk in response.aiter_text():
+                now = time.perf_counter() - start
+                if record["ttfb"] is None:
+                    record["ttfb"] = now
+                if marker is not None and record["ttft"] is None:
+                    # Keep a short tail so a marker split across chunks is still found
+                    seen = (seen + chunk)[-4096:]
+                    if marker in seen:
+                        record["ttft"] = now
+                if ERROR_MARKER in chunk:
+                    record["error"] = "error event"
+            if response.status_code != 200:
+                record["error"] = f"HTTP {response.status_code}"
+    except httpx.HTTPError as e:
+        record["error"] = type(e).__name__
+    record["total"] = time.perf_counter() - start
+    return record
+
+
+async def run_level(url: str, pid: int, scenario: str, concurrency: int, requests: int, offset: int,
+                    timeout: float, report: bool = True) -> Dict[str, Any]:
+    trackers = {name: LatencyTracker(window=requests) for name in ("ttfb", "ttft", "total")}
+    errors: Dict[str, int] = {}
+    queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(offset + i)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        async def user(n: int) -> None:
+            while not queue.empty():
+                record = await one_request(client, scenario, queue.get_nowait(), f"bench-user-{n}")
+                if record["error"]:
+                    errors[record["error"]] = errors.get(record["error"], 0) + 1
+                    continue
+                for name, tracker in trackers.items():
+                    if record[name] is not None:
+                        tracker.observe(record[name])
+
+        pids = process_tree(pid)
+        peak: Dict[str, float] = {}
+        sampler = asyncio.ensure_future(sample_rss(pids, peak))
+        cpu_before = total([cpu_seconds(p) for p in pids])
+        start = time.perf_counter()
+        await asyncio.gather(*[user(n) for n in range(concurrency)])
+        elapsed = time.perf_counter() - start
+        cpu_after = total([cpu_seconds(p) for p in pids])
+        sampler.cancel()
+
+    cpu = None if cpu_before is None or cpu_after is None else cpu_after - cpu_before
+    result = {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": sum(errors.values()),
+        "error_kinds": errors,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round((requests - sum(errors.values())) / elapsed, 2),
+        "ttfb": trackers["ttfb"].stats(),
+        "ttft": trackers["ttft"].stats() if SCENARIOS[scenario][3] else None,
+        "total": trackers["total"].stats(),
+        "cpu_s": None if cpu is None else round(cpu, 2),
+        "cpu_percent": None if cpu is None else round(100 * cpu / elapsed, 1),
+        "rss_peak_mb": round(peak["rss"], 1) if "rss" in peak else None,
+    }
+    if report:
+        print(format_row(result))
+    return result
+
+
+def format_row(result: Dict[str, Any]) -> str:
+    ttft = result["ttft"]["p50_ms"] if result["ttft"] else float("nan")
+    cpu = result["cpu_percent"] if result["cpu_percent"] is not None else float("nan")
+    rss = result["rss_peak_mb"] if result["rss_peak_mb"] is not None else float("nan")
+    return (f"{result['scenario']:<13} c={result['concurrency']:<4} {result['rps']:>8.1f} rps  "
+            f"ttfb p50 {result['ttfb']['p50_ms']:>7.1f}  ttft p50 {ttft:>7.1f}  "
+            f"total p50 {result['total']['p50_ms']:>7.1f} p95 {result['total']['p95_ms']:>7.1f} "
+            f"p99 {result['total']['p99_ms']:>7.1f} ms  cpu {cpu:>5.1f}%  rss {rss:>6.1f} MB  "
+            f"errors {result['errors']}")
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str) -> None:
+    """Print the relative change of the headline numbers against an earlier run."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["scenario"], r["concurrency"]): r for r in json.load(f)["results"]}
+    print(f"\nChange against {baseline_path} (negative latency and positive rps are better)")
+    metrics = (("rps", lambda r: r["rps"]), ("ttft p50", lambda r: r["ttft"] and r["ttft"]["p50_ms"]),
+               ("total p50", lambda r: r["total"]["p50_ms"]), ("total p99", lambda r: r["total"]["p99_ms"]),
+               ("rss", lambda r: r["rss_peak_mb"]))
+    for result in results:
+        before = baseline.get((result["scenario"], result["concurrency"]))
+        if before is None:
+            continue
+        changes = []
+        for name, value in metrics:
+            old, new = value(before), value(result)
+            if old and new is not None:
+                changes.append(f"{name} {100 * (new - old) / old:+6.1f}%")
+        print(f"{result['scenario']:<13} c={result['concurrency']:<4} " + "  ".join(changes))
+
+
+def git_revision() -> Optional[str]:
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                  text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return revision + ("-dirty" if dirty else "")
+
+
+async def main(args) -> None:
+    openai_port, tavily_port = free_port(), free_port()
+    stubs = [
+        start_process(["-m", "common.stubs.openai", "--port", str(openai_port),
+                       "--token-delay", str(1 / args.tokens_per_second if args.tokens_per_second else 0),
+                       "--first-token-delay", str(args.first_token_delay), "--tokens", str(args.tokens),
+                       "--prefill-delay", str(args.prefill_delay)],
+                      ROOT, {}, not args.verbose),
+        start_process(["-m", "common.stubs.tavily", "--port", str(tavily_port), "--latency", str(args.search_latency),
+                       "--content-chars", str(args.content_chars)], ROOT, {}, not args.verbose),
+    ]
+    env = {
+        "OPENAI_API_KEY": "bench",
+        "TAVILY_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+        "TAVILY_BASE_URL": f"http://127.0.0.1:{tavily_port}",
+        # The fan-out researcher searches without needing tool calls from the stub model
+        "RESEARCH_MODE": "fanout",
+        **dict(item.split("=", 1) for item in args.env),
+    }
+    apps = {}
+    results = []
+    try:
+        await wait_ready(f"http://127.0.0.1:{openai_port}")
+        await wait_ready(f"http://127.0.0.1:{tavily_port}")
+        for directory in dict.fromkeys(SCENARIOS[s][0] for s in args.scenarios):
+            port = free_port()
+            if args.workers:
+                process = start_process(["main.py"], os.path.join(ROOT, directory),
+                                        {**env, "HOST": "127.0.0.1", "PORT": str(port), "WORKERS": str(args.workers)},
+                                        not args.verbose)
+            else:
+                process = start_process(["-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+                                        os.path.join(ROOT, directory), env, not args.verbose)
+            apps[directory] = (process, f"http://127.0.0.1:{port}")
+        for process, url in apps.values():
+            await wait_ready(url)
+
+        offset = 0
+        for scenario in args.scenarios:
+            process, url = apps[SCENARIOS[scenario][0]]
+            if args.warmup:
+                await run_level(url, process.pid, scenario, 1, args.warmup, offset, args.timeout, report=False)
+                offset += args.warmup
+            for concurrency in args.concurrency:
+                results.append(await run_level(url, process.pid, scenario, concurrency, args.requests, offset,
+                                               args.timeout))
+                offset += args.requests
+    finally:
+        for process in [p for p, _ in apps.values()] + stubs:
+            process.terminate()
+            process.wait(timeout=10)
+
+    run = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "cpus": os.cpu_count(),
+        "config": vars(args),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(run, f, indent=2)
+        print(f"\nWrote {args.output}")
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=100, help="Requests per scenario and concurrency level")
+    parser.add_argument("--warmup", type=int, default=3, help="Sequential requests before each scenario, not reported")
+    parser.add_argument("--tokens", type=int, default=64, help="Tokens in each stub completion")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="Stub streaming rate; 0 = no delay")
+    parser.add_argument("--first-token-delay", type=float, default=0.1, help="Seconds before the stub's first token")
+    parser.add_argument("--prefill-delay", type=float, default=0.0,
+                        help="Stub seconds per 1000 prompt tokens not in its simulated prefix cache")
+    parser.add_argument("--search-latency", type=float, default=0.05, help="Seconds per stub search")
+    parser.add_argument("--content-chars", type=int, default=600, help="Size of each stub search result's content")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Run each app with this many worker processes (production mode); 0 = plain uvicorn")
+    parser.add_argument("--env", nargs="*", default=[], metavar="KEY=VALUE", help="Extra settings for both apps")
+    parser.add_argument("--output", help="Write the run as JSON")
+    parser.add_argument("--baseline", help="JSON of an earlier run to compare against")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the apps and stubs")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,98 @@
+"""
+Build time, query latency and incremental re-index time of the local document index.
+
+Generates a synthetic corpus of ``--files`` markdown files with ``--passages``
+passages each, indexes it, runs ``--queries`` random queries, then edits and
+deletes a few files and measures the refresh.
+
+    python bench/local_index.py --files 2000 --passages 50 --dense
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from common.index import IndexConfig, LocalIndex  # noqa: E402
+from common.metrics import LatencyTracker  # noqa: E402
+
+
+def make_vocabulary(size: int, rng: random.Random):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(3, 9))) for _ in range(size)]
+
+
+def write_corpus(directory: str, files: int, passages: int, vocabulary, rng: random.Random) -> None:
+    # Zipf-like word choice so common and rare terms both occur
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    for i in range(files):
+        words = rng.choices(vocabulary, weights, k=passages * 180)
+        with open(os.path.join(directory, f"doc{i:06d}.md"), "w", encoding="utf-8") as f:
+            f.write(f"# Document {i}\n\n" + " ".join(words))
+
+
+def main(args) -> None:
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(args.vocabulary, rng)
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        write_corpus(directory, args.files, args.passages, vocabulary, rng)
+        print(f"Wrote {args.files} files in {time.perf_counter() - start:.1f}s")
+
+        index = LocalIndex(IndexConfig(path=directory, dense=args.dense, refresh_interval=0))
+        start = time.perf_counter()
+        index.refresh()
+        build_s = time.perf_counter() - start
+        stats = index.stats()
+        print(f"Indexed {stats['passages']} passages in {build_s:.1f}s")
+
+        latency = LatencyTracker(window=args.queries)
+        for _ in range(args.queries):
+            query = " ".join(rng.choices(vocabulary[50:5000], k=rng.randint(2, 5)))
+            start = time.perf_counter()
+            index.search(query, 10)
+            latency.observe(time.perf_counter() - start)
+        query_stats = latency.stats()
+        print(f"Query latency: p50 {query_stats['p50_ms']} ms, p95 {query_stats['p95_ms']} ms, "
+              f"p99 {query_stats['p99_ms']} ms")
+
+        for i in range(args.changes):
+            with open(os.path.join(directory, f"doc{i:06d}.md"), "a", encoding="utf-8") as f:
+                f.write(" freshlyaddedterm")
+        for i in range(args.changes, 2 * args.changes):
+            os.remove(os.path.join(directory, f"doc{i:06d}.md"))
+        start = time.perf_counter()
+        changes = index.refresh()
+        refresh_s = time.perf_counter() - start
+        found = index.search("freshlyaddedterm", 10)
+        print(f"Refresh after {args.changes} edits and {args.changes} deletions: {refresh_s * 1000:.0f} ms, "
+              f"{changes}; new term found in {len(found)} files")
+
+        reopened = LocalIndex(IndexConfig(path=directory, dense=args.dense, refresh_interval=0))
+        start = time.perf_counter()
+        reopened.refresh()
+        print(f"Reopen and scan with no changes: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        result = {"files": args.files, "passages": stats["passages"], "dense": args.dense,
+                  "build_s": round(build_s, 2), "query": query_stats, "refresh_ms": round(refresh_s * 1000, 1)}
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--passages", type=int, default=20, help="Passages per file")
+    parser.add_argument("--vocabulary", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--changes", type=int, default=5)
+    parser.add_argument("--dense", action="store_true")
+    parser.add_argument("--seed", type=int, default=3)
+    parser.add_argument("--output", help="Write the results as JSON")
+    main(parser.parse_args())
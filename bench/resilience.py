@@ -0,0 +1,102 @@
+"""
+Tail latency and error rate of Tavily searches against a fault-injecting stub.
+
+Runs the same workload with plain calls and through ``ResilientCaller``
+(retries with jittered backoff, hedging, circuit breaker), then takes the
+stub down completely to show the breaker failing fast instead of waiting on
+every call.
+
+    python bench/resilience.py --requests 400 --failure-rate 0.05 --slow-rate 0.05
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from common.metrics import LatencyTracker  # noqa: E402
+from common.resilience import CircuitOpen, ResilienceConfig, ResilientCaller  # noqa: E402
+from common.stubs.server import BackgroundServer  # noqa: E402
+from common.stubs.tavily import create_app  # noqa: E402
+from common.tavily import tavily_search  # noqa: E402
+
+CONFIGS = {
+    "plain": ResilienceConfig(retry_attempts=1, hedge=False, breaker_failure_threshold=0),
+    "retry": ResilienceConfig(retry_attempts=3, retry_base_delay=0.05, hedge=False, breaker_failure_threshold=0),
+    "retry+hedge": ResilienceConfig(retry_attempts=3, retry_base_delay=0.05, hedge=True, hedge_delay=0.2,
+                                    breaker_failure_threshold=0),
+}
+
+
+async def run(name: str, caller: ResilientCaller, client: httpx.AsyncClient, url: str, requests: int,
+              concurrency: int) -> dict:
+    latency = LatencyTracker(window=requests)
+    errors = {"failed": 0, "short_circuited": 0}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await caller.call(lambda: tavily_search(client, "bench", f"query {i}", base_url=url))
+            except CircuitOpen:
+                errors["short_circuited"] += 1
+            except Exception:
+                errors["failed"] += 1
+            latency.observe(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(requests)])
+    elapsed = time.perf_counter() - start
+    stats = latency.stats()
+    result = {
+        "name": name,
+        "error_rate": round(sum(errors.values()) / requests, 4),
+        **errors,
+        "p50_ms": stats["p50_ms"], "p95_ms": stats["p95_ms"], "p99_ms": stats["p99_ms"],
+        "elapsed_s": round(elapsed, 2),
+        "attempts": caller.counts["attempts"], "retries": caller.counts["retries"],
+        "hedges": caller.counts["hedges"], "hedge_wins": caller.counts["hedge_wins"],
+    }
+    print(f"{name:<14} errors {result['error_rate']:>6.1%}  p50 {result['p50_ms']:>7.1f} ms  "
+          f"p95 {result['p95_ms']:>7.1f} ms  p99 {result['p99_ms']:>7.1f} ms  "
+          f"attempts {result['attempts']:>4}  hedges {result['hedges']:>3} (won {result['hedge_wins']})  "
+          f"short-circuited {errors['short_circuited']}")
+    return result
+
+
+async def main(args) -> None:
+    app = create_app(latency=args.latency, failure_rate=args.failure_rate, slow_rate=args.slow_rate,
+                     slow_latency=args.slow_latency, seed=args.seed)
+    with BackgroundServer(app) as server:
+        async with httpx.AsyncClient(timeout=args.timeout) as client:
+            for name, config in CONFIGS.items():
+                await run(name, ResilientCaller("tavily", config), client, server.url, args.requests,
+                          args.concurrency)
+
+            print(f"\nOutage: every call fails with {app.state.failure_status}")
+            app.state.failure_rate = 1.0
+            outage = ResilienceConfig(retry_attempts=3, retry_base_delay=0.05, breaker_failure_threshold=0)
+            await run("no breaker", ResilientCaller("tavily", outage), client, server.url, args.requests // 4,
+                      args.concurrency)
+            outage = ResilienceConfig(retry_attempts=3, retry_base_delay=0.05, breaker_failure_threshold=5)
+            await run("breaker", ResilientCaller("tavily", outage), client, server.url, args.requests // 4,
+                      args.concurrency)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--failure-rate", type=float, default=0.05)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-latency", type=float, default=1.0)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=7)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,80 @@
+"""
+Load test for DeepSearch's SearchEngine against a slow Tavily stub.
+
+Compares calling the blocking SDK inside the event loop with ``asearch``
+(pooled httpx) and with the bounded thread-pool fallback, and reports the
+wall time plus the worst event-loop stall seen by a heartbeat task.
+
+    python bench/search_concurrency.py --concurrency 20 --latency 0.5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "deepsearch")]
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("TAVILY_API_KEY", "bench")
+
+from common.stubs.server import BackgroundServer  # noqa: E402
+from common.stubs.tavily import create_app  # noqa: E402
+
+
+async def _heartbeat(stop: asyncio.Event, interval: float = 0.01) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+
+async def _measure(name: str, make_call, concurrency: int) -> None:
+    stop = asyncio.Event()
+    heartbeat = asyncio.create_task(_heartbeat(stop))
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await asyncio.gather(*[make_call(i) for i in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    stop.set()
+    stall = await heartbeat
+    print(f"{name:<14} wall={elapsed:6.2f}s  max_loop_stall={stall * 1000:8.1f}ms")
+
+
+async def main(concurrency: int, latency: float) -> None:
+    with BackgroundServer(create_app(latency=latency)) as stub:
+        os.environ["TAVILY_BASE_URL"] = stub.url
+
+        from app.config.settings import settings
+        from app.core import search_engine
+
+        settings.TAVILY_BASE_URL = stub.url
+        engine = search_engine.SearchEngine()
+        # Open the pool up front, as the app lifespan does
+        await engine.http_client.start()
+
+        async def blocking(i):
+            return engine.search(f"query {i}", 5, use_cache=False)
+
+        async def pooled(i):
+            return await engine.asearch(f"query {i}", 5, use_cache=False)
+
+        async def threaded(i):
+            return await search_engine.run_sync(engine.search, f"query {i}", 5, False)
+
+        print(f"concurrency={concurrency} stub_latency={latency}s "
+              f"sync_workers={settings.SEARCH_SYNC_WORKERS}")
+        await _measure("sync-in-loop", blocking, concurrency)
+        await _measure("thread-pool", threaded, concurrency)
+        await _measure("async-httpx", pooled, concurrency)
+        await engine.http_client.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrency, args.latency))
@@ -0,0 +1,155 @@
+"""
+Startup time of the deepsearch app: import, liveness, readiness and the first requests.
+
+For each configuration (``--configs``) the app is started ``--repeats`` times
+as a fresh uvicorn process against stub OpenAI and Tavily servers. Reported
+per configuration, as medians over the repeats:
+
+    import      seconds to ``import main`` in a fresh interpreter
+    health      process start to the first 200 from ``/api/health``
+    ready       process start to the first 200 from ``/api/ready``
+    first       latency of the first ``/api/query`` (sent once live, not waiting for ready)
+    second      latency of the next ``/api/query``, for comparison
+
+Configurations:
+
+    eager       LAZY_INIT=false: everything built at import, warm-up only connects the pools
+    lazy        LAZY_INIT=true: the warm-up imports and builds the workflow in the background
+    lazy-cold   LAZY_INIT=true, WARM_UP=false: nothing happens until the first request
+    primed      LAZY_INIT=true plus WARM_UP_QUERY: a priming query runs before ready
+
+``--wait-ready`` sends the first query only after ``/api/ready`` answers 200,
+which is what a load balancer honouring the readiness probe does.
+
+    python bench/startup.py --repeats 5 --configs eager lazy lazy-cold
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common.stubs.server import free_port  # noqa: E402
+from e2e import start_process, wait_ready  # noqa: E402
+
+APP_DIR = os.path.join(ROOT, "deepsearch")
+CONFIGS = {
+    "eager": {"LAZY_INIT": "false"},
+    "lazy": {"LAZY_INIT": "true"},
+    "lazy-cold": {"LAZY_INIT": "true", "WARM_UP": "false"},
+    "primed": {"LAZY_INIT": "true", "WARM_UP_QUERY": "What is the tallest building in the world?"},
+}
+COLUMNS = ("import", "health", "ready", "first", "second")
+
+
+def import_seconds(env: Dict[str, str]) -> float:
+    """Time ``import main`` in a fresh interpreter, measured inside it."""
+    code = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=APP_DIR, env={**os.environ, "PYTHONPATH": ROOT, **env},
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+async def poll(client: httpx.AsyncClient, url: str, started: float, timeout: float) -> float:
+    """Seconds from ``started`` until ``url`` answers 200."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(url)).status_code == 200:
+                return time.monotonic() - started
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.02)
+    raise RuntimeError(f"{url} did not answer 200 within {timeout}s; rerun with --verbose to see the app's output")
+
+
+async def query(client: httpx.AsyncClient, url: str, i: int) -> float:
+    start = time.monotonic()
+    response = await client.post(f"{url}/api/query", json={"query": f"How tall is the Burj Khalifa? ({i})",
+                                                            "use_cache": False})
+    response.raise_for_status()
+    return time.monotonic() - start
+
+
+async def start_once(env: Dict[str, str], args) -> Dict[str, float]:
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    started = time.monotonic()
+    process = start_process(["-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+                            APP_DIR, env, not args.verbose)
+    try:
+        async with httpx.AsyncClient(timeout=args.timeout) as client:
+            row = {"health": await poll(client, f"{url}/api/health", started, args.timeout)}
+            if args.wait_ready:
+                row["ready"] = await poll(client, f"{url}/api/ready", started, args.timeout)
+                row["first"] = await query(client, url, 0)
+            else:
+                # Send the first query while the warm-up may still be running
+                first = asyncio.ensure_future(query(client, url, 0))
+                row["ready"] = await poll(client, f"{url}/api/ready", started, args.timeout)
+                row["first"] = await first
+            row["second"] = await query(client, url, 1)
+            return row
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def median(rows: List[Dict[str, float]], column: str) -> Optional[float]:
+    values = [row[column] for row in rows if column in row]
+    return statistics.median(values) if values else None
+
+
+async def main(args) -> None:
+    openai_port, tavily_port = free_port(), free_port()
+    stubs = [
+        start_process(["-m", "common.stubs.openai", "--port", str(openai_port), "--token-delay", "0",
+                       "--first-token-delay", str(args.first_token_delay)], ROOT, {}, not args.verbose),
+        start_process(["-m", "common.stubs.tavily", "--port", str(tavily_port), "--latency", "0.05"],
+                      ROOT, {}, not args.verbose),
+    ]
+    base_env = {
+        "OPENAI_API_KEY": "bench",
+        "TAVILY_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+        "TAVILY_BASE_URL": f"http://127.0.0.1:{tavily_port}",
+        "RESEARCH_MODE": "fanout",
+        **dict(item.split("=", 1) for item in args.env),
+    }
+    try:
+        await wait_ready(f"http://127.0.0.1:{openai_port}")
+        await wait_ready(f"http://127.0.0.1:{tavily_port}")
+        print(f"{'config':<10} " + " ".join(f"{c + ' (s)':>11}" for c in COLUMNS))
+        for name in args.configs:
+            env = {**base_env, **CONFIGS[name]}
+            rows = []
+            for _ in range(args.repeats):
+                row = await start_once(env, args)
+                row["import"] = import_seconds(env)
+                rows.append(row)
+            print(f"{name:<10} " + " ".join(f"{median(rows, c):>11.3f}" for c in COLUMNS))
+    finally:
+        for process in stubs:
+            process.terminate()
+            process.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--configs", nargs="+", default=list(CONFIGS), choices=list(CONFIGS))
+    parser.add_argument("--repeats", type=int, default=3, help="Fresh starts per configuration")
+    parser.add_argument("--wait-ready", action="store_true", help="Send the first query only once /api/ready is 200")
+    parser.add_argument("--first-token-delay", type=float, default=0.05, help="Seconds before the stub's first token")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--env", nargs="*", default=[], metavar="KEY=VALUE", help="Extra settings for the app")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the app and stubs")
+    asyncio.run(main(parser.parse_args()))
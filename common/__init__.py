@@ -0,0 +1,6 @@
+"""
+Infrastructure shared by the AISearch and DeepSearch backends.
+
+Both apps put the repository root on ``sys.path`` at startup so that
+``import common`` works without installing anything.
+"""
@@ -0,0 +1,331 @@
+import asyncio
+import hashlib
+import logging
+import math
+import threading
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from common.metrics import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+# Identity of the client the current request belongs to; per-key limits use it
+client_key: ContextVar[str] = ContextVar("client_key", default="anonymous")
+
+
+class Overloaded(Exception):
+    """Raised when work cannot be admitted in time; ``retry_after`` is in seconds."""
+
+    def __init__(self, resource: str, reason: str, retry_after: float):
+        super().__init__(f"{resource} overloaded ({reason}), retry after {retry_after:.0f}s")
+        self.resource = resource
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter: ``rate`` tokens per second, up to ``burst`` saved.
+    Thread-safe, so it can also guard blocking SDK calls. A rate of 0 disables it.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.throttled = 0
+        self.wait = LatencyTracker()
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """Take ``tokens`` now, going into debt if needed; returns how long to wait before using them."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if delay:
+            self.throttled += 1
+        self.wait.observe(delay)
+        return delay
+
+    def refund(self, tokens: float = 1.0) -> None:
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + tokens)
+
+    def reserve_within(self, tokens: float = 1.0, timeout: Optional[float] = None, name: str = "rate") -> float:
+        """``reserve``, but refund and raise ``Overloaded`` when the wait would exceed ``timeout``."""
+        delay = self.reserve(tokens)
+        if timeout is not None and delay > timeout:
+            self.refund(tokens)
+            raise Overloaded(name, "rate_limited", delay)
+        return delay
+
+    async def acquire(self, tokens: float = 1.0, timeout: Optional[float] = None, name: str = "rate") -> None:
+        delay = self.reserve_within(tokens, timeout, name)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def acquire_sync(self, tokens: float = 1.0, timeout: Optional[float] = None, name: str = "rate") -> None:
+        """``acquire`` for blocking callers: sleeps the calling thread instead of the event loop."""
+        delay = self.reserve_within(tokens, timeout, name)
+        if delay:
+            time.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"rate": self.rate, "burst": self.burst, "throttled": self.throttled, "wait": self.wait.stats()}
+
+
+class Limiter:
+    """
+    Concurrency limit with a bounded, deadline-aware wait queue.
+
+    A caller that would have to wait is rejected right away when the queue is
+    full, or when the expected wait (queue position times the average time a
+    slot is held) exceeds ``max_wait``; otherwise it waits at most ``max_wait``.
+
+    Args:
+        name: Label used in errors and stats
+        max_concurrent: Slots; 0 means unlimited
+        max_queue: Callers allowed to wait for a slot
+        max_wait: Longest a caller may wait, in seconds
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int = 100, max_wait: float = 10.0):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._semaphore = asyncio.Semaphore(max_concurrent) if max_concurrent > 0 else None
+        self.in_flight = 0
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "deadline": 0, "timeout": 0}
+        self.wait = LatencyTracker()
+        self._hold_ewma = 1.0  # Average seconds a slot is held
+
+    def _retry_after(self, position: int) -> float:
+        slots = max(self.max_concurrent, 1)
+        return max(1.0, math.ceil(position / slots * self._hold_ewma))
+
+    async def acquire(self) -> float:
+        """Wait for a slot; returns the time it was acquired. Raises ``Overloaded``."""
+        if self._semaphore is None:
+            self.in_flight += 1
+            self.admitted += 1
+            return time.monotonic()
+        if self._semaphore.locked() or self.waiting:
+            position = self.waiting + 1
+            if self.waiting >= self.max_queue:
+                self.rejected["queue_full"] += 1
+                raise Overloaded(self.name, "queue_full", self._retry_after(position))
+            if position / self.max_concurrent * self._hold_ewma > self.max_wait:
+                self.rejected["deadline"] += 1
+                raise Overloaded(self.name, "deadline", self._retry_after(position))
+        start = time.monotonic()
+        self.waiting += 1
+        self.peak_waiting = max(self.peak_waiting, self.waiting)
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self.rejected["timeout"] += 1
+            raise Overloaded(self.name, "timeout", self._retry_after(self.waiting)) from None
+        finally:
+            self.waiting -= 1
+        acquired = time.monotonic()
+        self.wait.observe(acquired - start)
+        self.in_flight += 1
+        self.admitted += 1
+        return acquired
+
+    def release(self, acquired: float) -> None:
+        self.in_flight -= 1
+        self._hold_ewma = 0.9 * self._hold_ewma + 0.1 * (time.monotonic() - acquired)
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+    @property
+    def idle(self) -> bool:
+        return not self.in_flight and not self.waiting
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.max_concurrent,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "peak_queue_depth": self.peak_waiting,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "wait": self.wait.stats(),
+        }
+
+
+@dataclass
+class AdmissionConfig:
+    # resource -> (global concurrency, per-key concurrency); 0 means unlimited
+    limits: Dict[str, Tuple[int, int]] = field(default_factory=dict)
+    max_queue: int = 100
+    max_wait: float = 10.0
+    # provider -> (requests per second, burst); 0 disables the bucket
+    rates: Dict[str, Tuple[float, float]] = field(default_factory=dict)
+    max_tracked_keys: int = 1024
+
+
+class Permit:
+    """A held slot; ``release`` is idempotent so it can be called from several cleanup paths."""
+
+    def __init__(self, holds):
+        self._holds = holds
+
+    def release(self) -> None:
+        holds, self._holds = self._holds, []
+        for limiter, acquired in reversed(holds):
+            limiter.release(acquired)
+
+
+class AdmissionController:
+    """
+    Admission control for requests and for the upstream calls they make.
+
+    Each resource (e.g. "request", "search", "llm") has a global limiter and
+    one limiter per client key; each upstream provider has a token bucket.
+    """
+
+    def __init__(self, config: AdmissionConfig):
+        self.config = config
+        self._global = {
+            resource: Limiter(resource, limit, config.max_queue, config.max_wait)
+            for resource, (limit, _) in config.limits.items()
+        }
+        self._per_key: Dict[str, Dict[str, Limiter]] = {resource: {} for resource in config.limits}
+        self.buckets = {
+            provider: TokenBucket(rate, burst) for provider, (rate, burst) in config.rates.items()
+        }
+
+    def _key_limiter(self, resource: str, key: str) -> Optional[Limiter]:
+        limit = self.config.limits[resource][1]
+        if limit <= 0:
+            return None
+        limiters = self._per_key[resource]
+        limiter = limiters.get(key)
+        if limiter is None:
+            if len(limiters) >= self.config.max_tracked_keys:
+                for idle_key in [k for k, v in limiters.items() if v.idle]:
+                    del limiters[idle_key]
+            # Per-key waits are short: a client over its share should back off
+            limiter = limiters[key] = Limiter(f"{resource}:{key}", limit, limit, self.config.max_wait)
+        return limiter
+
+    async def acquire(self, resource: str, key: Optional[str] = None) -> Permit:
+        """Take a per-key then a global slot for ``resource``. Raises ``Overloaded``."""
+        if resource not in self._global:
+            return Permit([])
+        key = key or client_key.get()
+        holds = []
+        permit = Permit(holds)
+        try:
+            for limiter in (self._key_limiter(resource, key), self._global[resource]):
+                if limiter is not None:
+                    holds.append((limiter, await limiter.acquire()))
+        except BaseException:
+            permit.release()
+            raise
+        return permit
+
+    @asynccontextmanager
+    async def slot(self, resource: str, key: Optional[str] = None):
+        permit = await self.acquire(resource, key)
+        try:
+            yield permit
+        finally:
+            permit.release()
+
+    async def throttle(self, provider: str, tokens: float = 1.0) -> None:
+        """Wait for the provider's token bucket; rejects when the wait would exceed ``max_wait``."""
+        bucket = self.buckets.get(provider)
+        if bucket is not None:
+            await bucket.acquire(tokens, timeout=self.config.max_wait, name=provider)
+
+    def throttle_sync(self, provider: str, tokens: float = 1.0) -> None:
+        """Blocking ``throttle`` for attempts made on a worker thread."""
+        bucket = self.buckets.get(provider)
+        if bucket is not None:
+            bucket.acquire_sync(tokens, timeout=self.config.max_wait, name=provider)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limits": {
+                resource: {
+                    **limiter.stats(),
+                    "keys": {key: {"in_flight": l.in_flight, "queue_depth": l.waiting, "rejected": sum(l.rejected.values())}
+                             for key, l in self._per_key[resource].items() if not l.idle},
+                }
+                for resource, limiter in self._global.items()
+            },
+            "rate_limits": {provider: bucket.stats() for provider, bucket in self.buckets.items()},
+        }
+
+
+def request_client_key(headers, client_host: Optional[str]) -> str:
+    """Identify the caller: its API key when it sends one, otherwise its address."""
+    api_key = headers.get("x-api-key")
+    if not api_key:
+        authorization = headers.get("authorization", "")
+        if authorization.lower().startswith("bearer "):
+            api_key = authorization[7:].strip()
+    if api_key:
+        # Don't keep raw credentials in memory or stats
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+    return f"ip:{client_host or 'unknown'}"
+
+
+async def stream_until_disconnect(request, source: AsyncIterator[Any], poll_interval: float = 0.5,
+                                  permit: Optional[Permit] = None) -> AsyncIterator[Any]:
+    """
+    Relay ``source`` until it ends or the client goes away.
+
+    ``request.is_disconnected()`` is polled while waiting for the next item;
+    on disconnect the pending step is cancelled and ``source`` is closed at
+    once, which cancels the upstream calls it was awaiting. ``permit`` is
+    released when the stream ends either way.
+    """
+    iterator = source.__aiter__()
+    next_item = None
+
+    async def disconnected():
+        while not await request.is_disconnected():
+            await asyncio.sleep(poll_interval)
+
+    watcher = asyncio.ensure_future(disconnected())
+    try:
+        while True:
+            next_item = asyncio.ensure_future(iterator.__anext__())
+            await asyncio.wait({next_item, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_item.done():
+                logger.info("Client disconnected; cancelling upstream work")
+                break
+            try:
+                item = next_item.result()
+            except StopAsyncIteration:
+                break
+            next_item = None
+            yield item
+    finally:
+        watcher.cancel()
+        if next_item is not None and not next_item.done():
+            next_item.cancel()
+            await asyncio.gather(next_item, return_exceptions=True)
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+        if permit is not None:
+            permit.release()
@@ -0,0 +1,59 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Sequence
+
+_WORD_RE = re.compile(r"[^\W_]+", re.UNICODE)
+_CJK_RE = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lower-cased word tokens; CJK runs are split into overlapping character
+    bigrams since they have no spaces between words.
+    """
+    tokens: List[str] = []
+    for word in _WORD_RE.findall((text or "").casefold()):
+        if _CJK_RE.search(word):
+            if len(word) == 1:
+                tokens.append(word)
+            else:
+                tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word)
+    return tokens
+
+
+class BM25:
+    """
+    Okapi BM25 over a small in-memory corpus, e.g. the passages of one search.
+
+    Args:
+        documents: Pre-tokenized documents
+        k1: Term-frequency saturation
+        b: Length normalization
+    """
+
+    def __init__(self, documents: Sequence[Sequence[str]], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_freqs: List[Counter] = [Counter(doc) for doc in documents]
+        self.lengths = [len(doc) for doc in documents]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        doc_freqs: Dict[str, int] = Counter()
+        for freqs in self.term_freqs:
+            doc_freqs.update(freqs.keys())
+        n = len(documents)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freqs.items()}
+
+    def score(self, query: Sequence[str]) -> List[float]:
+        scores = []
+        for freqs, length in zip(self.term_freqs, self.lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / self.avg_length) if self.avg_length else self.k1
+            total = 0.0
+            for term in set(query):
+                tf = freqs.get(term)
+                if tf:
+                    total += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            scores.append(total)
+        return scores
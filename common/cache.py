@@ -0,0 +1,378 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FRESH = "fresh"
+STALE = "stale"
+
+
+def normalize_query(query: str) -> str:
+    """Fold case, Unicode width and whitespace so trivially different queries share an entry."""
+    return " ".join(unicodedata.normalize("NFKC", query or "").casefold().split())
+
+
+def cache_key(query: str, depth: str, max_results: int, provider: str) -> str:
+    return json.dumps([provider, depth, int(max_results), normalize_query(query)], ensure_ascii=False)
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    stale_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    bypasses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    refreshes: int = 0
+    refresh_errors: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return dict(self.__dict__)
+
+
+@dataclass
+class _Entry:
+    value: Any
+    expires_at: float
+    stale_until: float
+
+
+class LRUCache:
+    """
+    Size-bounded in-memory LRU with per-entry TTL.
+
+    An entry is fresh until ``expires_at`` and may still be served as stale
+    until ``stale_until``; after that it is dropped.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = CacheStats()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str, now: Optional[float] = None) -> Optional[Tuple[Any, str]]:
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if now >= entry.stale_until:
+                del self._entries[key]
+                self.stats.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return entry.value, FRESH if now < entry.expires_at else STALE
+
+    def set(self, key: str, value: Any, expires_at: float, stale_until: float) -> None:
+        with self._lock:
+            self._entries[key] = _Entry(value, expires_at, stale_until)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCache:
+    """
+    On-disk tier that survives restarts. Values must be JSON-serialisable.
+
+    Several processes may share one file. Each process opens its own
+    connection on first use, so an instance created before ``fork()`` is safe
+    to use in the workers.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100_000):
+        self.path = path
+        self.max_entries = max_entries
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._writes = 0
+        self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        # SQLite connections must not cross fork(); a forked worker opens its own
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._pid = os.getpid()
+            self._create(self._conn)
+        return self._conn
+
+    def _create(self, conn: sqlite3.Connection) -> None:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, stale_until REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed_at)")
+
+    def get(self, key: str, now: Optional[float] = None) -> Optional[Tuple[Any, float, float]]:
+        now = time.time() if now is None else now
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value, expires_at, stale_until FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now >= row[2]:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0]), row[1], row[2]
+
+    def set(self, key: str, value: Any, expires_at: float, stale_until: float) -> None:
+        data = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, stale_until, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, data, expires_at, stale_until, time.time()),
+            )
+            self._writes += 1
+            # Trim occasionally rather than on every write
+            if self._writes % 256 == 0:
+                self._trim()
+
+    def _trim(self) -> None:
+        conn = self._connect()
+        conn.execute("DELETE FROM cache WHERE stale_until <= ?", (time.time(),))
+        conn.execute(
+            "DELETE FROM cache WHERE key IN ("
+            "SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._connect().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connect().execute("DELETE FROM cache")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+@dataclass
+class SearchCacheConfig:
+    max_entries: int = 1024
+    ttl: float = 600.0
+    stale_ttl: float = 3600.0  # Extra time a stale entry may be served while it is refreshed
+    disk_path: Optional[str] = None
+    disk_max_entries: int = 100_000
+
+
+class SearchCache:
+    """
+    Two-tier search-result cache with stale-while-revalidate.
+
+    Use ``get_or_fetch`` from async code and ``get_or_fetch_sync`` from
+    blocking code; both take ``use_cache`` so callers can bypass per request.
+    The async path reads and writes the disk or shared tier on a thread, so a
+    slow SQLite file or Redis server never stalls the event loop.
+
+    ``store`` replaces the SQLite tier with a store shared by several worker
+    processes (see ``common.shared``), so a result fetched by one worker is a
+    hit in the others.
+    """
+
+    def __init__(self, config: Optional[SearchCacheConfig] = None, store: Any = None):
+        self.config = config or SearchCacheConfig()
+        self.memory = LRUCache(self.config.max_entries)
+        self.shared = store is not None
+        if store is not None:
+            self.disk = store
+        else:
+            self.disk = SQLiteCache(self.config.disk_path, self.config.disk_max_entries) if self.config.disk_path else None
+        self.stats = self.memory.stats
+        self._refreshing: Dict[str, Any] = {}
+        self._refresh_lock = threading.Lock()
+        self._refresh_executor: Optional[ThreadPoolExecutor] = None
+
+    def get(self, key: str) -> Optional[Tuple[Any, str]]:
+        now = time.time()
+        found = self.memory.get(key, now)
+        if found is None and self.disk is not None:
+            found = self._promote(key, self._read_disk(key, now), now)
+        return self._count(found)
+
+    async def aget(self, key: str) -> Optional[Tuple[Any, str]]:
+        """``get`` for async code: a memory miss reads the disk or shared-store tier on a thread."""
+        now = time.time()
+        found = self.memory.get(key, now)
+        if found is None and self.disk is not None:
+            found = self._promote(key, await asyncio.to_thread(self._read_disk, key, now), now)
+        return self._count(found)
+
+    def _read_disk(self, key: str, now: float) -> Optional[Tuple[Any, float, float]]:
+        try:
+            return self.disk.get(key, now)
+        except Exception as e:
+            # An unreachable shared store degrades to a miss rather than failing the search
+            logger.warning("Could not read cache entry: %s", e)
+            return None
+
+    def _promote(self, key: str, row: Optional[Tuple[Any, float, float]], now: float) -> Optional[Tuple[Any, str]]:
+        if row is None:
+            return None
+        value, expires_at, stale_until = row
+        self.memory.set(key, value, expires_at, stale_until)
+        self.stats.disk_hits += 1
+        return value, FRESH if now < expires_at else STALE
+
+    def _count(self, found: Optional[Tuple[Any, str]]) -> Optional[Tuple[Any, str]]:
+        if found is None:
+            self.stats.misses += 1
+        elif found[1] == FRESH:
+            self.stats.hits += 1
+        else:
+            self.stats.stale_hits += 1
+        return found
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at, stale_until = self._remember(key, value, ttl)
+        if self.disk is not None:
+            self._write_disk(key, value, expires_at, stale_until)
+
+    async def aset(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """``set`` for async code: the disk or shared-store tier is written on a thread."""
+        expires_at, stale_until = self._remember(key, value, ttl)
+        if self.disk is not None:
+            await asyncio.to_thread(self._write_disk, key, value, expires_at, stale_until)
+
+    def _remember(self, key: str, value: Any, ttl: Optional[float]) -> Tuple[float, float]:
+        expires_at = time.time() + (self.config.ttl if ttl is None else ttl)
+        stale_until = expires_at + self.config.stale_ttl
+        self.memory.set(key, value, expires_at, stale_until)
+        return expires_at, stale_until
+
+    def _write_disk(self, key: str, value: Any, expires_at: float, stale_until: float) -> None:
+        try:
+            self.disk.set(key, value, expires_at, stale_until)
+        except Exception as e:
+            logger.warning("Could not persist cache entry: %s", e)
+
+    def invalidate(self, key: str) -> None:
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def _claim_refresh(self, key: str) -> bool:
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing[key] = True
+            return True
+
+    def _release_refresh(self, key: str) -> None:
+        with self._refresh_lock:
+            self._refreshing.pop(key, None)
+
+    async def _refresh(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> None:
+        try:
+            await self.aset(key, await fetch())
+            self.stats.refreshes += 1
+        except Exception as e:
+            self.stats.refresh_errors += 1
+            logger.warning("Background cache refresh failed: %s", e)
+        finally:
+            self._release_refresh(key)
+
+    def _refresh_sync(self, key: str, fetch: Callable[[], Any]) -> None:
+        try:
+            self.set(key, fetch())
+            self.stats.refreshes += 1
+        except Exception as e:
+            self.stats.refresh_errors += 1
+            logger.warning("Background cache refresh failed: %s", e)
+        finally:
+            self._release_refresh(key)
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable[Any]], use_cache: bool = True) -> Any:
+        """
+        Return a cached value or await ``fetch()`` and store it.
+
+        A stale hit is returned immediately while ``fetch`` runs in the background.
+        """
+        if not use_cache:
+            self.stats.bypasses += 1
+            return await fetch()
+        found = await self.aget(key)
+        if found is not None:
+            value, state = found
+            if state == STALE and self._claim_refresh(key):
+                task = asyncio.create_task(self._refresh(key, fetch))
+                self._refreshing[key] = task  # keep a reference until it finishes
+            return value
+        value = await fetch()
+        await self.aset(key, value)
+        return value
+
+    def get_or_fetch_sync(self, key: str, fetch: Callable[[], Any], use_cache: bool = True) -> Any:
+        """Blocking counterpart of ``get_or_fetch``; stale refreshes run on a helper thread."""
+        if not use_cache:
+            self.stats.bypasses += 1
+            return fetch()
+        found = self.get(key)
+        if found is not None:
+            value, state = found
+            if state == STALE and self._claim_refresh(key):
+                if self._refresh_executor is None:
+                    self._refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-refresh")
+                self._refresh_executor.submit(self._refresh_sync, key, fetch)
+            return value
+        value = fetch()
+        self.set(key, value)
+        return value
+
+    def stats_dict(self) -> Dict[str, Any]:
+        data = self.stats.as_dict()
+        data.update(size=len(self.memory), max_entries=self.config.max_entries,
+                    disk=self.config.disk_path, shared=self.shared, refreshing=len(self._refreshing))
+        lookups = data["hits"] + data["stale_hits"] + data["misses"]
+        data["hit_ratio"] = round((data["hits"] + data["stale_hits"]) / lookups, 4) if lookups else 0.0
+        return data
+
+    def close(self) -> None:
+        if self._refresh_executor is not None:
+            self._refresh_executor.shutdown(wait=False)
+        if self.disk is not None:
+            self.disk.close()
@@ -0,0 +1,179 @@
+import hashlib
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from common.bm25 import BM25, tokenize
+
+_CJK_RE = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]")
+_SENTENCE_RE = re.compile(r"(?<=[.!?。！？])\s+|\n+")
+
+_MERSENNE = np.uint64((1 << 61) - 1)
+
+
+class TokenCounter:
+    """
+    Count prompt tokens locally.
+
+    Uses ``tiktoken`` when an encoding name is given and the package (and its
+    vocabulary file) is available; otherwise falls back to a fast estimate of
+    one token per CJK character and per ~4 other characters.
+    """
+
+    def __init__(self, encoding: Optional[str] = None):
+        self._encoding = None
+        if encoding:
+            try:
+                import tiktoken
+
+                self._encoding = tiktoken.get_encoding(encoding)
+            except Exception:
+                self._encoding = None
+
+    def __call__(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        cjk = len(_CJK_RE.findall(text))
+        return cjk + (len(text) - cjk + 3) // 4
+
+
+class MinHasher:
+    """MinHash signatures of word shingles, for spotting near-duplicate passages."""
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 3, seed: int = 7):
+        rng = np.random.default_rng(seed)
+        self.shingle_size = shingle_size
+        self._a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        tokens = tokenize(text)
+        n = self.shingle_size
+        shingles = {" ".join(tokens[i:i + n]) for i in range(max(len(tokens) - n + 1, 1))}
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingles),
+            dtype=np.uint64, count=len(shingles),
+        )
+        # (a * x + b) mod p for every permutation/shingle pair, then min per permutation
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) % _MERSENNE
+        return permuted.min(axis=1)
+
+    @staticmethod
+    def similarity(left: np.ndarray, right: np.ndarray) -> float:
+        return float(np.mean(left == right))
+
+
+@dataclass
+class Passage:
+    citation: int  # 1-based position of the source in the original result list
+    title: str
+    url: str
+    text: str
+    position: int  # Order of the passage within its source
+    tokens: int = 0
+    score: float = 0.0
+
+
+def split_passages(text: str, max_tokens: int, count_tokens: TokenCounter) -> List[str]:
+    """Split text on sentence boundaries into passages of at most ``max_tokens`` (approximately)."""
+    passages, current, current_tokens = [], [], 0
+    for sentence in filter(None, (s.strip() for s in _SENTENCE_RE.split(text or ""))):
+        tokens = count_tokens(sentence)
+        if current and current_tokens + tokens > max_tokens:
+            passages.append(" ".join(current))
+            current, current_tokens = [], 0
+        current.append(sentence)
+        current_tokens += tokens
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+
+@dataclass
+class ContextConfig:
+    token_budget: int = 6000
+    passage_tokens: int = 200
+    dedup_threshold: float = 0.8  # Estimated Jaccard similarity above which a passage is a duplicate
+    tokenizer: Optional[str] = None  # tiktoken encoding name; estimate when unset
+
+
+class ContextAssembler:
+    """
+    Turn search results into a prompt context that fits a token budget.
+
+    Steps: split each result into passages, drop near-duplicates (MinHash
+    over word shingles), rank the rest by BM25 relevance to the query, pack
+    the best passages until the budget is spent, and return them in source
+    order with their original citation numbers.
+    """
+
+    def __init__(self, config: Optional[ContextConfig] = None):
+        self.config = config or ContextConfig()
+        self.count_tokens = TokenCounter(self.config.tokenizer)
+        self.minhash = MinHasher()
+
+    def passages(self, results: Sequence[Dict[str, Any]]) -> List[Passage]:
+        passages = []
+        for citation, result in enumerate(results, start=1):
+            # Full page text (fetched pages, Tavily raw content) beats the search snippet
+            content = result.get("raw_content") or result.get("content") or result.get("snippet") or ""
+            for position, text in enumerate(split_passages(content, self.config.passage_tokens, self.count_tokens)):
+                passages.append(Passage(citation, result.get("title", ""), result.get("url", ""), text,
+                                        position, self.count_tokens(text)))
+        return passages
+
+    def dedupe(self, passages: List[Passage]) -> List[Passage]:
+        kept, signatures = [], []
+        for passage in passages:
+            signature = self.minhash.signature(passage.text)
+            if any(MinHasher.similarity(signature, other) >= self.config.dedup_threshold for other in signatures):
+                continue
+            kept.append(passage)
+            signatures.append(signature)
+        return kept
+
+    def assemble(self, query: str, results: Sequence[Dict[str, Any]],
+                 token_budget: Optional[int] = None, reserved_tokens: int = 0) -> List[Passage]:
+        """
+        Args:
+            query: The user question, used for relevance ranking
+            results: Search results in ``{title, url, content}`` shape, in citation order
+            token_budget: Override of ``ContextConfig.token_budget``
+            reserved_tokens: Tokens already spent elsewhere in the prompt
+
+        Returns:
+            Selected passages, ordered by citation then position
+        """
+        budget = (self.config.token_budget if token_budget is None else token_budget) - reserved_tokens
+        passages = self.dedupe(self.passages(results))
+        if not passages or budget <= 0:
+            return []
+
+        scores = BM25([tokenize(p.text) for p in passages]).score(tokenize(query))
+        for passage, score in zip(passages, scores):
+            passage.score = score
+
+        selected, used = [], 0
+        # Best first; ties keep the search engine's own ordering
+        for passage in sorted(passages, key=lambda p: (-p.score, p.citation, p.position)):
+            if used + passage.tokens > budget:
+                continue
+            selected.append(passage)
+            used += passage.tokens
+        return sorted(selected, key=lambda p: (p.citation, p.position))
+
+
+def format_passages(passages: Sequence[Passage]) -> str:
+    """Group passages under their source header, keeping the citation numbers."""
+    blocks, current = [], None
+    for passage in passages:
+        if passage.citation != current:
+            current = passage.citation
+            blocks.append(f"[{passage.citation}] {passage.title or passage.url} ({passage.url})\n{passage.text}")
+        else:
+            blocks[-1] += f"\n{passage.text}"
+    return "\n\n".join(blocks)
@@ -0,0 +1,286 @@
+import asyncio
+import codecs
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass
+from html.parser import HTMLParser
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from urllib.parse import urlsplit
+
+import httpx
+
+from common.metrics import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+_SPACE_RE = re.compile(r"[ \t\r\f\v]+")
+_CHARSET_RE = re.compile(r"charset=([\w.:-]+)", re.IGNORECASE)
+
+
+class TextExtractor(HTMLParser):
+    """
+    Streaming HTML-to-text: ``feed`` chunks as they arrive and read ``text``.
+
+    Keeps no DOM. Script, style and page chrome (nav, header, footer, aside,
+    forms) are skipped, block elements become line breaks, and parsing stops
+    contributing once ``max_chars`` of text have been collected.
+    """
+
+    SKIP = frozenset({"script", "style", "noscript", "template", "svg", "nav", "header", "footer", "aside",
+                      "form", "iframe", "button", "select"})
+    BLOCK = frozenset({"p", "div", "br", "li", "ul", "ol", "tr", "td", "th", "table", "section", "article",
+                       "main", "h1", "h2", "h3", "h4", "h5", "h6", "pre", "blockquote", "dd", "dt", "hr"})
+
+    def __init__(self, max_chars: int = 20000):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.title = ""
+        self._parts: List[str] = []
+        self._chars = 0
+        self._skip = 0
+        self._in_title = False
+
+    @property
+    def full(self) -> bool:
+        return self._chars >= self.max_chars
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skip += 1
+        elif tag == "title":
+            self._in_title = True
+        elif tag in self.BLOCK:
+            self._parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self._skip = max(0, self._skip - 1)
+        elif tag == "title":
+            self._in_title = False
+        elif tag in self.BLOCK:
+            self._parts.append("\n")
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        elif not self._skip and not self.full and data.strip():
+            self._parts.append(data)
+            self._chars += len(data)
+
+    @property
+    def text(self) -> str:
+        lines = (_SPACE_RE.sub(" ", line).strip() for line in "".join(self._parts).split("\n"))
+        return "\n".join(line for line in lines if line)[: self.max_chars]
+
+
+@dataclass
+class FetchConfig:
+    top_k: int = 3  # Results whose pages are fetched
+    max_bytes: int = 1_000_000  # Per page; the download stops there
+    max_chars: int = 20000  # Extracted text kept per page
+    per_host: int = 2  # Concurrent downloads per host
+    concurrency: int = 8  # Concurrent downloads overall
+    timeout: float = 5.0  # Seconds for a whole ``enrich`` call; unfinished pages are skipped
+    cache_dir: Optional[str] = None  # Disk cache of extracted text; off when unset
+    cache_ttl: float = 3600.0  # Seconds a cached page is used without revalidation
+    cache_max_age: float = 7 * 86400.0  # Cached pages older than this are pruned
+
+
+class PageFetcher:
+    """
+    Download result pages concurrently and extract their text.
+
+    Downloads share the app's pooled client, are limited per host and
+    overall, and are streamed: HTML is parsed chunk by chunk and the body is
+    abandoned at ``max_bytes`` or once ``max_chars`` of text are in. Extracted
+    text is cached on disk per URL together with its ``ETag`` and
+    ``Last-Modified``; stale entries are revalidated with a conditional GET, so
+    an unchanged page costs a ``304`` instead of a download.
+
+    Args:
+        client: Returns the shared ``httpx.AsyncClient``
+        config: Limits and cache settings
+    """
+
+    def __init__(self, client: Callable[[], httpx.AsyncClient], config: Optional[FetchConfig] = None):
+        self.client = client
+        self.config = config or FetchConfig()
+        self._semaphore = asyncio.Semaphore(self.config.concurrency)
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+        self._writes = 0
+        self.counts = {"pages": 0, "fetched": 0, "cache_fresh": 0, "cache_revalidated": 0, "errors": 0,
+                       "skipped": 0, "timed_out": 0, "truncated": 0, "bytes": 0, "chars": 0}
+        self.download = LatencyTracker()
+        self.extract = LatencyTracker()
+        self.stage = LatencyTracker()
+
+    # -- disk cache ----------------------------------------------------------
+
+    def _cache_path(self, url: str) -> Optional[str]:
+        if not self.config.cache_dir:
+            return None
+        return os.path.join(self.config.cache_dir, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json")
+
+    def _read_cache(self, url: str) -> Optional[Dict[str, Any]]:
+        path = self._cache_path(url)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get("url") == url else None
+
+    def _write_cache(self, entry: Dict[str, Any]) -> None:
+        path = self._cache_path(entry["url"])
+        if path is None:
+            return
+        os.makedirs(self.config.cache_dir, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self.prune()
+
+    def prune(self) -> int:
+        """Delete cached pages older than ``cache_max_age``; returns how many were removed."""
+        if not self.config.cache_dir or not os.path.isdir(self.config.cache_dir):
+            return 0
+        cutoff = time.time() - self.config.cache_max_age
+        removed = 0
+        for name in os.listdir(self.config.cache_dir):
+            path = os.path.join(self.config.cache_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+    # -- fetching ------------------------------------------------------------
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc.lower()
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.config.per_host)
+        return self._hosts[host]
+
+    async def fetch(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        Extracted ``{"url", "title", "text"}`` of one page, or None when it
+        cannot be fetched or is not HTML/text.
+        """
+        self.counts["pages"] += 1
+        if urlsplit(url).scheme not in ("http", "https"):
+            self.counts["skipped"] += 1
+            return None
+        loop = asyncio.get_running_loop()
+        cached = await loop.run_in_executor(None, self._read_cache, url)
+        if cached is not None and time.time() - cached["fetched_at"] < self.config.cache_ttl:
+            self.counts["cache_fresh"] += 1
+            return cached
+
+        headers = {}
+        if cached is not None:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+        async with self._host_semaphore(url), self._semaphore:
+            try:
+                entry = await self._download(url, headers, cached)
+            except (httpx.HTTPError, UnicodeError, LookupError) as e:
+                self.counts["errors"] += 1
+                logger.warning("Page fetch failed for %s: %s", url, e)
+                return None
+        if entry is not None:
+            await loop.run_in_executor(None, self._write_cache, entry)
+        return entry
+
+    async def _download(self, url: str, headers: Dict[str, str],
+                        cached: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        start = time.monotonic()
+        async with self.client().stream("GET", url, headers=headers, follow_redirects=True) as response:
+            if response.status_code == 304 and cached is not None:
+                self.counts["cache_revalidated"] += 1
+                self.download.observe(time.monotonic() - start)
+                return {**cached, "fetched_at": time.time()}
+            response.raise_for_status()
+            content_type = response.headers.get("content-type", "text/html").lower()
+            if "html" not in content_type and not content_type.startswith("text/"):
+                self.counts["skipped"] += 1
+                return None
+            charset = _CHARSET_RE.search(content_type)
+            decoder = codecs.getincrementaldecoder(charset.group(1) if charset else "utf-8")(errors="replace")
+            extractor = TextExtractor(self.config.max_chars) if "html" in content_type else None
+            plain: List[str] = []
+            received, parse_time = 0, 0.0
+            async for chunk in response.aiter_bytes():
+                chunk = chunk[: self.config.max_bytes - received]
+                received += len(chunk)
+                parse_start = time.monotonic()
+                text = decoder.decode(chunk)
+                if extractor is not None:
+                    extractor.feed(text)
+                else:
+                    plain.append(text)
+                parse_time += time.monotonic() - parse_start
+                if received >= self.config.max_bytes or (extractor is not None and extractor.full):
+                    self.counts["truncated"] += 1
+                    break
+            # Leaving the block closes the response, dropping the rest of a truncated body
+        self.download.observe(time.monotonic() - start - parse_time)
+        parse_start = time.monotonic()
+        if extractor is not None:
+            extractor.close()
+            title, text = extractor.title.strip(), extractor.text
+        else:
+            title, text = "", "".join(plain).strip()[: self.config.max_chars]
+        self.extract.observe(parse_time + time.monotonic() - parse_start)
+        self.counts["fetched"] += 1
+        self.counts["bytes"] += received
+        self.counts["chars"] += len(text)
+        return {"url": url, "title": title, "text": text, "etag": response.headers.get("etag"),
+                "last_modified": response.headers.get("last-modified"), "fetched_at": time.time(),
+                "bytes": received}
+
+    async def enrich(self, results: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Copy of ``results`` whose top ``top_k`` entries carry their page text
+        under ``raw_content`` (the key Tavily uses for full pages). Pages not
+        done within ``timeout`` are left out.
+        """
+        results = [dict(result) for result in results]
+        targets = [r for r in results[: self.config.top_k] if r.get("url") and not r.get("raw_content")]
+        if not targets:
+            return results
+        start = time.monotonic()
+        tasks = {asyncio.ensure_future(self.fetch(r["url"])): r for r in targets}
+        try:
+            done, pending = await asyncio.wait(tasks, timeout=self.config.timeout)
+        finally:
+            for task in tasks:
+                task.cancel()
+        self.counts["timed_out"] += len(pending)
+        for task in done:
+            if task.exception() is not None:
+                self.counts["errors"] += 1
+                logger.warning("Page fetch failed for %s: %s", tasks[task]["url"], task.exception())
+                continue
+            page = task.result()
+            if page and page["text"]:
+                tasks[task]["raw_content"] = page["text"]
+        self.stage.observe(time.monotonic() - start)
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counts, "stage": self.stage.stats(), "download": self.download.stats(),
+                "extract": self.extract.stats()}
@@ -0,0 +1,247 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Sequence
+
+import httpx
+
+
+async def preconnect(client: httpx.AsyncClient, urls: Sequence[str]) -> Dict[str, str]:
+    """
+    Open a pooled connection to the origin of each URL with a ``HEAD``
+    request, so the first real requests skip the TCP and TLS handshakes.
+    Any response counts; returns "ok" or the error per origin.
+    """
+    origins = list(dict.fromkeys(str(httpx.URL(url).copy_with(path="/", query=None)) for url in urls if url))
+
+    async def connect(origin: str) -> str:
+        try:
+            await client.head(origin)
+            return "ok"
+        except httpx.HTTPError as e:
+            return f"{type(e).__name__}: {e}"
+
+    return dict(zip(origins, await asyncio.gather(*[connect(origin) for origin in origins])))
+
+
+@dataclass
+class HTTPPoolConfig:
+    """Connection-pool and timeout settings for a long-lived ``httpx.AsyncClient``."""
+
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    http2: bool = True
+    connect_timeout: float = 5.0
+    read_timeout: float = 10.0
+    write_timeout: float = 10.0
+    pool_timeout: float = 5.0
+
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(
+            connect=self.connect_timeout,
+            read=self.read_timeout,
+            write=self.write_timeout,
+            pool=self.pool_timeout,
+        )
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+# httpcore trace events that mean a request had to open a new connection
+_CONNECT_EVENTS = ("connection.connect_tcp.complete", "connection.connect_unix_socket.complete")
+
+
+class _CountingTransport(httpx.AsyncBaseTransport):
+    """Wraps a transport and tracks how many requests are in flight and how many opened a connection."""
+
+    def __init__(self, transport: httpx.AsyncHTTPTransport):
+        self.transport = transport
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests_total = 0
+        self.errors_total = 0
+        self.connections_opened = 0
+
+    def _trace(self, request: httpx.Request):
+        inner = request.extensions.get("trace")
+
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            if event_name in _CONNECT_EVENTS:
+                self.connections_opened += 1
+            if inner is not None:
+                await inner(event_name, info)
+
+        return trace
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.in_flight += 1
+        self.requests_total += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        request.extensions["trace"] = self._trace(request)
+        response = None
+        try:
+            response = await self.transport.handle_async_request(request)
+        except Exception:
+            self.errors_total += 1
+            raise
+        finally:
+            # Also when cancelled, e.g. because the downstream client disconnected
+            if response is None:
+                self.in_flight -= 1
+
+        # The request only releases its connection once the body is consumed,
+        # so decrement when the response stream is closed.
+        stream = response.stream
+        counter = self
+
+        class _Stream(httpx.AsyncByteStream):
+            closed = False
+
+            async def __aiter__(self):
+                async for part in stream:
+                    yield part
+
+            async def aclose(self):
+                try:
+                    await stream.aclose()
+                finally:
+                    if not self.closed:
+                        self.closed = True
+                        counter.in_flight -= 1
+
+        response.stream = _Stream()
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class PooledHTTPClient:
+    """
+    A single ``httpx.AsyncClient`` meant to live as long as the application.
+
+    Create it at startup (``await client.start()``), share it between requests
+    and close it on shutdown (``await client.aclose()``).
+    """
+
+    def __init__(self, config: Optional[HTTPPoolConfig] = None, base_url: str = "",
+                 headers: Optional[Dict[str, str]] = None):
+        self.config = config or HTTPPoolConfig()
+        self.base_url = base_url
+        self.headers = headers or {}
+        self.http2 = self.config.http2 and _http2_available()
+        self._transport: Optional[_CountingTransport] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._started_at: Optional[float] = None
+
+    async def start(self) -> "PooledHTTPClient":
+        self.open()
+        return self
+
+    def open(self) -> httpx.AsyncClient:
+        """
+        Create the client without awaiting, for SDKs that take their httpx
+        client at construction (``openai.AsyncOpenAI(http_client=...)``).
+        No connection opens until the first request, so this is safe before ``fork()``.
+        """
+        if self._client is None:
+            self._transport = _CountingTransport(
+                httpx.AsyncHTTPTransport(http2=self.http2, limits=self.config.limits())
+            )
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                timeout=self.config.timeout(),
+                transport=self._transport,
+            )
+            self._started_at = time.time()
+        return self._client
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            raise RuntimeError("PooledHTTPClient has not been started")
+        return self._client
+
+    @property
+    def started(self) -> bool:
+        return self._client is not None
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+        self._client = None
+        self._transport = None
+
+    async def preconnect(self, urls: Sequence[str]) -> Dict[str, str]:
+        """Open a pooled connection to the origin of each URL; see ``preconnect``."""
+        return await preconnect(self.client, urls)
+
+    async def __aenter__(self) -> "PooledHTTPClient":
+        return await self.start()
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report pool occupancy, for sizing ``max_connections``/``max_keepalive_connections``.
+
+        Returns:
+            A JSON-serialisable dict with connection and request counters.
+        """
+        stats: Dict[str, Any] = {
+            "started": self.started,
+            "http2": self.http2,
+            "max_connections": self.config.max_connections,
+            "max_keepalive_connections": self.config.max_keepalive_connections,
+            "connections": 0,
+            "active_connections": 0,
+            "idle_connections": 0,
+            "http2_connections": 0,
+            "in_flight": 0,
+            "peak_in_flight": 0,
+            "requests_total": 0,
+            "errors_total": 0,
+            "connections_opened": 0,
+            "connection_reuse": None,
+        }
+        if self._transport is None:
+            return stats
+
+        stats.update(
+            in_flight=self._transport.in_flight,
+            peak_in_flight=self._transport.peak_in_flight,
+            requests_total=self._transport.requests_total,
+            errors_total=self._transport.errors_total,
+            connections_opened=self._transport.connections_opened,
+        )
+        if self._transport.requests_total:
+            # Share of requests served on an already open (kept-alive or HTTP/2) connection
+            stats["connection_reuse"] = round(
+                max(0.0, 1 - self._transport.connections_opened / self._transport.requests_total), 4)
+        # httpcore does not publish pool stats, so read them defensively.
+        pool = getattr(self._transport.transport, "_pool", None)
+        for connection in list(getattr(pool, "connections", [])):
+            stats["connections"] += 1
+            if connection.is_idle():
+                stats["idle_connections"] += 1
+            else:
+                stats["active_connections"] += 1
+            if "HTTP/2" in connection.info():
+                stats["http2_connections"] += 1
+        return stats
@@ -0,0 +1,519 @@
+"""
+On-disk passage index for local documents: BM25 over an inverted index, plus
+optional dense vectors, both stored as memory-mapped NumPy arrays.
+
+The index is a list of immutable segments. Re-indexing only reads files whose
+size or mtime changed: their old passages are marked deleted and the new ones
+go into a fresh segment. Segments are merged once there are too many or too
+many deleted passages. Build or refresh an index from the command line with
+``python -m common.index build <docs> [--dense]``.
+"""
+import argparse
+import html
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from common.bm25 import tokenize
+from common.semantic_cache import HashingEmbedder
+
+logger = logging.getLogger(__name__)
+
+_TAG_RE = re.compile(r"<(script|style)\b.*?</\1>|<[^>]+>", re.IGNORECASE | re.DOTALL)
+_TITLE_RE = re.compile(r"<title[^>]*>(.*?)</title>", re.IGNORECASE | re.DOTALL)
+_HEADING_RE = re.compile(r"^#\s+(.+)$", re.MULTILINE)
+_SPACE_RE = re.compile(r"\s+")
+
+EXTENSIONS = (".md", ".markdown", ".txt", ".html", ".htm")
+RRF_K = 60
+
+
+def read_document(file_path: str) -> Tuple[str, str]:
+    """Title and whitespace-normalized text of a markdown, text or HTML file."""
+    with open(file_path, encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    title = os.path.splitext(os.path.basename(file_path))[0]
+    if file_path.lower().endswith((".html", ".htm")):
+        match = _TITLE_RE.search(text)
+        title = _SPACE_RE.sub(" ", html.unescape(match.group(1))).strip() if match else title
+        text = html.unescape(_TAG_RE.sub(" ", text))
+    else:
+        match = _HEADING_RE.search(text)
+        title = match.group(1).strip() if match else title
+    return title, _SPACE_RE.sub(" ", text).strip()
+
+
+def split_passages(text: str, size: int) -> List[str]:
+    """Split on whitespace into passages of at most about ``size`` characters."""
+    passages, start = [], 0
+    while start < len(text):
+        end = min(len(text), start + size)
+        if end < len(text):
+            space = text.rfind(" ", start + size // 2, end)
+            end = space if space > start else end
+        passages.append(text[start:end].strip())
+        start = end
+    return [p for p in passages if p]
+
+
+@dataclass
+class IndexConfig:
+    path: str  # Directory of documents
+    index_dir: Optional[str] = None  # Where segments are stored; defaults to <path>/.index
+    passage_chars: int = 1200
+    dense: bool = False  # Also store passage embeddings and fuse dense with BM25 ranks
+    dense_dim: int = 256
+    k1: float = 1.5
+    b: float = 0.75
+    max_segments: int = 8  # Merge into one segment beyond this many
+    max_deleted_ratio: float = 0.3  # ... or once this share of passages is deleted
+    refresh_interval: float = 60.0  # Seconds between change scans on search; 0 scans only on ``refresh()``
+
+
+class Segment:
+    """
+    Immutable part of the index, stored in its own directory.
+
+    The inverted index is in CSR form: the postings of term ``t`` are
+    ``doc_ids[offsets[t]:offsets[t + 1]]`` with their term frequencies in
+    ``tfs``. Passage text is one UTF-8 blob cut by ``text_offsets``. Only the
+    vocabulary, the file table and the deleted mask are loaded into memory.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.name = os.path.basename(directory)
+        with open(os.path.join(directory, "segment.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.files: List[Dict[str, Any]] = meta["files"]
+        self.vocab = {term: row for row, term in enumerate(meta["terms"])}
+
+        def load(name: str) -> np.ndarray:
+            return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+
+        self.offsets = load("offsets")
+        self.doc_ids = load("doc_ids")
+        self.tfs = load("tfs")
+        self.lengths = load("lengths")
+        self.doc_file = load("doc_file")
+        self.text_offsets = load("text_offsets")
+        self.text = np.memmap(os.path.join(directory, "text.bin"), dtype=np.uint8, mode="r") \
+            if self.text_offsets[-1] else np.zeros(0, dtype=np.uint8)
+        vectors_path = os.path.join(directory, "vectors.npy")
+        self.vectors = np.load(vectors_path, mmap_mode="r") if os.path.exists(vectors_path) else None
+        deleted_path = os.path.join(directory, "deleted.npy")
+        self.deleted = np.load(deleted_path) if os.path.exists(deleted_path) else np.zeros(len(self.lengths), bool)
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    @property
+    def live(self) -> int:
+        return len(self) - int(self.deleted.sum())
+
+    def doc_freq(self, term: str) -> int:
+        row = self.vocab.get(term)
+        return 0 if row is None else int(self.offsets[row + 1] - self.offsets[row])
+
+    def passage(self, doc: int) -> str:
+        start, end = int(self.text_offsets[doc]), int(self.text_offsets[doc + 1])
+        return bytes(self.text[start:end]).decode("utf-8")
+
+    def delete_file(self, file_index: int) -> None:
+        entry = self.files[file_index]
+        self.deleted[entry["start"]:entry["start"] + entry["count"]] = True
+
+    def save_deleted(self) -> None:
+        _save(os.path.join(self.directory, "deleted.npy"), self.deleted)
+
+    @staticmethod
+    def build(directory: str, documents: Sequence[Dict[str, Any]],
+              embed: Optional[Callable[[Sequence[str]], np.ndarray]] = None) -> "Segment":
+        """
+        Write a segment for ``documents`` (dicts with ``path``, ``title``,
+        ``mtime_ns``, ``size`` and a list of ``passages``) and open it.
+        """
+        os.makedirs(directory, exist_ok=True)
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        lengths, doc_file, files, texts = [], [], [], []
+        for file_index, document in enumerate(documents):
+            files.append({"path": document["path"], "title": document["title"], "mtime_ns": document["mtime_ns"],
+                          "size": document["size"], "start": len(lengths), "count": len(document["passages"])})
+            for passage in document["passages"]:
+                doc = len(lengths)
+                tokens = tokenize(document["title"] + " " + passage)
+                for term, tf in Counter(tokens).items():
+                    postings[term].append((doc, tf))
+                lengths.append(len(tokens))
+                doc_file.append(file_index)
+                texts.append(passage.encode("utf-8"))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(postings[t]) for t in terms])
+        doc_ids = np.empty(int(offsets[-1]), dtype=np.int32)
+        tfs = np.empty(int(offsets[-1]), dtype=np.float32)
+        for row, term in enumerate(terms):
+            pairs = np.asarray(postings[term], dtype=np.int64).reshape(-1, 2)
+            doc_ids[offsets[row]:offsets[row + 1]] = pairs[:, 0]
+            tfs[offsets[row]:offsets[row + 1]] = pairs[:, 1]
+        text_offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        text_offsets[1:] = np.cumsum([len(t) for t in texts])
+
+        _save(os.path.join(directory, "offsets.npy"), offsets)
+        _save(os.path.join(directory, "doc_ids.npy"), doc_ids)
+        _save(os.path.join(directory, "tfs.npy"), tfs)
+        _save(os.path.join(directory, "lengths.npy"), np.asarray(lengths, dtype=np.int32))
+        _save(os.path.join(directory, "doc_file.npy"), np.asarray(doc_file, dtype=np.int32))
+        _save(os.path.join(directory, "text_offsets.npy"), text_offsets)
+        with open(os.path.join(directory, "text.bin"), "wb") as f:
+            for text in texts:
+                f.write(text)
+        if embed is not None:
+            vectors = np.zeros((0, 0), dtype=np.float32)
+            if texts:
+                batches = []
+                for start in range(0, len(texts), 1024):
+                    batches.append(embed([t.decode("utf-8") for t in texts[start:start + 1024]]))
+                vectors = np.concatenate(batches).astype(np.float32)
+            _save(os.path.join(directory, "vectors.npy"), vectors)
+        with open(os.path.join(directory, "segment.json"), "w", encoding="utf-8") as f:
+            json.dump({"files": files, "terms": terms}, f, ensure_ascii=False)
+        return Segment(directory)
+
+
+def _save(path: str, array: np.ndarray) -> None:
+    """Write next to ``path`` and rename, so readers never map a half-written file."""
+    tmp = path + ".tmp.npy"
+    np.save(tmp, array)
+    os.replace(tmp, path)
+
+
+@contextmanager
+def _process_lock(path: str):
+    """Exclusive lock on ``path`` across processes (no-op where ``fcntl`` is missing)."""
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class LocalIndex:
+    """
+    BM25 (and optionally dense) retrieval over a directory of documents.
+
+    Searches are lock-free over an immutable list of segments; ``refresh``
+    rebuilds that list under a lock and swaps it in. Results have the usual
+    ``{title, url, content, score}`` shape, one per file, with ``file://`` URLs.
+
+    Args:
+        config: Documents, storage and ranking settings
+        embedder: Text -> unit vectors for the dense index; a local hashing embedder by default
+    """
+
+    def __init__(self, config: IndexConfig, embedder: Optional[Callable[[Sequence[str]], np.ndarray]] = None):
+        self.config = config
+        self.path = os.path.abspath(os.path.expanduser(config.path))
+        self.index_dir = os.path.abspath(os.path.expanduser(config.index_dir or os.path.join(self.path, ".index")))
+        self.embedder = (embedder or HashingEmbedder(config.dense_dim)) if config.dense else None
+        self._segments: List[Segment] = []
+        self._files: Dict[str, Tuple[str, int]] = {}  # Live files: path -> (segment name, file index)
+        self._lock = threading.Lock()
+        self._next_segment = 0
+        self._avg_length = 0.0
+        self._live = 0
+        self.last_refresh = 0.0
+        self._manifest_mtime: Optional[int] = None
+        self.stats_counts = {"searches": 0, "refreshes": 0, "files_indexed": 0, "files_deleted": 0, "merges": 0,
+                             "last_refresh_ms": 0.0}
+        self._load()
+
+    # -- persistence -------------------------------------------------------
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.index_dir, "manifest.json")
+
+    def _current_manifest_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self._manifest_path()).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self) -> None:
+        if not os.path.exists(self._manifest_path()):
+            return
+        self._manifest_mtime = self._current_manifest_mtime()
+        with open(self._manifest_path(), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("passage_chars") != self.config.passage_chars or \
+                manifest.get("dense_dim") != (self.config.dense_dim if self.config.dense else None):
+            logger.info("Local index: settings changed, rebuilding %s", self.index_dir)
+            return
+        self._segments = [Segment(os.path.join(self.index_dir, name)) for name in manifest["segments"]]
+        self._files = {path: tuple(location) for path, location in manifest["files"].items()}
+        self._next_segment = manifest["next_segment"]
+        self._update_totals()
+
+    def _write_manifest(self, segments: List[Segment]) -> None:
+        manifest = {
+            "passage_chars": self.config.passage_chars,
+            "dense_dim": self.config.dense_dim if self.config.dense else None,
+            "segments": [segment.name for segment in segments],
+            "files": self._files,
+            "next_segment": self._next_segment,
+        }
+        tmp = self._manifest_path() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self._manifest_path())
+        self._manifest_mtime = self._current_manifest_mtime()
+
+    def _update_totals(self) -> None:
+        live = sum(segment.live for segment in self._segments)
+        total_length = sum(int(np.asarray(segment.lengths)[~segment.deleted].sum()) for segment in self._segments)
+        self._live = live
+        self._avg_length = total_length / live if live else 0.0
+
+    # -- indexing ----------------------------------------------------------
+
+    def _scan(self) -> Dict[str, os.stat_result]:
+        found = {}
+        for root, dirs, files in os.walk(self.path):
+            dirs[:] = [d for d in dirs if not d.startswith(".") and os.path.join(root, d) != self.index_dir]
+            for file_name in files:
+                if file_name.lower().endswith(EXTENSIONS):
+                    file_path = os.path.join(root, file_name)
+                    found[file_path] = os.stat(file_path)
+        return found
+
+    def _new_segment_dir(self) -> str:
+        self._next_segment += 1
+        return os.path.join(self.index_dir, f"seg-{self._next_segment:06d}")
+
+    def refresh(self) -> Dict[str, int]:
+        """
+        Bring the index in line with the directory: index new and changed
+        files, drop deleted ones, and merge segments when needed.
+
+        Returns:
+            Counts of files added, updated and removed
+        """
+        os.makedirs(self.index_dir, exist_ok=True)
+        # Worker processes share the index directory; one refreshes at a time
+        with self._lock, _process_lock(os.path.join(self.index_dir, ".lock")):
+            start = time.monotonic()
+            if self._current_manifest_mtime() != self._manifest_mtime:
+                # Another process refreshed since; start from its manifest
+                self._load()
+            on_disk = self._scan()
+            by_name = {segment.name: segment for segment in self._segments}
+
+            def entry(path: str) -> Dict[str, Any]:
+                name, file_index = self._files[path]
+                return by_name[name].files[file_index]
+
+            changed = [path for path, stat in on_disk.items()
+                       if path not in self._files
+                       or entry(path)["mtime_ns"] != stat.st_mtime_ns or entry(path)["size"] != stat.st_size]
+            removed = [path for path in self._files if path not in on_disk]
+            updated = [path for path in changed if path in self._files]
+            touched = set()
+            for path in removed + updated:
+                name, file_index = self._files.pop(path)
+                by_name[name].delete_file(file_index)
+                touched.add(by_name[name])
+
+            segments = list(self._segments)
+            if changed:
+                documents = []
+                for path in sorted(changed):
+                    stat = on_disk[path]
+                    title, text = read_document(path)
+                    documents.append({"path": path, "title": title, "mtime_ns": stat.st_mtime_ns,
+                                      "size": stat.st_size, "passages": split_passages(text, self.config.passage_chars)})
+                segments.append(self._add_segment(documents))
+
+            total = sum(len(s) for s in segments)
+            deleted = sum(len(s) - s.live for s in segments)
+            merged_away: List[Segment] = []
+            if len(segments) > self.config.max_segments or (total and deleted / total > self.config.max_deleted_ratio):
+                merged_away = segments
+                segments = [self._merge(segments)]
+                self.stats_counts["merges"] += 1
+            else:
+                for segment in touched:
+                    segment.save_deleted()
+
+            if changed or removed or merged_away:
+                self._write_manifest(segments)
+            self._segments = segments
+            self._update_totals()
+            for segment in merged_away:
+                shutil.rmtree(segment.directory, ignore_errors=True)
+
+            self.last_refresh = time.monotonic()
+            elapsed = (self.last_refresh - start) * 1000
+            self.stats_counts["refreshes"] += 1
+            self.stats_counts["files_indexed"] += len(changed)
+            self.stats_counts["files_deleted"] += len(removed)
+            self.stats_counts["last_refresh_ms"] = round(elapsed, 1)
+            if changed or removed:
+                logger.info("Local index: %d added, %d updated, %d removed in %.0f ms",
+                            len(changed) - len(updated), len(updated), len(removed), elapsed)
+            return {"added": len(changed) - len(updated), "updated": len(updated), "removed": len(removed)}
+
+    def _add_segment(self, documents: Sequence[Dict[str, Any]]) -> Segment:
+        segment = Segment.build(self._new_segment_dir(), documents, self.embedder)
+        for file_index, document in enumerate(documents):
+            self._files[document["path"]] = (segment.name, file_index)
+        return segment
+
+    def _merge(self, segments: Sequence[Segment]) -> Segment:
+        """One segment with the live files of ``segments``, re-tokenized from the stored passage text."""
+        by_name = {segment.name: segment for segment in segments}
+        documents = []
+        for name, file_index in self._files.values():
+            segment = by_name[name]
+            entry = segment.files[file_index]
+            passages = [segment.passage(doc) for doc in range(entry["start"], entry["start"] + entry["count"])]
+            documents.append({**entry, "passages": passages})
+        return self._add_segment(documents)
+
+    def maybe_refresh(self) -> None:
+        """Refresh on first use, then at most every ``refresh_interval`` seconds."""
+        if not self.last_refresh or (self.config.refresh_interval > 0
+                                     and time.monotonic() - self.last_refresh >= self.config.refresh_interval):
+            self.refresh()
+
+    # -- search ------------------------------------------------------------
+
+    def _bm25(self, terms: Sequence[str], candidates: int) -> List[Tuple[float, Segment, int]]:
+        segments = self._segments
+        n, avg_length = self._live, self._avg_length or 1.0
+        if not n or not terms:
+            return []
+        k1, b = self.config.k1, self.config.b
+        idf = {}
+        for term in terms:
+            df = sum(segment.doc_freq(term) for segment in segments)
+            if df:
+                idf[term] = float(np.log(1 + (n - df + 0.5) / (df + 0.5)))
+        hits = []
+        for segment in segments:
+            rows = [(segment.vocab[t], idf[t]) for t in idf if t in segment.vocab]
+            if not rows:
+                continue
+            scores = np.zeros(len(segment), dtype=np.float32)
+            for row, weight in rows:
+                start, end = segment.offsets[row], segment.offsets[row + 1]
+                ids = segment.doc_ids[start:end]
+                tf = segment.tfs[start:end]
+                norm = k1 * (1 - b + b * segment.lengths[ids] / avg_length)
+                # Doc ids are unique within one posting list, so plain fancy-index addition is exact
+                scores[ids] += weight * tf * (k1 + 1) / (tf + norm)
+            scores[segment.deleted] = 0
+            hits.extend(_top(scores, candidates, segment))
+        return hits
+
+    def _dense(self, query: str, candidates: int) -> List[Tuple[float, Segment, int]]:
+        vector = self.embedder([query])[0]
+        hits = []
+        for segment in self._segments:
+            if segment.vectors is None or not len(segment.vectors):
+                continue
+            scores = np.asarray(segment.vectors @ vector, dtype=np.float32)
+            scores[segment.deleted] = -1
+            hits.extend(_top(scores, candidates, segment, minimum=0.0))
+        return hits
+
+    @staticmethod
+    def _best_per_file(hits: List[Tuple[float, Segment, int]], limit: int) -> List[Tuple[float, Segment, int]]:
+        best, seen = [], set()
+        for score, segment, doc in sorted(hits, key=lambda hit: -hit[0]):
+            path = segment.files[int(segment.doc_file[doc])]["path"]
+            if path not in seen:
+                seen.add(path)
+                best.append((score, segment, doc))
+                if len(best) >= limit:
+                    break
+        return best
+
+    def search(self, query: str, max_results: int = 10) -> List[Dict[str, Any]]:
+        """
+        Best passage per file for ``query``, best first. With ``dense`` on,
+        BM25 and embedding ranks are fused with reciprocal-rank fusion.
+        """
+        self.maybe_refresh()
+        self.stats_counts["searches"] += 1
+        hits = self._best_per_file(self._bm25(list(dict.fromkeys(tokenize(query))), max_results * 4), max_results)
+        if self.embedder is not None:
+            dense = self._best_per_file(self._dense(query, max_results * 4), max_results)
+            fused: Dict[Tuple[str, int], List[Any]] = {}
+            for ranking in (hits, dense):
+                for rank, (_, segment, doc) in enumerate(ranking):
+                    entry = fused.setdefault((segment.name, doc), [0.0, segment, doc])
+                    entry[0] += 1.0 / (RRF_K + rank + 1)
+            hits = self._best_per_file([tuple(entry) for entry in fused.values()], max_results)
+        results = []
+        for score, segment, doc in hits:
+            entry = segment.files[int(segment.doc_file[doc])]
+            results.append({"title": entry["title"], "url": f"file://{entry['path']}",
+                            "content": segment.passage(doc), "score": round(float(score), 4)})
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        segments = self._segments
+        return {
+            **self.stats_counts,
+            "segments": len(segments),
+            "passages": self._live,
+            "deleted_passages": sum(len(s) - s.live for s in segments),
+            "files": len(self._files),
+            "dense": self.embedder is not None,
+        }
+
+
+def _top(scores: np.ndarray, k: int, segment: Segment, minimum: float = 0.0) -> List[Tuple[float, Segment, int]]:
+    k = min(k, len(scores))
+    if not k:
+        return []
+    top = np.argpartition(-scores, k - 1)[:k]
+    return [(float(scores[doc]), segment, int(doc)) for doc in top if scores[doc] > minimum]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build, refresh or query a local document index")
+    parser.add_argument("command", choices=["build", "query", "stats"])
+    parser.add_argument("path", help="Directory of .md/.txt/.html documents")
+    parser.add_argument("query", nargs="?", default="")
+    parser.add_argument("--index-dir")
+    parser.add_argument("--dense", action="store_true")
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    index = LocalIndex(IndexConfig(path=args.path, index_dir=args.index_dir, dense=args.dense, refresh_interval=0))
+    if args.command == "build":
+        print(index.refresh())
+    elif args.command == "query":
+        started = time.perf_counter()
+        for result in index.search(args.query, args.k):
+            print(f"{result['score']:>8}  {result['title']}  {result['url']}\n          {result['content'][:160]}")
+        print(f"{(time.perf_counter() - started) * 1000:.1f} ms")
+    print(json.dumps(index.stats(), indent=2))
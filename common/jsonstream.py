@@ -0,0 +1,115 @@
+import json
+from typing import Any, Dict, List, Tuple
+
+_WHITESPACE = " \t\r\n"
+
+
+class IncrementalJSONParser:
+    """
+    Parse a JSON object as it streams in, reporting each top-level field as
+    soon as its value is complete.
+
+    Text before the opening brace (e.g. a Markdown ```json fence or a
+    preamble) and after the closing brace is ignored, and chunks may split
+    tokens anywhere. Each character is scanned once; only the text of the
+    field currently being read is buffered.
+
+        parser = IncrementalJSONParser()
+        for chunk in stream:
+            for key, value in parser.feed(chunk):
+                ...
+    """
+
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+        self.done = False
+        self._started = False
+        self._state = "key"  # key -> colon -> value -> comma -> key ...
+        self._token: List[str] = []  # Text of the key or value being read
+        self._key = None
+        self._in_string = False
+        self._escape = False
+        self._depth = 0  # Nesting inside the current value
+        self._value_is_string = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Consume a chunk; returns the ``(key, value)`` pairs completed by it."""
+        completed: List[Tuple[str, Any]] = []
+        for char in chunk or "":
+            if self.done:
+                break
+            if not self._started:
+                self._started = char == "{"
+                continue
+            self._consume(char, completed)
+        return completed
+
+    def _consume(self, char: str, completed: List[Tuple[str, Any]]) -> None:
+        if self._in_string:
+            self._token.append(char)
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+                if self._state == "key":
+                    self._key = json.loads("".join(self._token))
+                    self._token = []
+                    self._state = "colon"
+                elif self._value_is_string and self._depth == 0:
+                    # A string value is complete at its closing quote
+                    self._emit(completed)
+            return
+
+        if self._state == "key":
+            if char == '"':
+                self._token = [char]
+                self._in_string = True
+            elif char == "}":
+                self.done = True
+        elif self._state == "colon":
+            if char == ":":
+                self._state = "value"
+                self._token = []
+                self._depth = 0
+                self._value_is_string = False
+        elif self._state == "value":
+            if not self._token and char in _WHITESPACE:
+                return
+            if self._depth == 0 and char in ",}" or (self._depth == 0 and self._token and char in _WHITESPACE
+                                                      and self._token[0] not in "[{"):
+                # End of a number, literal, array or object value
+                self._emit(completed)
+                self._after_value(char)
+                return
+            if not self._token:
+                self._value_is_string = char == '"'
+            self._token.append(char)
+            if char == '"':
+                self._in_string = True
+            elif char in "[{":
+                self._depth += 1
+            elif char in "]}":
+                self._depth -= 1
+        elif self._state == "comma":
+            self._after_value(char)
+
+    def _after_value(self, char: str) -> None:
+        if char == ",":
+            self._state = "key"
+        elif char == "}":
+            self.done = True
+        else:
+            self._state = "comma"
+
+    def _emit(self, completed: List[Tuple[str, Any]]) -> None:
+        text = "".join(self._token)
+        self._token = []
+        self._state = "comma"
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError:
+            return
+        self.fields[self._key] = value
+        completed.append((self._key, value))
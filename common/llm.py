@@ -0,0 +1,65 @@
+from typing import Any, Dict, Optional, Sequence
+
+import openai
+
+from common.http import HTTPPoolConfig, PooledHTTPClient
+
+
+class LLMClientRegistry:
+    """
+    One OpenAI-compatible client per process, over one tuned connection pool.
+
+    Every caller (agents, endpoints) goes through ``client``, so the
+    keep-alive connections, the HTTP/2 session and the pool limits are
+    shared instead of each caller opening its own. Roles (coordinator,
+    reporter, summary, ...) differ only in request parameters: ``params``
+    merges a role's configured overrides over the caller's defaults, and
+    nothing about the connection changes.
+
+    Args:
+        api_key: API key of the provider
+        base_url: Override for OpenAI-compatible providers or a local stub
+        model: Model sent with every role unless a role overrides it
+        config: Pool limits, keep-alive and timeouts of the shared connections
+        roles: Per-role overrides, e.g. ``{"coordinator": {"temperature": 0}}``
+        max_retries: Retries done by the SDK itself; 0 when the caller retries
+    """
+
+    def __init__(self, api_key: str, base_url: Optional[str] = None, model: str = "gpt-3.5-turbo",
+                 config: Optional[HTTPPoolConfig] = None, roles: Optional[Dict[str, Dict[str, Any]]] = None,
+                 max_retries: int = 0):
+        self.model = model
+        self.roles = roles or {}
+        self.pool = PooledHTTPClient(config)
+        self.client = openai.AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url or None,
+            max_retries=max_retries,
+            http_client=self.pool.open(),
+        )
+        self._role_requests: Dict[str, int] = {}
+
+    @property
+    def base_url(self) -> str:
+        return str(self.client.base_url)
+
+    def params(self, role: str, **defaults: Any) -> Dict[str, Any]:
+        """Request parameters for ``role``: ``model``, then ``defaults``, then the role's overrides."""
+        self._role_requests[role] = self._role_requests.get(role, 0) + 1
+        return {"model": self.model, **defaults, **self.roles.get(role, {})}
+
+    async def preconnect(self, urls: Sequence[str] = ()) -> Dict[str, str]:
+        """Open a pooled connection to the provider (and ``urls``) ahead of the first call."""
+        return await self.pool.preconnect([self.base_url, *urls])
+
+    async def aclose(self) -> None:
+        await self.pool.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        """Connection reuse and occupancy of the shared pool, and the settings handed out per role."""
+        return {
+            "base_url": self.base_url,
+            "model": self.model,
+            "pool": self.pool.stats(),
+            "roles": {role: {"views": count, **self.roles.get(role, {})} for role, count in self._role_requests.items()},
+        }
@@ -0,0 +1,49 @@
+import threading
+from collections import deque
+from typing import Dict
+
+
+class LatencyTracker:
+    """
+    Count, mean and percentiles of a latency, over the most recent ``window`` samples.
+
+    Args:
+        window: Number of recent samples kept for the percentiles
+    """
+
+    def __init__(self, window: int = 1024):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+            self.total += seconds
+
+    def quantile(self, q: float) -> float:
+        """Seconds at quantile ``q`` (0..1) of the window, nearest-rank; 0 when empty."""
+        with self._lock:
+            samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, int(q * len(samples)))] if samples else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        """Milliseconds; percentiles use the nearest-rank method over the window."""
+        with self._lock:
+            samples = sorted(self._samples)
+            count, total = self.count, self.total
+
+        def percentile(p: float) -> float:
+            if not samples:
+                return 0.0
+            return round(samples[min(len(samples) - 1, int(p / 100 * len(samples)))] * 1000, 1)
+
+        return {
+            "count": count,
+            "mean_ms": round(total / count * 1000, 1) if count else 0.0,
+            "p50_ms": percentile(50),
+            "p95_ms": percentile(95),
+            "p99_ms": percentile(99),
+        }
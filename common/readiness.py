@@ -0,0 +1,58 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Readiness:
+    """
+    Warm-up steps run once at startup, and whether the app is ready for traffic.
+
+    Steps run in the order they were added, each bounded by ``timeout``. The
+    app is ready once every step has finished and none of the ``required``
+    ones failed; optional steps (e.g. a priming query) only record their
+    error. Meant for an orchestrator's readiness probe, while a liveness
+    probe can answer as soon as the server accepts connections.
+    """
+
+    def __init__(self, timeout: float = 60.0):
+        self.timeout = timeout
+        self._steps: List[Tuple[str, Callable[[], Awaitable[Any]], bool]] = []
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        self.ready = False
+        self.started_at: Optional[float] = None
+        self.seconds: Optional[float] = None
+
+    def add(self, name: str, step: Callable[[], Awaitable[Any]], required: bool = True) -> None:
+        self._steps.append((name, step, required))
+        self.steps[name] = {"status": "pending", "required": required}
+
+    async def run(self) -> bool:
+        self.started_at = time.monotonic()
+        ok = True
+        for name, step, required in self._steps:
+            record = self.steps[name]
+            record["status"] = "running"
+            start = time.monotonic()
+            try:
+                result = await asyncio.wait_for(step(), self.timeout)
+                record["status"] = "done"
+                if result is not None:
+                    record["result"] = result
+            except asyncio.TimeoutError:
+                record["status"] = "timeout"
+            except Exception as e:
+                record["status"] = "failed"
+                record["error"] = f"{type(e).__name__}: {e}"
+            record["seconds"] = round(time.monotonic() - start, 3)
+            if record["status"] != "done":
+                logger.warning("Warm-up step %s %s: %s", name, record["status"], record.get("error", ""))
+                ok = ok and not required
+        self.seconds = round(time.monotonic() - self.started_at, 3)
+        self.ready = ok
+        return ok
+
+    def stats(self) -> Dict[str, Any]:
+        return {"ready": self.ready, "seconds": self.seconds, "steps": self.steps}
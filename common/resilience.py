@@ -0,0 +1,236 @@
+import asyncio
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from common.metrics import LatencyTracker
+
+RETRYABLE_STATUS = frozenset({408, 425, 429, 500, 502, 503, 504})
+# Connection and timeout errors of SDKs we don't import (openai, requests)
+_RETRYABLE_NAMES = frozenset({"APIConnectionError", "APITimeoutError", "ConnectionError", "Timeout",
+                              "ConnectTimeout", "ReadTimeout"})
+
+
+class CircuitOpen(Exception):
+    """Raised without calling upstream while a provider's circuit is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is unavailable (circuit open), retry after {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Transport errors, timeouts, 429 and 5xx are worth another try; other errors are not."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in RETRYABLE_STATUS
+    if isinstance(exc, (httpx.TransportError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    # openai.APIStatusError carries status_code; requests' HTTPError (SDKs) carries a response
+    status = getattr(exc, "status_code", None)
+    if not isinstance(status, int):
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS
+    return type(exc).__name__ in _RETRYABLE_NAMES
+
+
+@dataclass
+class ResilienceConfig:
+    retry_attempts: int = 3  # Total attempts, including the first
+    retry_base_delay: float = 0.2
+    retry_max_delay: float = 2.0
+    hedge: bool = False
+    hedge_quantile: float = 0.95  # Fire the backup call after this quantile of recent latencies
+    hedge_delay: float = 1.0  # Used until enough latencies have been seen
+    hedge_min_delay: float = 0.05
+    breaker_failure_threshold: int = 5  # Consecutive failures that open the circuit; 0 disables it
+    breaker_recovery_time: float = 30.0  # Seconds before a trial call is let through
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after ``failure_threshold`` consecutive failures; open
+    fails fast for ``recovery_time``; then half-open lets one trial call
+    through, closing again on success and reopening on failure.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_time: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.short_circuited = 0
+        self.trips = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """Raise ``CircuitOpen`` unless a call may go through now."""
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            if self.state == "open":
+                remaining = self.opened_at + self.recovery_time - time.monotonic()
+                if remaining > 0:
+                    self.short_circuited += 1
+                    raise CircuitOpen(self.name, remaining)
+                self.state = "half_open"
+            if self.state == "half_open":
+                if self._trial_running:
+                    self.short_circuited += 1
+                    raise CircuitOpen(self.name, self.recovery_time)
+                self._trial_running = True
+
+    def abort(self) -> None:
+        """Forget a trial call that was cancelled before it could succeed or fail."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.state = "closed"
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.trips += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutive_failures": self.failures, "trips": self.trips,
+                "short_circuited": self.short_circuited}
+
+
+class ResilientCaller:
+    """
+    Call one upstream provider with retries, optional hedging and a circuit breaker.
+
+    Retries use exponential backoff with full jitter and only apply to
+    retryable errors (see ``is_retryable``); only idempotent calls should
+    enable them. A hedged call fires a second, identical request when the
+    first has not answered within the recent ``hedge_quantile`` latency, and
+    takes whichever succeeds first.
+    """
+
+    def __init__(self, name: str, config: Optional[ResilienceConfig] = None):
+        self.name = name
+        self.config = config or ResilienceConfig()
+        self.breaker = CircuitBreaker(name, self.config.breaker_failure_threshold, self.config.breaker_recovery_time)
+        self.latency = LatencyTracker(window=512)
+        self.counts = {"calls": 0, "attempts": 0, "retries": 0, "failures": 0, "hedges": 0, "hedge_wins": 0}
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter: uniform in [0, min(max_delay, base * 2^attempt)]."""
+        return random.uniform(0, min(self.config.retry_max_delay, self.config.retry_base_delay * 2 ** attempt))
+
+    def hedge_delay(self) -> float:
+        if self.latency.count < 20:
+            return self.config.hedge_delay
+        quantile = self.latency.quantile(self.config.hedge_quantile)
+        return max(self.config.hedge_min_delay, quantile)
+
+    async def call(self, fn: Callable[[], Awaitable[Any]], retry: bool = True, hedge: Optional[bool] = None) -> Any:
+        """
+        Args:
+            fn: Makes one upstream attempt; called again for retries and hedges
+            retry: Whether the call is idempotent and may be retried
+            hedge: Override ``ResilienceConfig.hedge`` for this call
+        """
+        self.counts["calls"] += 1
+        hedge = self.config.hedge if hedge is None else hedge
+        attempts = max(1, self.config.retry_attempts) if retry else 1
+        for attempt in range(attempts):
+            self.breaker.before_call()
+            try:
+                result = await (self._hedged(fn) if hedge else self._attempt(fn))
+            except asyncio.CancelledError:
+                self.breaker.abort()
+                raise
+            except Exception as e:
+                retryable = self._record_error(e)
+                if attempt + 1 >= attempts or not retryable:
+                    self.counts["failures"] += 1
+                    raise
+                self.counts["retries"] += 1
+                await asyncio.sleep(self.backoff(attempt))
+            else:
+                self.breaker.record_success()
+                return result
+
+    def _record_error(self, exc: Exception) -> bool:
+        """Count upstream failures against the breaker; caller errors (4xx, local rejections) don't trip it."""
+        if is_retryable(exc):
+            self.breaker.record_failure()
+            return True
+        self.breaker.abort()
+        return False
+
+    async def _attempt(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.counts["attempts"] += 1
+        start = time.monotonic()
+        result = await fn()
+        self.latency.observe(time.monotonic() - start)
+        return result
+
+    async def _hedged(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        primary = asyncio.ensure_future(self._attempt(fn))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay())
+            if not done:
+                self.counts["hedges"] += 1
+                tasks.add(asyncio.ensure_future(self._attempt(fn)))
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.counts["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def call_sync(self, fn: Callable[[], Any], retry: bool = True) -> Any:
+        """Blocking counterpart of ``call`` (retries and circuit breaking, no hedging)."""
+        self.counts["calls"] += 1
+        attempts = max(1, self.config.retry_attempts) if retry else 1
+        for attempt in range(attempts):
+            self.breaker.before_call()
+            self.counts["attempts"] += 1
+            start = time.monotonic()
+            try:
+                result = fn()
+            except Exception as e:
+                retryable = self._record_error(e)
+                if attempt + 1 >= attempts or not retryable:
+                    self.counts["failures"] += 1
+                    raise
+                self.counts["retries"] += 1
+                time.sleep(self.backoff(attempt))
+            else:
+                self.latency.observe(time.monotonic() - start)
+                self.breaker.record_success()
+                return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counts, "hedge_delay_ms": round(self.hedge_delay() * 1000, 1),
+                "latency": self.latency.stats(), "breaker": self.breaker.stats()}
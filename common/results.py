@@ -0,0 +1,89 @@
+import hashlib
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+from urllib.parse import urlsplit, urlunsplit
+
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_url(url: str) -> str:
+    """Drop scheme differences, ``www.``, fragments and trailing slashes so duplicates compare equal."""
+    if not url:
+        return ""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    path = parts.path.rstrip("/")
+    return urlunsplit(("", host, path, parts.query, ""))
+
+
+def content_hash(text: str) -> str:
+    normalized = _SPACE_RE.sub(" ", (text or "").casefold()).strip()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Dict[str, Any]]], k: int = 60,
+                           limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Merge several ranked result lists into one.
+
+    Each result scores ``sum(1 / (k + rank))`` over the lists it appears in;
+    duplicates (same normalized URL, or same content) are collapsed into the
+    first copy seen. The fused score is stored under ``"rrf_score"``.
+
+    Args:
+        rankings: Result lists in ``{title, url, content, score}`` shape, best first
+        k: RRF damping constant
+        limit: Maximum number of results to return
+
+    Returns:
+        De-duplicated results, best first
+    """
+    merged: Dict[str, Dict[str, Any]] = {}
+    scores: Dict[str, float] = {}
+    aliases: Dict[str, str] = {}
+
+    for ranking in rankings:
+        for rank, result in enumerate(ranking):
+            url_key = normalize_url(result.get("url", ""))
+            text_key = content_hash(result.get("content", ""))
+            key = aliases.get(url_key) if url_key else None
+            key = key or aliases.get(text_key) or url_key or text_key
+            if key not in merged:
+                merged[key] = dict(result)
+                scores[key] = 0.0
+            scores[key] += 1.0 / (k + rank + 1)
+            if url_key:
+                aliases.setdefault(url_key, key)
+            aliases.setdefault(text_key, key)
+
+    ordered = sorted(merged, key=lambda key: (-scores[key], -float(merged[key].get("score") or 0.0)))
+    results = []
+    for key in ordered[:limit]:
+        result = merged[key]
+        result["rrf_score"] = round(scores[key], 6)
+        results.append(result)
+    return results
+
+
+def dedupe_results(results: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Keep the first result per normalized URL and per content hash, preserving order."""
+    seen = set()
+    unique = []
+    for result in results:
+        keys = {normalize_url(result.get("url", "")), content_hash(result.get("content", ""))} - {""}
+        if keys & seen:
+            continue
+        seen |= keys
+        unique.append(result)
+    return unique
+
+
+def format_results(results: Sequence[Dict[str, Any]], start: int = 1) -> str:
+    """Render results as numbered, citable passages for an LLM prompt."""
+    blocks = []
+    for i, result in enumerate(results, start=start):
+        title = result.get("title") or result.get("url") or f"Source {i}"
+        blocks.append(f"[{i}] {title} ({result.get('url', '')})\n{result.get('content', '')}")
+    return "\n\n".join(blocks)
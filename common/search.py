@@ -0,0 +1,337 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence
+
+from common.index import IndexConfig, LocalIndex
+from common.metrics import LatencyTracker
+from common.resilience import ResilienceConfig, ResilientCaller
+from common.results import dedupe_results, reciprocal_rank_fusion
+from common.tavily import TAVILY_BASE_URL, tavily_search
+
+SEARCH_MODES = ("fallback", "race", "merge")
+
+
+class SearchProvider:
+    """
+    A search backend returning Tavily-shaped responses.
+
+    ``search`` returns ``{"query": ..., "results": [...]}`` where each result
+    has ``title``, ``url``, ``content`` and ``score``; providers may add
+    other keys (Tavily adds ``images``). Blocking callers use ``search_sync``.
+    ``remote`` providers get retries, hedging and a circuit breaker.
+    """
+
+    name = "provider"
+    remote = True
+
+    async def search(self, query: str, max_results: int = 10, **options: Any) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def search_sync(self, query: str, max_results: int = 10, **options: Any) -> Dict[str, Any]:
+        raise NotImplementedError(f"{self.name} has no blocking search")
+
+    def warm_up(self) -> None:
+        """Do expensive one-off setup ahead of the first search (blocking)."""
+
+
+class TavilyProvider(SearchProvider):
+    """
+    Tavily over the shared pooled client, or over the blocking SDK for ``search_sync``.
+
+    Args:
+        client: Returns the shared ``httpx.AsyncClient`` (resolved per call, since pools start lazily)
+        api_key: Tavily API key
+        base_url: Override to point at a local stub server
+        sdk: Optional ``TavilyClient`` for blocking callers
+        **defaults: Tavily parameters sent with every search (search_depth, include_images, ...)
+    """
+
+    name = "tavily"
+
+    def __init__(self, client: Callable[[], Any], api_key: str, base_url: str = TAVILY_BASE_URL,
+                 sdk: Any = None, **defaults: Any):
+        self.client = client
+        self.api_key = api_key
+        self.base_url = base_url
+        self.sdk = sdk
+        self.defaults = defaults
+
+    async def search(self, query: str, max_results: int = 10, **options: Any) -> Dict[str, Any]:
+        return await tavily_search(self.client(), api_key=self.api_key, query=query, max_results=max_results,
+                                   base_url=self.base_url, **{**self.defaults, **options})
+
+    def search_sync(self, query: str, max_results: int = 10, **options: Any) -> Dict[str, Any]:
+        if self.sdk is None:
+            return super().search_sync(query, max_results, **options)
+        return self.sdk.search(query=query, max_results=max_results, include_answer=False,
+                               include_raw_content=False, **{**self.defaults, **options})
+
+
+class LocalProvider(SearchProvider):
+    """
+    Offline search over a directory of ``.md``, ``.txt`` and ``.html`` files,
+    backed by a ``LocalIndex`` (BM25, optionally fused with dense vectors).
+    The index is built on the first search and picks up changed files every
+    ``refresh_interval`` seconds.
+    """
+
+    name = "local"
+    remote = False
+
+    def __init__(self, path: str, index_dir: Optional[str] = None, dense: bool = False,
+                 refresh_interval: float = 60.0, passage_chars: int = 1200):
+        self.index = LocalIndex(IndexConfig(path=path, index_dir=index_dir, dense=dense,
+                                            refresh_interval=refresh_interval, passage_chars=passage_chars))
+
+    def search_sync(self, query: str, max_results: int = 10, **options: Any) -> Dict[str, Any]:
+        return {"query": query, "results": self.index.search(query, max_results)}
+
+    async def search(self, query: str, max_results: int = 10, **options: Any) -> Dict[str, Any]:
+        # Off the event loop: a search is milliseconds, but a refresh may re-index files
+        return await asyncio.get_running_loop().run_in_executor(None, self.search_sync, query, max_results)
+
+    def warm_up(self) -> None:
+        self.index.refresh()
+
+    def stats(self) -> Dict[str, Any]:
+        return self.index.stats()
+
+
+_PROVIDERS: Dict[str, Callable[..., SearchProvider]] = {}
+
+
+def register_provider(name: str, factory: Callable[..., SearchProvider]) -> None:
+    """Make a provider available to ``create_provider`` (and so to the ``SEARCH_PROVIDERS`` setting)."""
+    _PROVIDERS[name] = factory
+
+
+def create_provider(name: str, **kwargs: Any) -> SearchProvider:
+    if name not in _PROVIDERS:
+        raise ValueError(f"Unknown search provider {name!r}; registered: {', '.join(sorted(_PROVIDERS))}")
+    return _PROVIDERS[name](**kwargs)
+
+
+register_provider("tavily", TavilyProvider)
+register_provider("local", LocalProvider)
+
+
+def _good(result: Dict[str, Any]) -> bool:
+    return bool((result.get("content") or "").strip()) and bool(result.get("url") or result.get("title"))
+
+
+class SearchBackend:
+    """
+    Query one or several ``SearchProvider``s.
+
+    Modes:
+        fallback: the first provider, moving to the next one only on errors
+        race: all providers at once; returns as soon as ``race_min_results``
+            good results have arrived, cancelling the slower providers
+        merge: all providers at once, waiting up to ``merge_timeout``, then
+            fusing the rankings with reciprocal-rank fusion
+
+    Args:
+        providers: Providers in order of preference
+        mode: One of ``SEARCH_MODES``
+        race_min_results: Good results that end a race; 0 means ``max_results``
+        merge_timeout: Seconds to wait for slow providers in merge mode
+        resilience: Retry/hedge/breaker settings for remote providers
+        before_attempt: Awaited with the provider name before every remote attempt (rate limits)
+        before_attempt_sync: Called the same way before every attempt of ``search_sync``
+    """
+
+    def __init__(self, providers: Sequence[SearchProvider], mode: str = "fallback", race_min_results: int = 0,
+                 merge_timeout: float = 10.0, resilience: Optional[ResilienceConfig] = None,
+                 before_attempt: Optional[Callable[[str], Awaitable[None]]] = None,
+                 before_attempt_sync: Optional[Callable[[str], None]] = None):
+        if not providers:
+            raise ValueError("At least one search provider is required")
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode {mode!r}; expected one of {', '.join(SEARCH_MODES)}")
+        self.providers = list(providers)
+        self.mode = mode if len(self.providers) > 1 else "fallback"
+        self.race_min_results = race_min_results
+        self.merge_timeout = merge_timeout
+        self.before_attempt = before_attempt
+        self.before_attempt_sync = before_attempt_sync
+        self.callers = {
+            p.name: ResilientCaller(p.name, resilience or ResilienceConfig()) for p in self.providers if p.remote
+        }
+        self.counts = {p.name: {"calls": 0, "errors": 0, "results": 0, "wins": 0} for p in self.providers}
+        self.latency = {p.name: LatencyTracker(window=512) for p in self.providers}
+
+    @property
+    def key(self) -> str:
+        """Identifies the provider set in cache keys; a lone Tavily keeps the historical key."""
+        names = "+".join(p.name for p in self.providers)
+        return names if self.mode == "fallback" and len(self.providers) == 1 else f"{self.mode}:{names}"
+
+    async def _call(self, provider: SearchProvider, query: str, max_results: int, **options: Any) -> Dict[str, Any]:
+        counts = self.counts[provider.name]
+        counts["calls"] += 1
+        start = time.monotonic()
+
+        async def attempt():
+            if self.before_attempt is not None:
+                await self.before_attempt(provider.name)
+            return await provider.search(query, max_results, **options)
+
+        try:
+            caller = self.callers.get(provider.name)
+            response = await (caller.call(attempt) if caller is not None else attempt())
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            counts["errors"] += 1
+            raise
+        self.latency[provider.name].observe(time.monotonic() - start)
+        for result in response.get("results", []):
+            result.setdefault("provider", provider.name)
+        counts["results"] += len(response.get("results", []))
+        return response
+
+    def _call_sync(self, provider: SearchProvider, query: str, max_results: int, **options: Any) -> Dict[str, Any]:
+        counts = self.counts[provider.name]
+        counts["calls"] += 1
+        start = time.monotonic()
+        try:
+            caller = self.callers.get(provider.name)
+
+            def attempt():
+                if self.before_attempt_sync is not None:
+                    self.before_attempt_sync(provider.name)
+                return provider.search_sync(query, max_results, **options)
+
+            response = caller.call_sync(attempt) if caller is not None else attempt()
+        except Exception:
+            counts["errors"] += 1
+            raise
+        self.latency[provider.name].observe(time.monotonic() - start)
+        for result in response.get("results", []):
+            result.setdefault("provider", provider.name)
+        counts["results"] += len(response.get("results", []))
+        return response
+
+    async def search(self, query: str, max_results: int = 10, **options: Any) -> Dict[str, Any]:
+        """Search in the configured mode; raises the last provider error if every provider failed."""
+        if self.mode == "race":
+            return await self._race(query, max_results, **options)
+        if self.mode == "merge":
+            return await self._merge(query, max_results, **options)
+        error: Optional[Exception] = None
+        for provider in self.providers:
+            try:
+                response = await self._call(provider, query, max_results, **options)
+            except Exception as e:
+                error = e
+                print(f"Search provider {provider.name} failed: {e}")
+                continue
+            self.counts[provider.name]["wins"] += 1
+            return response
+        raise error
+
+    def search_sync(self, query: str, max_results: int = 10, **options: Any) -> Dict[str, Any]:
+        """Blocking search: providers are tried one after another; merge mode fuses all that answer."""
+        responses, error = [], None
+        for provider in self.providers:
+            try:
+                responses.append((provider, self._call_sync(provider, query, max_results, **options)))
+            except Exception as e:
+                error = e
+                print(f"Search provider {provider.name} failed: {e}")
+                continue
+            if self.mode != "merge":
+                break
+        if not responses:
+            raise error
+        for provider, _ in responses:
+            self.counts[provider.name]["wins"] += 1
+        return self._combine(query, responses, max_results)
+
+    async def _race(self, query: str, max_results: int, **options: Any) -> Dict[str, Any]:
+        needed = min(self.race_min_results or max_results, max_results)
+        tasks = {
+            asyncio.ensure_future(self._call(provider, query, max_results, **options)): provider
+            for provider in self.providers
+        }
+        responses, good, error = [], [], None
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        print(f"Search provider {tasks[task].name} failed: {error}")
+                        continue
+                    response = task.result()
+                    responses.append((tasks[task], response))
+                    good = dedupe_results(good + [r for r in response.get("results", []) if _good(r)])
+                if len(good) >= needed:
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+        if not responses:
+            raise error
+        # Providers that contributed a good result before the cut count as winners
+        winners = {r["provider"] for r in good[:max_results]}
+        for provider, _ in responses:
+            if provider.name in winners:
+                self.counts[provider.name]["wins"] += 1
+        combined = self._combine(query, responses, max_results)
+        combined["results"] = good[:max_results]
+        return combined
+
+    async def _merge(self, query: str, max_results: int, **options: Any) -> Dict[str, Any]:
+        tasks = {
+            asyncio.ensure_future(self._call(provider, query, max_results, **options)): provider
+            for provider in self.providers
+        }
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.merge_timeout)
+        finally:
+            for task in tasks:
+                task.cancel()
+        responses, error = [], None
+        for task, provider in tasks.items():
+            if task not in done:
+                print(f"Search provider {provider.name} timed out after {self.merge_timeout}s")
+            elif task.exception() is not None:
+                error = task.exception()
+                print(f"Search provider {provider.name} failed: {error}")
+            else:
+                responses.append((provider, task.result()))
+                self.counts[provider.name]["wins"] += 1
+        if not responses:
+            raise error or asyncio.TimeoutError(f"No search provider answered within {self.merge_timeout}s")
+        return self._combine(query, responses, max_results)
+
+    def _combine(self, query: str, responses, max_results: int) -> Dict[str, Any]:
+        """One response from several: extra keys of the first answer, RRF-fused results, all images."""
+        if len(responses) == 1:
+            return responses[0][1]
+        combined = dict(responses[0][1])
+        combined["query"] = query
+        combined["results"] = reciprocal_rank_fusion([r.get("results", []) for _, r in responses], limit=max_results)
+        images = [image for _, r in responses for image in r.get("images") or []]
+        if images:
+            combined["images"] = images
+        return combined
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "providers": {
+                p.name: {**self.counts[p.name], "latency": self.latency[p.name].stats(),
+                         **({"index": p.stats()} if hasattr(p, "stats") else {})}
+                for p in self.providers
+            },
+        }
+
+    def warm_up(self) -> None:
+        for provider in self.providers:
+            provider.warm_up()
+
+    def resilience_stats(self) -> Dict[str, Any]:
+        return {name: caller.stats() for name, caller in self.callers.items()}
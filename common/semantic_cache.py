@@ -0,0 +1,364 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Protocol, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"[^\W_]+", re.UNICODE)
+_CJK_RE = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]")
+_NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)*")
+
+# Words that carry little meaning for "is this the same question"
+_STOPWORDS = frozenset("""
+a an the is are was were be been am do does did i you we they he she it me my our your
+to of in on for at by with about as and or but if so should would could can will shall
+what which who whom how why when where whether there this that these those please tell
+""".split())
+_SUFFIXES = ("ing", "edly", "ed", "ies", "es", "ly", "s")
+
+
+def _stem(word: str) -> str:
+    for suffix in _SUFFIXES:
+        if len(word) > len(suffix) + 2 and word.endswith(suffix):
+            return word[: -len(suffix)]
+    return word
+
+
+def _word_features(word: str) -> List[Tuple[str, float]]:
+    """Features of one casefolded word: stem and trigrams, CJK bigrams, or none for a stopword."""
+    if _CJK_RE.search(word):
+        # No word boundaries in CJK text: use character bigrams instead
+        return [(f"b:{word[i:i + 2]}", 1.0) for i in range(max(len(word) - 1, 1))]
+    if word in _STOPWORDS:
+        return []
+    stem = _stem(word)
+    padded = f"#{stem}#"
+    return [(f"w:{stem}", 1.0)] + [(f"c:{padded[i:i + 3]}", 0.3) for i in range(len(padded) - 2)]
+
+
+def _features(text: str) -> List[Tuple[str, float]]:
+    return [feature for word in _WORD_RE.findall(text.casefold()) for feature in _word_features(word)]
+
+
+def _key_terms(text: str) -> Tuple[FrozenSet[str], FrozenSet[str], FrozenSet[str]]:
+    """Numbers, capitalised names and all stemmed words of ``text``."""
+    numbers = frozenset(match.replace(",", "") for match in _NUMBER_RE.findall(text))
+    names = set()
+    words = set()
+    for word in _WORD_RE.findall(text):
+        folded = word.casefold()
+        stem = _stem(folded)
+        words.add(stem)
+        if word[0].isupper() and folded not in _STOPWORDS:
+            names.add(stem)
+    return numbers, frozenset(names), frozenset(words)
+
+
+def terms_match(query: str, other: str) -> bool:
+    """
+    Whether two similar queries also agree on the details a paraphrase keeps:
+    the same numbers (years, amounts, versions), and each capitalised name in
+    one appears in the other. Embedding similarity alone scores "population
+    of china in 2020" against "... in 2023" (0.75) about as high as a real
+    paraphrase such as "is tesla worth buying" / "should I buy a tesla" (0.81).
+    """
+    numbers, names, words = _key_terms(query)
+    other_numbers, other_names, other_words = _key_terms(other)
+    return numbers == other_numbers and names <= other_words and other_names <= words
+
+
+class HashingEmbedder:
+    """
+    Local, CPU-only text embedding via feature hashing of stemmed words and
+    character trigrams. Cheap enough to run on every request.
+
+    Stemming and hashing are the slow part, and a corpus repeats the same
+    words over and over, so each word's bucket indices and signed weights
+    are memoised (up to ``cache_size`` words). A batch is then summed into
+    its vectors with a single ``np.bincount``.
+    """
+
+    def __init__(self, dim: int = 512, cache_size: int = 200_000):
+        self.dim = dim
+        self.cache_size = cache_size
+        self._cache: Dict[str, Tuple[Tuple[int, ...], Tuple[float, ...]]] = {}
+
+    def _bucket(self, feature: str) -> Tuple[int, float]:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        return value % self.dim, 1.0 if (value >> 63) & 1 else -1.0
+
+    def _hashed(self, word: str) -> Tuple[Tuple[int, ...], Tuple[float, ...]]:
+        indices, values = [], []
+        for feature, weight in _word_features(word):
+            index, sign = self._bucket(feature)
+            indices.append(index)
+            values.append(sign * weight)
+        if len(self._cache) >= self.cache_size:
+            self._cache.clear()
+        hashed = self._cache[word] = (tuple(indices), tuple(values))
+        return hashed
+
+    def __call__(self, texts: Sequence[str]) -> np.ndarray:
+        cache = self._cache
+        rows: List[int] = []
+        words: List[Tuple[Tuple[int, ...], Tuple[float, ...]]] = []
+        for row, text in enumerate(texts):
+            for word in _WORD_RE.findall(text.casefold()):
+                words.append(cache.get(word) or self._hashed(word))
+                rows.append(row)
+        indices = np.fromiter(chain.from_iterable(w[0] for w in words), dtype=np.int64)
+        values = np.fromiter(chain.from_iterable(w[1] for w in words), dtype=np.float64)
+        lengths = np.fromiter((len(w[0]) for w in words), dtype=np.int64, count=len(words))
+        indices += np.repeat(np.asarray(rows, dtype=np.int64) * self.dim, lengths)
+        vectors = np.bincount(indices, weights=values, minlength=len(texts) * self.dim)
+        vectors = vectors.astype(np.float32).reshape(len(texts), self.dim)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+class VectorIndex(Protocol):
+    """Nearest-neighbour index over unit vectors; implement this to plug in an ANN library."""
+
+    def add(self, key: str, vector: np.ndarray) -> None: ...
+
+    def remove(self, key: str) -> None: ...
+
+    def search(self, vector: np.ndarray, k: int = 1) -> List[Tuple[str, float]]: ...
+
+    def __len__(self) -> int: ...
+
+
+class BruteForceIndex:
+    """Exact cosine search with one matrix-vector product over a contiguous array."""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        self._keys: List[str] = []
+        self._rows: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, key: str, vector: np.ndarray) -> None:
+        if key in self._rows:
+            self._vectors[self._rows[key]] = vector
+            return
+        if len(self._keys) == self._vectors.shape[0]:
+            grown = np.zeros((max(16, 2 * len(self._keys)), self.dim), dtype=np.float32)
+            grown[: len(self._keys)] = self._vectors[: len(self._keys)]
+            self._vectors = grown
+        self._rows[key] = len(self._keys)
+        self._vectors[len(self._keys)] = vector
+        self._keys.append(key)
+
+    def remove(self, key: str) -> None:
+        row = self._rows.pop(key, None)
+        if row is None:
+            return
+        last = len(self._keys) - 1
+        if row != last:
+            # Move the last row into the hole to keep the array dense
+            self._vectors[row] = self._vectors[last]
+            self._keys[row] = self._keys[last]
+            self._rows[self._keys[row]] = row
+        self._keys.pop()
+
+    def search(self, vector: np.ndarray, k: int = 1) -> List[Tuple[str, float]]:
+        if not self._keys:
+            return []
+        scores = self._vectors[: len(self._keys)] @ vector
+        k = min(k, len(self._keys))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self._keys[i], float(scores[i])) for i in top]
+
+
+@dataclass
+class CachedAnswer:
+    query: str
+    answer: str
+    sources: Any
+    locale: str
+    similarity: float = 1.0
+    created_at: float = field(default_factory=time.time)
+
+
+@dataclass
+class SemanticCacheConfig:
+    threshold: float = 0.8
+    match_terms: bool = True  # Also require the same numbers and names (see terms_match)
+    ttl: float = 3600.0
+    max_entries: int = 2048  # Per locale partition
+    dim: int = 512
+    sync_interval: float = 0.2  # Seconds between reads of answers stored by other workers
+
+
+class _Partition:
+    def __init__(self, index: VectorIndex):
+        self.index = index
+        self.entries: "OrderedDict[str, Tuple[CachedAnswer, float]]" = OrderedDict()
+
+
+class SemanticAnswerCache:
+    """
+    Answer cache keyed on query meaning rather than exact text.
+
+    Queries are embedded locally and matched against earlier queries of the
+    same locale; a neighbour above ``threshold`` returns its stored answer and
+    sources, provided it also mentions the same numbers and names.
+
+    With a ``store`` shared by several worker processes (see
+    ``common.shared``), stored answers are also appended to the store's log.
+    Each worker reads the log into its own index before a lookup, at most
+    every ``sync_interval`` seconds.
+    """
+
+    def __init__(self, config: Optional[SemanticCacheConfig] = None,
+                 embedder: Optional[Callable[[Sequence[str]], np.ndarray]] = None,
+                 index_factory: Optional[Callable[[int], VectorIndex]] = None, store: Any = None):
+        self.config = config or SemanticCacheConfig()
+        self.embedder = embedder or HashingEmbedder(self.config.dim)
+        self.index_factory = index_factory or BruteForceIndex
+        self.shared = store
+        self._partitions: Dict[str, _Partition] = {}
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._cursor: Any = None
+        self._synced_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.synced = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.term_mismatches = 0
+
+    def _partition(self, locale: str) -> _Partition:
+        partition = self._partitions.get(locale)
+        if partition is None:
+            partition = self._partitions[locale] = _Partition(self.index_factory(self.config.dim))
+        return partition
+
+    def _drop(self, partition: _Partition, key: str) -> None:
+        partition.entries.pop(key, None)
+        partition.index.remove(key)
+
+    def _sync(self) -> None:
+        """Add the answers other workers stored since the last read."""
+        if self.shared is None or time.monotonic() - self._synced_at < self.config.sync_interval:
+            return
+        # Lookups run on threads; one of them reading the log is enough
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        self._synced_at = time.monotonic()
+        try:
+            while True:
+                entries, self._cursor = self.shared.read("answers", self._cursor)
+                for entry in entries:
+                    if entry["pid"] != os.getpid() and entry["expires_at"] > time.time():
+                        answer = CachedAnswer(entry["query"], entry["answer"], entry["sources"], entry["locale"],
+                                              created_at=entry["created_at"])
+                        self._insert(answer, self.embedder([answer.query])[0], entry["expires_at"])
+                        self.synced += 1
+                if not entries:
+                    break
+        except Exception as e:
+            logger.warning("Could not read shared answers: %s", e)
+        finally:
+            self._sync_lock.release()
+
+    def lookup(self, query: str, locale: str = "en") -> Optional[CachedAnswer]:
+        self._sync()
+        vector = self.embedder([query])[0]
+        now = time.time()
+        with self._lock:
+            partition = self._partitions.get(locale)
+            if partition is not None:
+                for key, score in partition.index.search(vector, k=4):
+                    if score < self.config.threshold:
+                        break
+                    answer, expires_at = partition.entries[key]
+                    if now >= expires_at:
+                        self._drop(partition, key)
+                        self.expirations += 1
+                        continue
+                    if self.config.match_terms and not terms_match(query, answer.query):
+                        self.term_mismatches += 1
+                        continue
+                    partition.entries.move_to_end(key)
+                    self.hits += 1
+                    return CachedAnswer(answer.query, answer.answer, answer.sources, locale, score, answer.created_at)
+            self.misses += 1
+            return None
+
+    def store(self, query: str, answer: str, sources: Any = None, locale: str = "en") -> None:
+        if not answer:
+            return
+        cached = CachedAnswer(query, answer, sources, locale)
+        expires_at = time.time() + self.config.ttl
+        self._insert(cached, self.embedder([query])[0], expires_at)
+        self.stores += 1
+        if self.shared is not None:
+            try:
+                self.shared.append("answers", {
+                    "query": query, "answer": answer, "sources": sources, "locale": locale,
+                    "created_at": cached.created_at, "expires_at": expires_at, "pid": os.getpid(),
+                }, max_len=self.config.max_entries * 4)
+            except Exception as e:
+                logger.warning("Could not share answer: %s", e)
+
+    def _insert(self, answer: CachedAnswer, vector: np.ndarray, expires_at: float) -> None:
+        key = hashlib.sha1(f"{answer.locale}\0{answer.query}".encode("utf-8")).hexdigest()
+        with self._lock:
+            partition = self._partition(answer.locale)
+            partition.entries[key] = (answer, expires_at)
+            partition.entries.move_to_end(key)
+            partition.index.add(key, vector)
+            while len(partition.entries) > self.config.max_entries:
+                oldest = next(iter(partition.entries))
+                self._drop(partition, oldest)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "synced": self.synced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "term_mismatches": self.term_mismatches,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "threshold": self.config.threshold,
+            "partitions": {locale: len(p.entries) for locale, p in self._partitions.items()},
+        }
+
+
+def guess_locale(text: str) -> str:
+    """Very rough script-based locale guess for callers that do not know the user's locale."""
+    for char in text:
+        if "぀" <= char <= "ヿ":
+            return "ja"
+        if "가" <= char <= "힯":
+            return "ko"
+    if _CJK_RE.search(text):
+        return "zh"
+    return "en"
+
+
+def chunk_text(text: str, size: int = 1024) -> List[str]:
+    """Split a cached answer into frames for replay over an event stream."""
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
@@ -0,0 +1,125 @@
+import gc
+import logging
+import os
+import signal
+import time
+import traceback
+from typing import Any, Callable, Dict, Optional
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_workers(workers: int) -> int:
+    """``WORKERS`` setting to a process count: -1 means one per CPU."""
+    return (os.cpu_count() or 1) if workers < 0 else workers
+
+
+def _log_to_stderr() -> None:
+    """The apps configure no logging; show the supervisor's messages the way uvicorn shows its own."""
+    if logging.getLogger().handlers or logger.handlers:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(levelname)s:     %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def serve(app: Any, host: str, port: int, workers: int = 1, graceful_timeout: float = 30.0,
+          warm_up: Optional[Callable[[], None]] = None, log_level: str = "info") -> None:
+    """
+    Run ``app`` in production mode: preload once, fork ``workers`` processes.
+
+    The caller has already imported the app, so the graph is compiled, the
+    prompts are parsed and the agents are built before the fork. ``warm_up``
+    runs once here too, e.g. to build a local search index. Each worker
+    inherits all of that copy-on-write and accepts connections on the one
+    listening socket. Sockets cannot cross a fork, so every worker opens its
+    own connection pools in the app's lifespan.
+
+    SIGTERM or SIGINT stops the workers gracefully: they stop accepting,
+    finish in-flight requests for up to ``graceful_timeout`` seconds, then run
+    the lifespan shutdown. Workers that die unexpectedly are replaced.
+    Platforms without ``fork`` run a single worker.
+    """
+    config = uvicorn.Config(app, host=host, port=port, log_level=log_level,
+                            timeout_graceful_shutdown=int(graceful_timeout))
+    sock = config.bind_socket()
+    if warm_up is not None:
+        warm_up()
+    # Keep the preloaded objects out of later collections, so the GC does not
+    # touch (and copy) the pages the workers share
+    gc.collect()
+    gc.freeze()
+
+    if workers <= 1 or not hasattr(os, "fork"):
+        uvicorn.Server(config).run(sockets=[sock])
+        return
+
+    _log_to_stderr()
+    children: Dict[int, float] = {}
+    stopping = False
+
+    def spawn() -> None:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                uvicorn.Server(config).run(sockets=[sock])
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            os._exit(code)
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn()
+    logger.info("Serving on http://%s:%d with %d workers (pids %s)", host, port, workers,
+                ", ".join(map(str, children)))
+
+    fast_exits = 0
+    while not stopping:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            time.sleep(0.2)
+            continue
+        started = children.pop(pid, None)
+        if started is None or stopping:
+            continue
+        # Replace the worker, but give up if workers keep dying right after start
+        fast_exits = fast_exits + 1 if time.monotonic() - started < 5 else 0
+        if fast_exits > workers:
+            logger.error("Workers keep exiting at startup (last status %s); stopping", status)
+            break
+        logger.warning("Worker %d exited with status %s; starting a replacement", pid, status)
+        spawn()
+
+    for pid in children:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    deadline = time.monotonic() + graceful_timeout + 5
+    while children and time.monotonic() < deadline:
+        pid, _ = os.waitpid(-1, os.WNOHANG)
+        if pid:
+            children.pop(pid, None)
+        else:
+            time.sleep(0.1)
+    for pid in children:
+        logger.warning("Worker %d did not stop in time; killing it", pid)
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    sock.close()
@@ -0,0 +1,191 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, List, Optional, Tuple
+
+from common.cache import SQLiteCache
+
+READ_BATCH = 1000
+
+
+class SharedStore:
+    """
+    State shared by the worker processes of one app.
+
+    Besides the ``SQLiteCache`` interface (``get``/``set``/``delete``/``clear``
+    with per-entry expiry), a store offers:
+
+        add: set a key only if it is absent or expired; used as a lease
+        append/read: a bounded append-only log that every worker reads from
+            its own cursor
+
+    Values must be JSON-serialisable. Implementations open their connections
+    per process, so a store created before ``fork()`` works in the workers.
+    """
+
+    def get(self, key: str, now: Optional[float] = None) -> Optional[Tuple[Any, float, float]]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, expires_at: float, stale_until: float) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def add(self, key: str, value: Any, ttl: float) -> bool:
+        raise NotImplementedError
+
+    def append(self, stream: str, value: Any, max_len: int = 10000) -> None:
+        raise NotImplementedError
+
+    def read(self, stream: str, cursor: Any = None) -> Tuple[List[Any], Any]:
+        """Entries appended after ``cursor`` (all retained ones when None), and the new cursor."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteStore(SQLiteCache, SharedStore):
+    """
+    ``SharedStore`` in a SQLite file (WAL mode), for workers on one host.
+
+    Every operation is a single short statement, and SQLite serialises the
+    writers of all processes.
+    """
+
+    def _create(self, conn: sqlite3.Connection) -> None:
+        super()._create(conn)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS log ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, stream TEXT NOT NULL, value TEXT NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS log_stream ON log (stream, id)")
+
+    def add(self, key: str, value: Any, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            # One statement, so two processes cannot both take the key
+            cursor = self._connect().execute(
+                "INSERT INTO cache (key, value, expires_at, stale_until, accessed_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at, "
+                "stale_until = excluded.stale_until, accessed_at = excluded.accessed_at "
+                "WHERE cache.stale_until <= ?",
+                (key, json.dumps(value, ensure_ascii=False), now + ttl, now + ttl, now, now),
+            )
+            return cursor.rowcount == 1
+
+    def append(self, stream: str, value: Any, max_len: int = 10000) -> None:
+        data = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            conn = self._connect()
+            row_id = conn.execute("INSERT INTO log (stream, value) VALUES (?, ?)", (stream, data)).lastrowid
+            self._writes += 1
+            if self._writes % 64 == 0:
+                conn.execute("DELETE FROM log WHERE stream = ? AND id <= ?", (stream, row_id - max_len))
+
+    def read(self, stream: str, cursor: Any = None) -> Tuple[List[Any], Any]:
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT id, value FROM log WHERE stream = ? AND id > ? ORDER BY id LIMIT ?",
+                (stream, cursor or 0, READ_BATCH),
+            ).fetchall()
+        if not rows:
+            return [], cursor
+        return [json.loads(value) for _, value in rows], rows[-1][0]
+
+
+class RedisStore(SharedStore):
+    """
+    ``SharedStore`` on a Redis-protocol server (Redis, Valkey, KeyDB, ...),
+    for workers spread over several hosts. Needs the ``redis`` package.
+
+    Entries expire on the server at ``stale_until``; the log is a stream
+    trimmed to about ``max_len`` entries.
+    """
+
+    def __init__(self, url: str, namespace: str = "aiforge"):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError(f"{url} needs the redis package: pip install redis") from e
+        self._redis = redis
+        self.url = url
+        self.prefix = f"{namespace}:"
+        self._client = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._client is None or self._pid != os.getpid():
+            with self._lock:
+                if self._client is None or self._pid != os.getpid():
+                    self._client = self._redis.Redis.from_url(self.url)
+                    self._pid = os.getpid()
+        return self._client
+
+    def get(self, key: str, now: Optional[float] = None) -> Optional[Tuple[Any, float, float]]:
+        raw = self._connect().get(self.prefix + key)
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        if (time.time() if now is None else now) >= entry["s"]:
+            return None
+        return entry["v"], entry["e"], entry["s"]
+
+    def set(self, key: str, value: Any, expires_at: float, stale_until: float) -> None:
+        data = json.dumps({"v": value, "e": expires_at, "s": stale_until}, ensure_ascii=False)
+        self._connect().set(self.prefix + key, data, px=max(1, int((stale_until - time.time()) * 1000)))
+
+    def delete(self, key: str) -> None:
+        self._connect().delete(self.prefix + key)
+
+    def clear(self) -> None:
+        client = self._connect()
+        for key in client.scan_iter(match=self.prefix + "*", count=500):
+            client.delete(key)
+
+    def add(self, key: str, value: Any, ttl: float) -> bool:
+        now = time.time()
+        data = json.dumps({"v": value, "e": now + ttl, "s": now + ttl}, ensure_ascii=False)
+        return bool(self._connect().set(self.prefix + key, data, nx=True, px=max(1, int(ttl * 1000))))
+
+    def append(self, stream: str, value: Any, max_len: int = 10000) -> None:
+        self._connect().xadd(self.prefix + "log:" + stream, {"v": json.dumps(value, ensure_ascii=False)},
+                             maxlen=max_len, approximate=True)
+
+    def read(self, stream: str, cursor: Any = None) -> Tuple[List[Any], Any]:
+        # "(" makes the start exclusive (Redis 6.2+)
+        entries = self._connect().xrange(self.prefix + "log:" + stream, min=f"({cursor}" if cursor else "-",
+                                         max="+", count=READ_BATCH)
+        if not entries:
+            return [], cursor
+        last = entries[-1][0]
+        return [json.loads(fields[b"v"]) for _, fields in entries], last.decode() if isinstance(last, bytes) else last
+
+    def close(self) -> None:
+        if self._client is not None and self._pid == os.getpid():
+            self._client.close()
+        self._client = None
+
+
+def open_store(url: str, namespace: str = "aiforge") -> SharedStore:
+    """
+    Open a store from a URL: ``redis://``, ``rediss://`` or ``unix://`` for
+    Redis, ``sqlite:///relative.db`` / ``sqlite:////absolute.db`` or a plain
+    path for SQLite. ``namespace`` separates apps sharing one Redis.
+    """
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStore(url, namespace)
+    return SQLiteStore(url[len("sqlite:///"):] if url.startswith("sqlite:///") else url)
+
+
+def default_store_url(namespace: str, port: int) -> str:
+    """A SQLite file in the temp directory, one per app and port."""
+    return "sqlite:///" + os.path.join(tempfile.gettempdir(), f"{namespace}-{port}-shared.db")
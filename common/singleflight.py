@@ -0,0 +1,343 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Lease:
+    """
+    The cross-process half of a flight, kept in a ``common.shared`` store.
+
+    The process that takes the lease runs the call and publishes its result
+    under the lease's token. The other processes watch the lease and pick the
+    result up. If the holder fails or dies, its lease is freed (or expires)
+    and a waiting process takes over.
+    """
+
+    def __init__(self, store: Any, key: str, ttl: float):
+        self.store = store
+        self.key = key
+        self.ttl = ttl
+        self.token = uuid.uuid4().hex
+        self.watching: Optional[str] = None
+
+    def take(self) -> bool:
+        try:
+            return self.store.add(f"lease:{self.key}", self.token, self.ttl)
+        except Exception as e:
+            # Without the store, every process runs its own call
+            logger.warning("Could not take flight lease: %s", e)
+            return True
+
+    def publish(self, value: Any) -> None:
+        expires_at = time.time() + self.ttl
+        try:
+            self.store.set(f"flight:{self.key}:{self.token}", value, expires_at, expires_at)
+        except Exception as e:
+            logger.warning("Could not share flight result: %s", e)
+
+    def release(self) -> None:
+        try:
+            self.store.delete(f"lease:{self.key}")
+        except Exception as e:
+            logger.warning("Could not release flight lease: %s", e)
+
+    def poll(self) -> Optional[tuple]:
+        """``(value,)`` once the current holder has published, else None."""
+        held = self.store.get(f"lease:{self.key}")
+        if held is not None and held[0] != self.token:
+            self.watching = held[0]
+        return self.result()
+
+    def result(self) -> Optional[tuple]:
+        """``(value,)`` if the last holder seen by ``poll`` has published, else None."""
+        if self.watching is None:
+            return None
+        found = self.store.get(f"flight:{self.key}:{self.watching}")
+        return None if found is None else (found[0],)
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent async calls that share a key into one upstream call.
+
+    The first caller for a key runs ``fn``; callers arriving while it is in
+    flight await the same result (or exception). A cancelled caller does not
+    cancel the shared call, unless it was the last one waiting for it.
+
+    With a ``store`` shared by several worker processes, the call is also
+    coalesced across processes. Only one process runs it, and the others
+    poll the store for its result, which must be JSON-serialisable. Errors
+    are not shared: when the running process fails, a waiting one retries.
+    Store calls block, so they run on a thread.
+
+    Args:
+        store: Optional ``common.shared.SharedStore``
+        lease_ttl: Seconds a process may hold a key; waiters run the call themselves after that
+        poll_interval: Seconds before a waiting process first checks the store again
+        max_poll_interval: The wait doubles after every check, up to this many seconds
+    """
+
+    def __init__(self, store: Any = None, lease_ttl: float = 30.0, poll_interval: float = 0.05,
+                 max_poll_interval: float = 0.5):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self._waiters: Dict[asyncio.Future, int] = {}
+        self.store = store
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.leaders = 0
+        self.joiners = 0
+        self.abandoned = 0
+        self.remote_joins = 0
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._calls.get(key)
+        if future is not None:
+            self.joiners += 1
+        else:
+            self.leaders += 1
+            future = asyncio.ensure_future(fn() if self.store is None else self._shared(key, fn))
+            self._calls[key] = future
+            future.add_done_callback(lambda done: self._forget(key, done))
+
+        self._waiters[future] = self._waiters.get(future, 0) + 1
+        try:
+            # Shield so a cancelled caller does not cancel the call others still wait for
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if self._waiters[future] == 1 and not future.done():
+                # Nobody is left to use the result; stop the upstream work. Forget
+                # the call first, so a caller arriving before the cancellation
+                # lands starts a new call instead of joining this one.
+                self.abandoned += 1
+                self._forget(key, future)
+                future.cancel()
+            raise
+        finally:
+            self._waiters[future] -= 1
+            if not self._waiters[future]:
+                del self._waiters[future]
+
+    def _forget(self, key: str, future: asyncio.Future) -> None:
+        if self._calls.get(key) is future:
+            del self._calls[key]
+
+    async def _shared(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        lease = _Lease(self.store, key, self.lease_ttl)
+        deadline = time.monotonic() + self.lease_ttl
+        delay = self.poll_interval
+        while not await self._take(lease):
+            found = await asyncio.to_thread(lease.poll)
+            if found is not None:
+                self.remote_joins += 1
+                return found[0]
+            if time.monotonic() >= deadline:
+                return await fn()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_poll_interval)
+        # The holder may have published and released between the last poll and our take
+        found = await asyncio.to_thread(lease.result)
+        if found is not None:
+            await asyncio.to_thread(lease.release)
+            self.remote_joins += 1
+            return found[0]
+        try:
+            value = await fn()
+            await asyncio.to_thread(lease.publish, value)
+            return value
+        finally:
+            await asyncio.to_thread(lease.release)
+
+    @staticmethod
+    async def _take(lease: _Lease) -> bool:
+        taking = asyncio.ensure_future(asyncio.to_thread(lease.take))
+        try:
+            return await asyncio.shield(taking)
+        except asyncio.CancelledError:
+            # The take still completes on its thread; free the lease rather than
+            # leave the other processes waiting out its TTL
+            def release(done: asyncio.Future) -> None:
+                if not done.cancelled() and done.result():
+                    asyncio.get_running_loop().run_in_executor(None, lease.release)
+
+            taking.add_done_callback(release)
+            raise
+
+    def stats(self) -> Dict[str, int]:
+        return {"leaders": self.leaders, "joiners": self.joiners, "abandoned": self.abandoned,
+                "remote_joins": self.remote_joins, "in_flight": self.in_flight()}
+
+
+class _SyncCall:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SyncSingleFlight:
+    """Thread-based counterpart of ``SingleFlight`` for blocking call sites."""
+
+    def __init__(self, store: Any = None, lease_ttl: float = 30.0, poll_interval: float = 0.05,
+                 max_poll_interval: float = 0.5):
+        self._calls: Dict[str, _SyncCall] = {}
+        self._lock = threading.Lock()
+        self.store = store
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.leaders = 0
+        self.joiners = 0
+        self.remote_joins = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _SyncCall()
+                self.leaders += 1
+            else:
+                self.joiners += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn() if self.store is None else self._shared(key, fn)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _shared(self, key: str, fn: Callable[[], Any]) -> Any:
+        lease = _Lease(self.store, key, self.lease_ttl)
+        deadline = time.monotonic() + self.lease_ttl
+        delay = self.poll_interval
+        while not lease.take():
+            found = lease.poll()
+            if found is not None:
+                self.remote_joins += 1
+                return found[0]
+            if time.monotonic() >= deadline:
+                return fn()
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_poll_interval)
+        # The holder may have published and released between the last poll and our take
+        found = lease.result()
+        if found is not None:
+            lease.release()
+            self.remote_joins += 1
+            return found[0]
+        try:
+            value = fn()
+            lease.publish(value)
+            return value
+        finally:
+            lease.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {"leaders": self.leaders, "joiners": self.joiners, "remote_joins": self.remote_joins,
+                "in_flight": len(self._calls)}
+
+
+class _Broadcast:
+    def __init__(self):
+        self.chunks: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Event()
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def notify(self) -> None:
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class StreamFanout:
+    """
+    Share one upstream async stream between concurrent identical requests.
+
+    The first subscriber for a key starts ``factory()``; every chunk it yields
+    is buffered, so late joiners first replay what was already produced and
+    then follow the live stream. The upstream is cancelled when the last
+    subscriber goes away before it finishes.
+    """
+
+    def __init__(self):
+        self._streams: Dict[str, _Broadcast] = {}
+        self.started = 0
+        self.joins = 0
+        self.replayed_chunks = 0
+
+    def in_flight(self) -> int:
+        return len(self._streams)
+
+    async def _produce(self, key: str, broadcast: _Broadcast, factory: Callable[[], AsyncIterator[Any]]) -> None:
+        try:
+            async for chunk in factory():
+                broadcast.chunks.append(chunk)
+                broadcast.notify()
+        except BaseException as e:
+            broadcast.error = e
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            broadcast.done = True
+            if self._streams.get(key) is broadcast:
+                del self._streams[key]
+            broadcast.notify()
+
+    async def subscribe(self, key: str, factory: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            broadcast = self._streams[key] = _Broadcast()
+            broadcast.task = asyncio.create_task(self._produce(key, broadcast, factory))
+            self.started += 1
+        else:
+            self.joins += 1
+            self.replayed_chunks += len(broadcast.chunks)
+
+        broadcast.subscribers += 1
+        position = 0
+        try:
+            while True:
+                while position < len(broadcast.chunks):
+                    yield broadcast.chunks[position]
+                    position += 1
+                if broadcast.done:
+                    if broadcast.error is not None and not isinstance(broadcast.error, asyncio.CancelledError):
+                        raise broadcast.error
+                    return
+                await broadcast.changed.wait()
+        finally:
+            broadcast.subscribers -= 1
+            if broadcast.subscribers == 0 and not broadcast.done and broadcast.task is not None:
+                # Nobody is listening any more; new requests must start afresh
+                if self._streams.get(key) is broadcast:
+                    del self._streams[key]
+                broadcast.task.cancel()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "streams_started": self.started,
+            "joins": self.joins,
+            "replayed_chunks": self.replayed_chunks,
+            "in_flight": self.in_flight(),
+        }
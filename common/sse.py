@@ -0,0 +1,173 @@
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, NamedTuple, Optional, Tuple, Union
+
+try:
+    import orjson
+except ImportError:  # Optional speed-up
+    orjson = None
+
+
+def dumps(data: Any, ensure_ascii: bool = False) -> str:
+    """Serialize to JSON, with orjson when it is installed (it always writes UTF-8)."""
+    if orjson is not None and not ensure_ascii:
+        try:
+            return orjson.dumps(data).decode("utf-8")
+        except TypeError:
+            pass  # e.g. integers wider than 64 bits; let json handle them
+    return json.dumps(data, ensure_ascii=ensure_ascii)
+
+
+class TextDelta(NamedTuple):
+    """
+    A piece of streamed text. Consecutive deltas with the same ``event`` and
+    ``fields`` may be merged into one SSE event by ``coalesce``.
+
+    With ``fields`` the event data is ``{"chunk": text, **fields}``; without,
+    it is the text itself as a JSON string.
+    """
+    event: str
+    text: str
+    fields: Optional[Tuple[Tuple[str, Any], ...]] = None
+
+
+class SSEEncoder:
+    """
+    Encode server-sent events.
+
+    The static part of each event (the ``event:`` line, and for text deltas
+    the JSON around the text) is serialized once and cached, so a token
+    costs one string serialization.
+    """
+
+    def __init__(self, ensure_ascii: bool = False):
+        self.ensure_ascii = ensure_ascii
+        self._prefixes: Dict[str, str] = {}
+        self._delta_frames: Dict[Tuple[str, Any], Tuple[str, str]] = {}
+
+    def _prefix(self, event: str) -> str:
+        prefix = self._prefixes.get(event)
+        if prefix is None:
+            prefix = self._prefixes[event] = f"event: {event}\ndata: "
+        return prefix
+
+    def encode(self, event: str, data: Any) -> str:
+        return f"{self._prefix(event)}{dumps(data, self.ensure_ascii)}\n\n"
+
+    def delta(self, delta: TextDelta) -> str:
+        key = (delta.event, delta.fields)
+        frame = self._delta_frames.get(key)
+        if frame is None:
+            if delta.fields is None:
+                frame = (self._prefix(delta.event), "\n\n")
+            else:
+                # Serialize around a placeholder and split there: {"chunk": <text>, ...fields}
+                marker = "\x00"
+                template = dumps({"chunk": marker, **dict(delta.fields)}, self.ensure_ascii)
+                head, tail = template.split(dumps(marker, self.ensure_ascii), 1)
+                frame = (self._prefix(delta.event) + head, tail + "\n\n")
+            self._delta_frames[key] = frame
+        head, tail = frame
+        return f"{head}{dumps(delta.text, self.ensure_ascii)}{tail}"
+
+
+async def coalesce(source: AsyncIterator[Union[str, TextDelta]], encoder: SSEEncoder,
+                   interval: float = 0.02, max_bytes: int = 512) -> AsyncIterator[str]:
+    """
+    Batch a stream of SSE frames into fewer, larger writes.
+
+    ``source`` yields encoded frames (``str``) and ``TextDelta`` pieces.
+    Adjacent deltas of the same kind are merged into one event, and output is
+    flushed once ``max_bytes`` are buffered or ``interval`` seconds after the
+    first buffered delta. Encoded frames (sources, final results, errors) and
+    the first delta of the stream are flushed right away.
+
+    Args:
+        source: Frames to send, in order
+        encoder: Encoder for the merged deltas
+        interval: Longest time a delta waits for company; 0 disables batching
+        max_bytes: Buffered size that forces a flush
+    """
+    iterator = source.__aiter__()
+    if interval <= 0:
+        async for item in iterator:
+            yield encoder.delta(item) if isinstance(item, TextDelta) else item
+        return
+
+    loop = asyncio.get_running_loop()
+    out = []  # Encoded frames waiting to be written
+    out_bytes = 0
+    pending: Optional[TextDelta] = None  # Delta still growing
+    pending_parts = []
+    deadline = None
+    sent_delta = False
+    next_item = None
+
+    def take_pending():
+        nonlocal pending, pending_parts, out_bytes
+        if pending is not None:
+            frame = encoder.delta(pending._replace(text="".join(pending_parts)))
+            out.append(frame)
+            # The text was counted as it arrived; add the framing around it
+            out_bytes += len(frame) - sum(map(len, pending_parts))
+            pending, pending_parts = None, []
+
+    def flush() -> str:
+        nonlocal out, out_bytes, deadline
+        take_pending()
+        data = "".join(out)
+        out, out_bytes, deadline = [], 0, None
+        return data
+
+    try:
+        while True:
+            if next_item is None:
+                next_item = asyncio.ensure_future(iterator.__anext__())
+            timeout = None if deadline is None else max(deadline - loop.time(), 0)
+            done, _ = await asyncio.wait({next_item}, timeout=timeout)
+            if not done:
+                # Interval elapsed while waiting for more; send what we have
+                yield flush()
+                continue
+            try:
+                item = next_item.result()
+            except StopAsyncIteration:
+                break
+            finally:
+                if next_item.done():
+                    next_item = None
+
+            if isinstance(item, TextDelta):
+                if pending is not None and (pending.event, pending.fields) != (item.event, item.fields):
+                    take_pending()
+                if pending is None:
+                    pending = item
+                pending_parts.append(item.text)
+                out_bytes += len(item.text)
+                if not sent_delta:
+                    # Don't hold back the first token
+                    sent_delta = True
+                    yield flush()
+                    continue
+                if deadline is None:
+                    deadline = loop.time() + interval
+            else:
+                take_pending()
+                out.append(item)
+                out_bytes += len(item)
+                yield flush()
+                continue
+
+            if out_bytes >= max_bytes:
+                yield flush()
+
+        if out or pending is not None:
+            yield flush()
+    finally:
+        if next_item is not None:
+            next_item.cancel()
+            # The source can only be closed once its pending step has unwound
+            await asyncio.gather(next_item, return_exceptions=True)
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
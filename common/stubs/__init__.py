@@ -0,0 +1,3 @@
+"""
+Local stand-ins for upstream services, used for benchmarking and offline runs.
+"""
@@ -0,0 +1,185 @@
+"""
+A minimal OpenAI-compatible ``/v1/chat/completions`` server.
+
+Streams a fixed or generated reply token by token, and records when each
+stream finishes or is closed by the client. Like OpenAI's prompt caching,
+it reports ``cached_tokens`` for prompt prefixes it has seen before, and can
+charge a prefill delay for the uncached rest. Run it with
+``python -m common.stubs.openai --port 8766`` from the repository root and set
+``OPENAI_BASE_URL=http://127.0.0.1:8766/v1`` in the app under test.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def default_reply(tokens: int) -> List[str]:
+    return [f"token{i} " for i in range(tokens)]
+
+
+def create_app(token_delay: float = 0.0, first_token_delay: float = 0.0, tokens: int = 64,
+               reply: Optional[str] = None, failure_rate: float = 0.0, failure_status: int = 503,
+               seed: Optional[int] = None, prefill_delay: float = 0.0, prefix_cache: bool = True,
+               cache_block: int = 128, cache_min_tokens: int = 1024, cache_entries: int = 100000) -> FastAPI:
+    """
+    Build the stub app.
+
+    Args:
+        token_delay: Seconds between streamed tokens
+        first_token_delay: Seconds before the first token
+        tokens: Number of tokens in a generated reply
+        reply: Fixed reply text, split on spaces; generated when omitted
+        failure_rate: Fraction of requests answered with ``failure_status`` before streaming
+        failure_status: HTTP status of injected failures
+        seed: Seed for the fault injection, for repeatable runs
+        prefill_delay: Seconds per 1000 uncached prompt tokens, added before the first token
+        prefix_cache: Serve repeated prompt prefixes from a simulated cache
+        cache_block: Cached prefixes grow in blocks of this many tokens
+        cache_min_tokens: Shorter prompts are never cached
+        cache_entries: Cached blocks kept, least recently used dropped first
+
+    Tokens are estimated as four characters each.
+
+    ``app.state.streams`` holds one record per streamed completion with its
+    ``started``/``ended`` times (``time.monotonic()``), the number of tokens
+    sent and whether it ``completed`` or was closed early by the client.
+    """
+    app = FastAPI(title="OpenAI stub")
+    app.state.token_delay = token_delay
+    app.state.first_token_delay = first_token_delay
+    app.state.failure_rate = failure_rate
+    app.state.failure_status = failure_status
+    app.state.requests = 0
+    app.state.failures = 0
+    app.state.streams: List[Dict[str, Any]] = []
+    app.state.prefill_delay = prefill_delay
+    app.state.prefix_cache = prefix_cache
+    app.state.prompt_tokens = 0
+    app.state.cached_tokens = 0
+    rng = random.Random(seed)
+    # Hash of each block-aligned prompt prefix seen so far
+    cached_blocks: "OrderedDict[str, None]" = OrderedDict()
+
+    def cached_prefix(prompt: str) -> int:
+        """Tokens of the longest block-aligned prefix seen before; remembers this prompt's blocks."""
+        if not app.state.prefix_cache or len(prompt) // 4 < cache_min_tokens:
+            return 0
+        block_chars = cache_block * 4
+        digest = hashlib.sha256()
+        cached, contiguous = 0, True
+        for start in range(0, len(prompt) - block_chars + 1, block_chars):
+            digest.update(prompt[start:start + block_chars].encode("utf-8"))
+            key = digest.hexdigest()
+            if contiguous and key in cached_blocks:
+                cached += cache_block
+                cached_blocks.move_to_end(key)
+            else:
+                contiguous = False
+                cached_blocks[key] = None
+                if len(cached_blocks) > cache_entries:
+                    cached_blocks.popitem(last=False)
+        return cached
+
+    def reply_tokens() -> List[str]:
+        if reply is not None:
+            return [word + " " for word in reply.split(" ")]
+        return default_reply(tokens)
+
+    def usage(prompt: str, completion_tokens: int, cached_tokens: int) -> Dict[str, Any]:
+        prompt_tokens = max(1, len(prompt) // 4)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        }
+
+    @app.post("/v1/chat/completions")
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        app.state.requests += 1
+        if rng.random() < app.state.failure_rate:
+            app.state.failures += 1
+            return JSONResponse({"error": {"message": "injected failure", "type": "server_error"}},
+                                status_code=app.state.failure_status)
+        model = payload.get("model", "stub")
+        prompt = "".join(str(m.get("content", "")) for m in payload.get("messages", []))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        parts = reply_tokens()
+        cached = cached_prefix(prompt)
+        app.state.prompt_tokens += max(1, len(prompt) // 4)
+        app.state.cached_tokens += cached
+        first_token_delay = (app.state.first_token_delay
+                             + app.state.prefill_delay * max(0, len(prompt) // 4 - cached) / 1000)
+
+        if not payload.get("stream"):
+            if first_token_delay:
+                await asyncio.sleep(first_token_delay)
+            return {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "".join(parts)}}],
+                "usage": usage(prompt, len(parts), cached),
+            }
+
+        record = {"started": time.monotonic(), "ended": None, "sent": 0, "completed": False}
+        app.state.streams.append(record)
+
+        def frame(delta: Dict[str, Any], finish_reason: Optional[str] = None, **extra: Any) -> str:
+            chunk = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}], **extra,
+            }
+            return f"data: {json.dumps(chunk)}\n\n"
+
+        async def events():
+            try:
+                if first_token_delay:
+                    await asyncio.sleep(first_token_delay)
+                yield frame({"role": "assistant", "content": ""})
+                for i, part in enumerate(parts):
+                    if i and app.state.token_delay:
+                        await asyncio.sleep(app.state.token_delay)
+                    yield frame({"content": part})
+                    record["sent"] += 1
+                if (payload.get("stream_options") or {}).get("include_usage"):
+                    yield frame({}, "stop", usage=usage(prompt, len(parts), cached))
+                else:
+                    yield frame({}, "stop")
+                yield "data: [DONE]\n\n"
+                record["completed"] = True
+            finally:
+                record["ended"] = time.monotonic()
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="OpenAI stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--token-delay", type=float, default=0.0)
+    parser.add_argument("--first-token-delay", type=float, default=0.0)
+    parser.add_argument("--tokens", type=int, default=64)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--prefill-delay", type=float, default=0.0, help="Seconds per 1000 uncached prompt tokens")
+    parser.add_argument("--no-prefix-cache", action="store_true", help="Never report cached prompt tokens")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.token_delay, args.first_token_delay, args.tokens, failure_rate=args.failure_rate,
+                           prefill_delay=args.prefill_delay, prefix_cache=not args.no_prefix_cache),
+                host=args.host, port=args.port)
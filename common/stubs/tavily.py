@@ -0,0 +1,134 @@
+"""
+A minimal Tavily-compatible ``/search`` server.
+
+Run it with ``python -m common.stubs.tavily --port 8765`` from the repository
+root and set ``TAVILY_BASE_URL=http://127.0.0.1:8765`` in the app under test.
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, JSONResponse, Response
+
+
+def default_results(query: str, max_results: int, base_url: str = "https://example.com",
+                    content_chars: int = 0) -> List[Dict[str, Any]]:
+    def content(i: int) -> str:
+        text = f"Stub content {i + 1} about {query}."
+        filler = f" Detail {i + 1} on {query}."
+        repeats = -(-(content_chars - len(text)) // len(filler))  # Ceiling division; <= 0 adds nothing
+        return text + filler * max(0, repeats)
+
+    return [
+        {
+            "title": f"Result {i + 1} for {query}",
+            "url": f"{base_url}/{i + 1}",
+            "content": content(i),
+            "score": round(1.0 - i * 0.05, 4),
+            "raw_content": None,
+        }
+        for i in range(max_results)
+    ]
+
+
+def create_app(latency: float = 0.0, results: Optional[List[Dict[str, Any]]] = None,
+               failure_rate: float = 0.0, failure_status: int = 503,
+               slow_rate: float = 0.0, slow_latency: float = 2.0, seed: Optional[int] = None,
+               pages: bool = False, page_bytes: int = 20000, page_latency: float = 0.0,
+               content_chars: int = 0) -> FastAPI:
+    """
+    Build the stub app.
+
+    Args:
+        latency: Seconds to wait before answering each request
+        results: Fixed results to return; generated from the query when omitted
+        failure_rate: Fraction of requests answered with ``failure_status``
+        failure_status: HTTP status of injected failures
+        slow_rate: Fraction of requests delayed by ``slow_latency`` instead of ``latency``
+        slow_latency: Seconds an injected slow request takes
+        seed: Seed for the fault injection, for repeatable runs
+        pages: Point generated result URLs at ``/pages/<n>`` on this stub, which serves HTML with an ETag
+        page_bytes: Approximate size of each served page
+        page_latency: Seconds to wait before serving a page
+        content_chars: Pad each generated result's content to about this many characters
+
+    The fault settings live on ``app.state`` and can be changed while the stub runs.
+    """
+    app = FastAPI(title="Tavily stub")
+    app.state.latency = latency
+    app.state.failure_rate = failure_rate
+    app.state.failure_status = failure_status
+    app.state.slow_rate = slow_rate
+    app.state.slow_latency = slow_latency
+    app.state.page_latency = page_latency
+    app.state.requests = 0
+    app.state.failures = 0
+    app.state.page_requests = 0
+    app.state.page_not_modified = 0
+    rng = random.Random(seed)
+
+    @app.post("/search")
+    async def search(request: Request):
+        payload = await request.json()
+        app.state.requests += 1
+        slow = rng.random() < app.state.slow_rate
+        delay = app.state.slow_latency if slow else app.state.latency
+        if delay:
+            await asyncio.sleep(delay)
+        if rng.random() < app.state.failure_rate:
+            app.state.failures += 1
+            return JSONResponse({"error": "injected failure"}, status_code=app.state.failure_status)
+        max_results = int(payload.get("max_results", 5))
+        base_url = str(request.base_url).rstrip("/") + "/pages" if pages else "https://example.com"
+        items = results
+        if items is None:
+            items = default_results(payload.get("query", ""), max_results, base_url, content_chars)
+        return {
+            "query": payload.get("query"),
+            "results": items[:max_results],
+            "images": [],
+            "response_time": app.state.latency,
+        }
+
+    @app.get("/pages/{number}")
+    async def page(number: int, request: Request):
+        app.state.page_requests += 1
+        etag = '"' + hashlib.sha1(f"{number}:{page_bytes}".encode()).hexdigest()[:16] + '"'
+        if request.headers.get("if-none-match") == etag:
+            app.state.page_not_modified += 1
+            return Response(status_code=304, headers={"ETag": etag})
+        if app.state.page_latency:
+            await asyncio.sleep(app.state.page_latency)
+        paragraph = f"<p>Paragraph about page {number}. " + "Some body text here. " * 20 + "</p>\n"
+        body = "".join([
+            f"<html><head><title>Page {number}</title><style>p {{ margin: 0 }}</style></head><body>",
+            "<nav><a href='/'>Home</a></nav><script>var tracking = 1;</script>",
+            paragraph * max(1, page_bytes // len(paragraph)),
+            "<footer>Footer</footer></body></html>",
+        ])
+        return HTMLResponse(body, headers={"ETag": etag})
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Tavily stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-latency", type=float, default=2.0)
+    parser.add_argument("--pages", action="store_true", help="Serve the result pages from this stub")
+    parser.add_argument("--page-bytes", type=int, default=20000)
+    parser.add_argument("--content-chars", type=int, default=0, help="Pad each result's content to this size")
+    args = parser.parse_args()
+    uvicorn.run(create_app(latency=args.latency, failure_rate=args.failure_rate, slow_rate=args.slow_rate,
+                           slow_latency=args.slow_latency, pages=args.pages, page_bytes=args.page_bytes,
+                           content_chars=args.content_chars),
+                host=args.host, port=args.port)
@@ -0,0 +1,45 @@
+from typing import Any, Dict
+
+import httpx
+
+TAVILY_BASE_URL = "https://api.tavily.com"
+
+
+async def tavily_search(client: httpx.AsyncClient, api_key: str, query: str,
+                        max_results: int = 5, search_depth: str = "basic",
+                        base_url: str = TAVILY_BASE_URL, **options: Any) -> Dict[str, Any]:
+    """
+    Call the Tavily ``/search`` REST endpoint on an existing client.
+
+    Args:
+        client: Shared client, normally ``PooledHTTPClient.client``
+        api_key: Tavily API key
+        query: Search query string
+        max_results: Maximum number of results to return
+        search_depth: "basic" or "advanced"
+        base_url: Override to point at a local stub server
+        **options: Extra Tavily parameters (include_images, include_raw_content, ...)
+
+    Returns:
+        The decoded Tavily response; results are under ``"results"``.
+
+    Raises:
+        httpx.RequestError: On connection/timeout failures
+        httpx.HTTPStatusError: On non-2xx responses
+    """
+    payload = {
+        "api_key": api_key,
+        "query": query,
+        "search_depth": search_depth,
+        "include_answer": False,
+        "include_raw_content": False,
+        "max_results": max_results,
+    }
+    payload.update(options)
+    response = await client.post(
+        f"{base_url.rstrip('/')}/search",
+        json=payload,
+        headers={"Content-Type": "application/json"},
+    )
+    response.raise_for_status()
+    return response.json()
@@ -0,0 +1,364 @@
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter as _Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Seconds; the Prometheus client defaults, extended for multi-second LLM calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def result_bytes(results: Any) -> int:
+    """UTF-8 size of the text fields of search results."""
+    total = 0
+    for result in results or ():
+        if isinstance(result, dict):
+            for field in ("title", "url", "content", "raw_content"):
+                value = result.get(field)
+                if isinstance(value, str):
+                    total += len(value.encode("utf-8"))
+    return total
+
+
+class Counter:
+    """A Prometheus counter with optional labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def values(self) -> Dict[Tuple[str, ...], float]:
+        """Current value per label tuple, in ``labels`` order."""
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in values]
+
+
+class Histogram:
+    """A Prometheus histogram with optional labels; ``buckets`` are upper bounds."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], List[float]] = {}  # bucket counts..., sum, count
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-2] += value
+            counts[-1] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, list(counts)) for key, counts in self._values.items())
+        lines = []
+        names = self.labelnames + ("le",)
+        for key, counts in values:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(names, key + (_number(bound),))} {_number(cumulative)}")
+            lines.append(f"{self.name}_bucket{_labels(names, key + ('+Inf',))} {_number(counts[-1])}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(counts[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {_number(counts[-1])}")
+        return lines
+
+
+class Registry:
+    """A set of metrics rendered together in the Prometheus text format."""
+
+    content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self, prefix: str = ""):
+        self.prefix = prefix
+        self._metrics: List[Any] = []
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        metric = Counter(self.prefix + name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(self.prefix + name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class Span:
+    """
+    One timed operation. Spans of a sampled trace are kept and exported
+    with OpenTelemetry's fields; the others are only timed.
+    """
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes", "start", "end_time",
+                 "_started", "_elapsed", "status", "_tracer")
+
+    def __init__(self, tracer: Optional["Tracer"], name: str, trace_id: Optional[str],
+                 parent_id: Optional[str], attributes: Dict[str, Any]):
+        self._tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16] if trace_id else None
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self._elapsed: Optional[float] = None
+        self.end_time: Optional[float] = None
+        self.status = "ok"
+
+    @property
+    def sampled(self) -> bool:
+        return self.trace_id is not None
+
+    def set(self, **attributes: Any) -> None:
+        if self.sampled:
+            self.attributes.update(attributes)
+
+    def elapsed(self) -> float:
+        """Seconds since the start, or the duration once ended."""
+        return self._elapsed if self._elapsed is not None else time.perf_counter() - self._started
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        if self._elapsed is not None:
+            return
+        self._elapsed = time.perf_counter() - self._started
+        self.end_time = self.start + self._elapsed
+        if isinstance(error, (GeneratorExit, asyncio.CancelledError)):
+            self.status = "cancelled"
+        elif error is not None:
+            self.status = "error"
+            self.set(error=f"{type(error).__name__}: {error}")
+        if self.sampled and self._tracer is not None:
+            self._tracer._finish(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "name": self.name,
+            "start_time_unix_nano": int(self.start * 1e9),
+            "end_time_unix_nano": int((self.end_time or self.start) * 1e9),
+            "duration_ms": round(self.elapsed() * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class Tracer:
+    """
+    Per-request spans, in OpenTelemetry's model (trace and span ids, parent
+    links, attributes, status) without its SDK.
+
+    ``trace()`` opens a request's root span; ``span()`` opens a child of the
+    current span. Only traces started with a ``trace_id`` are recorded, see
+    ``sample()``; unsampled spans still measure their duration, so callers
+    can time code and feed histograms the same way in both cases. Finished
+    traces are kept in memory (``recent()``) and, with ``export_path``,
+    appended to a JSON-lines file, one trace per line.
+    """
+
+    def __init__(self, sample_rate: float = 0.0, keep: int = 100, export_path: Optional[str] = None):
+        self.sample_rate = sample_rate
+        self.export_path = export_path
+        self._current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+        self._open: Dict[str, List[Dict[str, Any]]] = {}
+        self._recent = deque(maxlen=keep)
+        self._lock = threading.Lock()
+
+    def sample(self, forced: bool = False) -> Optional[str]:
+        """A new trace id if this request should be traced, else None."""
+        if forced or (self.sample_rate > 0 and random.random() < self.sample_rate):
+            return uuid.uuid4().hex
+        return None
+
+    def current(self) -> Optional[Span]:
+        return self._current.get()
+
+    def start_span(self, name: str, parent: Optional[Span] = None, **attributes: Any) -> Span:
+        """
+        A child of ``parent`` (by default the current span) that is not made
+        current; call ``end()`` on it.
+        """
+        parent = parent or self._current.get()
+        if parent is None or not parent.sampled:
+            return Span(None, name, None, None, {})
+        return Span(self, name, parent.trace_id, parent.span_id, attributes)
+
+    @contextmanager
+    def trace(self, name: str, trace_id: Optional[str] = None, **attributes: Any) -> Iterator[Span]:
+        """The root span of a request, recorded when ``trace_id`` is set."""
+        span = Span(self, name, trace_id, None, attributes if trace_id else {})
+        if trace_id:
+            with self._lock:
+                self._open[trace_id] = []
+        with self._activate(span):
+            yield span
+
+    @contextmanager
+    def span(self, name: str, parent: Optional[Span] = None, **attributes: Any) -> Iterator[Span]:
+        """A child of ``parent`` (by default the current span), current inside the block."""
+        with self._activate(self.start_span(name, parent, **attributes)) as span:
+            yield span
+
+    @contextmanager
+    def _activate(self, span: Span) -> Iterator[Span]:
+        token = self._current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.end(error=e)
+            raise
+        finally:
+            span.end()
+            try:
+                self._current.reset(token)
+            except ValueError:
+                pass  # Closed from another context, e.g. an abandoned stream
+
+    def _finish(self, span: Span) -> None:
+        with self._lock:
+            spans = self._open.get(span.trace_id)
+            if spans is None:
+                return
+            spans.append(span.to_dict())
+            if span.parent_id is not None:
+                return
+            del self._open[span.trace_id]
+            trace = {"trace_id": span.trace_id, "name": span.name, "duration_ms": round(span.elapsed() * 1000, 3),
+                     "spans": sorted(spans, key=lambda s: s["start_time_unix_nano"])}
+            self._recent.append(trace)
+            if self.export_path:
+                with open(self.export_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(trace, ensure_ascii=False, default=str) + "\n")
+
+    def recent(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._recent)
+
+
+class SamplingProfiler:
+    """
+    Samples the Python stacks of every thread at ``interval`` seconds.
+
+    Each ``session()`` collects the samples taken while it is open; the
+    sampler thread runs only while at least one session is. Stacks are
+    returned in the folded format (``frame;frame;frame count``) read by
+    flamegraph.pl, speedscope and inferno. On the event-loop thread a
+    request's session also sees whatever other requests run meanwhile, so
+    per-request profiles are cleanest on an otherwise idle worker.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self._sessions: List[_Counter] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.samples = 0
+
+    @contextmanager
+    def session(self) -> Iterator[_Counter]:
+        stacks: _Counter = _Counter()
+        with self._lock:
+            self._sessions.append(stacks)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+        try:
+            yield stacks
+        finally:
+            with self._lock:
+                self._sessions.remove(stacks)
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while True:
+            with self._lock:
+                if not self._sessions:
+                    self._thread = None
+                    return
+                sessions = list(self._sessions)
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                folded = ";".join(reversed(stack))
+                for stacks in sessions:
+                    stacks[folded] += 1
+            self.samples += 1
+            time.sleep(self.interval)
+
+    @staticmethod
+    def folded(stacks: _Counter) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    def dump(self, stacks: _Counter, directory: str, name: str) -> str:
+        """Write ``stacks`` to ``<directory>/<name>.folded`` and return the path."""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{name}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.folded(stacks))
+        return path
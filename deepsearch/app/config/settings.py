@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Any, Dict, Optional
 
 from pydantic_settings import BaseSettings
 
@@ -11,14 +11,152 @@ class Settings(BaseSettings):
 
     # LLM settings
     OPENAI_API_KEY: str
-    OPENAI_BASE_URL: str = None
+    OPENAI_BASE_URL: Optional[str] = None
     OPENAI_MODEL_NAME: str = "gpt-3.5-turbo"
+    # One client and connection pool shared by every agent; roles only change request parameters
+    LLM_ROLES: Dict[str, Dict[str, Any]] = {}  # JSON, e.g. {"coordinator": {"temperature": 0}, "reporter": {"max_tokens": 2048}}
+    LLM_MAX_CONNECTIONS: int = 50
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    LLM_KEEPALIVE_EXPIRY: float = 60.0
+    LLM_HTTP2: bool = True
+    LLM_CONNECT_TIMEOUT: float = 5.0
+    LLM_READ_TIMEOUT: float = 120.0  # Longest wait for the next bytes of a completion, including the first token
+    LLM_WRITE_TIMEOUT: float = 10.0
+    LLM_POOL_TIMEOUT: float = 10.0
 
     # Search engine settings
     TAVILY_API_KEY: str
+    TAVILY_BASE_URL: str = "https://api.tavily.com"
+    # Search providers: comma-separated names, in order of preference ("tavily", "local", or registered ones)
+    SEARCH_PROVIDERS: str = "tavily"
+    SEARCH_MODE: str = "fallback"  # "fallback", "race" (first good results win) or "merge" (rank fusion)
+    SEARCH_RACE_MIN_RESULTS: int = 0  # Good results that end a race; 0 = max_results
+    SEARCH_MERGE_TIMEOUT: float = 10.0  # Seconds to wait for slow providers in merge mode
+    LOCAL_SEARCH_PATH: str = "docs"  # Directory of .md/.txt/.html files for the "local" provider
+    LOCAL_INDEX_DIR: Optional[str] = None  # Where the local index is stored; <LOCAL_SEARCH_PATH>/.index when unset
+    LOCAL_INDEX_DENSE: bool = False  # Also rank by embedding similarity (memory-mapped vectors)
+    LOCAL_INDEX_REFRESH_INTERVAL: float = 60.0  # Seconds between scans for changed files; 0 = only the first search
+    SEARCH_ASYNC_HTTP: bool = True  # Use the pooled httpx client instead of the sync SDK
+    SEARCH_SYNC_WORKERS: int = 8  # Thread-pool size for providers with sync-only SDKs
+
+    # Shared HTTP connection pool
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    HTTP2: bool = True
+    HTTP_CONNECT_TIMEOUT: float = 5.0
+    HTTP_READ_TIMEOUT: float = 30.0
+    HTTP_WRITE_TIMEOUT: float = 10.0
+    HTTP_POOL_TIMEOUT: float = 5.0
+
+    # Search-result cache
+    SEARCH_CACHE_MAX_ENTRIES: int = 1024
+    SEARCH_CACHE_TTL: float = 600.0
+    SEARCH_CACHE_STALE_TTL: float = 3600.0
+    SEARCH_CACHE_PATH: Optional[str] = None  # SQLite file for a persistent tier; memory only when unset
+
+    # Local fast path in front of the coordinator LLM
+    ROUTER_FAST_PATH: bool = True
+    ROUTER_MIN_CONFIDENCE: float = 0.85
+    ROUTER_LOG_PATH: Optional[str] = None  # JSON-lines log of routing decisions
+    ROUTER_SHADOW_RATE: float = 0.0  # Fraction of fast decisions re-checked by the LLM in the background
+
+    # Speculative search: start searching the raw query while the coordinator LLM decides
+    SPECULATIVE_SEARCH: bool = False
+    SPECULATIVE_SEARCH_TTL: float = 60.0  # Unclaimed speculations are dropped after this many seconds
+
+    # Research mode: "react" lets the agent call the search tool step by step,
+    # "fanout" plans sub-queries up front and searches them concurrently
+    RESEARCH_MODE: str = "react"
+    RESEARCH_SUB_QUERIES: int = 3
+    RESEARCH_CONCURRENCY: int = 4
+    RESEARCH_RESULTS_PER_QUERY: int = 10
+    RESEARCH_MAX_SOURCES: int = 20
+
+    # Context assembly: bound the search context handed to the reporter
+    CONTEXT_TOKEN_BUDGET: int = 6000
+    CONTEXT_PASSAGE_TOKENS: int = 200
+    CONTEXT_DEDUP_THRESHOLD: float = 0.8
+    CONTEXT_TOKENIZER: Optional[str] = None  # tiktoken encoding, e.g. "cl100k_base"; estimated when unset
+
+    # Page fetching: download the top results and hand their text to the researcher
+    FETCH_PAGES: bool = False
+    FETCH_TOP_K: int = 3  # Results whose pages are fetched
+    FETCH_MAX_BYTES: int = 1_000_000  # Per page; larger bodies are cut off
+    FETCH_MAX_CHARS: int = 20000  # Extracted text kept per page
+    FETCH_PER_HOST: int = 2  # Concurrent downloads per host
+    FETCH_CONCURRENCY: int = 8  # Concurrent downloads overall
+    FETCH_TIMEOUT: float = 5.0  # Seconds for the whole stage; slower pages are skipped
+    FETCH_CACHE_DIR: Optional[str] = None  # Disk cache of extracted text, keyed by URL and revalidated by ETag
+    FETCH_CACHE_TTL: float = 3600.0  # Seconds a cached page is used without revalidation
+
+    # Share one upstream call between concurrent identical requests
+    COALESCE_REQUESTS: bool = True
+
+    # Semantic answer cache: reuse reports of paraphrased queries
+    SEMANTIC_CACHE_ENABLED: bool = False
+    SEMANTIC_CACHE_THRESHOLD: float = 0.8
+    SEMANTIC_CACHE_MATCH_TERMS: bool = True  # A hit must also mention the same numbers and names
+    SEMANTIC_CACHE_TTL: float = 3600.0
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 2048  # Per locale
+
+    # Admission control: concurrency limits (0 = unlimited), overall and per client key
+    ADMISSION_MAX_REQUESTS: int = 64
+    ADMISSION_MAX_REQUESTS_PER_KEY: int = 8
+    ADMISSION_MAX_SEARCHES: int = 32
+    ADMISSION_MAX_SEARCHES_PER_KEY: int = 8
+    ADMISSION_MAX_LLM_CALLS: int = 32
+    ADMISSION_MAX_LLM_CALLS_PER_KEY: int = 4
+    ADMISSION_MAX_QUEUE: int = 128  # Callers allowed to wait for a slot; beyond that, 429
+    ADMISSION_MAX_WAIT: float = 10.0  # Seconds; callers that would wait longer get 429 with Retry-After
+    # Upstream rate limits in requests per second (0 = unlimited)
+    TAVILY_RATE_LIMIT: float = 0.0
+    TAVILY_RATE_BURST: int = 10
+    OPENAI_RATE_LIMIT: float = 0.0
+    OPENAI_RATE_BURST: int = 10
+    DISCONNECT_POLL_INTERVAL: float = 0.5  # Seconds between client-disconnect checks while streaming
+
+    # Upstream resilience: retries with jittered backoff, hedged searches, circuit breakers
+    SEARCH_RETRY_ATTEMPTS: int = 3  # Total attempts per search, including the first
+    SEARCH_RETRY_BASE_DELAY: float = 0.2
+    SEARCH_RETRY_MAX_DELAY: float = 2.0
+    SEARCH_HEDGE: bool = True  # Send a backup search when the first is slower than usual
+    SEARCH_HEDGE_QUANTILE: float = 0.95
+    SEARCH_HEDGE_DELAY: float = 1.0  # Seconds, until enough latencies are known
+    SEARCH_HEDGE_MIN_DELAY: float = 0.05
+    LLM_RETRY_ATTEMPTS: int = 2  # Total attempts per chat-model call
+    BREAKER_FAILURE_THRESHOLD: int = 5  # Consecutive failures that open a provider's circuit; 0 disables
+    BREAKER_RECOVERY_TIME: float = 30.0  # Seconds a provider is skipped before a trial call
 
     # Streaming settings
     STREAMING: bool = True  # Enable streaming by default
+    SSE_COALESCE_INTERVAL_MS: float = 20.0  # Batch token events for up to this long; 0 sends each token alone
+    SSE_COALESCE_MAX_BYTES: int = 512  # Flush a batch once it reaches this size
+
+    # Instrumentation: Prometheus metrics on /metrics, per-request spans, sampling profiler
+    LLM_STREAM_USAGE: bool = True  # Ask for token usage on streamed completions (stream_options.include_usage)
+    TRACE_SAMPLE_RATE: float = 0.0  # Fraction of requests traced; "X-Trace: 1" traces one request
+    TRACE_KEEP: int = 100  # Recent traces served by /api/stats/traces
+    TRACE_EXPORT_PATH: Optional[str] = None  # JSON-lines file that receives every finished trace
+    PROFILING_ENABLED: bool = False  # Allow "X-Profile: 1" and /api/profile; samples every thread while on
+    PROFILE_INTERVAL_MS: float = 5.0  # Sampling period
+    PROFILE_DIR: str = "profiles"  # Where folded stacks (flamegraph input) are written
+
+    # Serving: WORKERS=0 runs the development server with auto-reload
+    HOST: str = "0.0.0.0"
+    PORT: int = 8081
+    WORKERS: int = 0  # N > 0: production mode with N preloaded worker processes; -1: one per CPU
+    GRACEFUL_SHUTDOWN_TIMEOUT: float = 30.0  # Seconds workers get to finish in-flight requests
+    # Store shared by the workers for the search cache, answer cache and in-flight searches:
+    # sqlite:///path.db or redis://host:6379/0. With several workers it defaults to a SQLite file in the temp dir
+    SHARED_STORE_URL: Optional[str] = None
+
+    # Startup: /api/health answers at once, /api/ready only after the warm-up
+    LAZY_INIT: bool = False  # Import LangChain/LangGraph, build the agents and compile the graph in the warm-up (or first request) instead of at import
+    WARM_UP: bool = True  # Run the warm-up steps in the background at startup; false reports ready at once
+    WARM_UP_CONNECT: bool = True  # Open pooled connections to the search and LLM endpoints during the warm-up
+    WARM_UP_QUERY: Optional[str] = None  # Priming query run through the whole graph before reporting ready
+    WARM_UP_TIMEOUT: float = 60.0  # Seconds per warm-up step
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,18 @@
+from common.admission import AdmissionConfig, AdmissionController
+
+from app.config.settings import settings
+
+# Process-wide admission control for requests and for the search and LLM calls they make
+admission = AdmissionController(AdmissionConfig(
+    limits={
+        "request": (settings.ADMISSION_MAX_REQUESTS, settings.ADMISSION_MAX_REQUESTS_PER_KEY),
+        "search": (settings.ADMISSION_MAX_SEARCHES, settings.ADMISSION_MAX_SEARCHES_PER_KEY),
+        "llm": (settings.ADMISSION_MAX_LLM_CALLS, settings.ADMISSION_MAX_LLM_CALLS_PER_KEY),
+    },
+    max_queue=settings.ADMISSION_MAX_QUEUE,
+    max_wait=settings.ADMISSION_MAX_WAIT,
+    rates={
+        "tavily": (settings.TAVILY_RATE_LIMIT, settings.TAVILY_RATE_BURST),
+        "openai": (settings.OPENAI_RATE_LIMIT, settings.OPENAI_RATE_BURST),
+    },
+))
@@ -1,32 +1,101 @@
-import os
+import asyncio
 import json
-import jinja2
+import random
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessageChunk, AIMessage
 from langchain_core.output_parsers import JsonOutputParser
 from langgraph.types import Command
 
+from common.cache import normalize_query
+from common.jsonstream import IncrementalJSONParser
+
+from app.config.settings import settings
 from app.core.agents.base import BaseAgent
 from app.core.llm import get_llm
+from app.core.prompts import get_prompt
+from app.core.router import QueryRouter, RouteDecision
+from app.core.speculation import speculator
 from app.core.types import State
 
 
+def parse_decision(content: str) -> dict:
+    """Parse the coordinator's JSON output, tolerating Markdown code fences."""
+    try:
+        # 清理 JSON 字符串，去除可能的 Markdown 标记
+        result_str = content.replace("```json", "").replace("```", "").strip()
+        result = json.loads(result_str)
+        if isinstance(result, dict):
+            return result
+    except json.JSONDecodeError:
+        pass
+    # 如果解析失败，回退到将整个内容作为响应
+    print(f"Warning: Could not parse JSON from coordinator output. Full content: {content}")
+    return {"response": content}
+
+
 class CoordinatorAgent(BaseAgent):
     def __init__(self):
-        self.llm = get_llm()
+        self.llm = get_llm("coordinator")
 
-        # Load prompt template
-        template_path = os.path.join(os.path.dirname(__file__), "../prompts/coordinator.md")
-        with open(template_path, "r") as f:
-            template_content = f.read()
+        self.prompt_template = get_prompt("coordinator")
+        self.router = QueryRouter(min_confidence=settings.ROUTER_MIN_CONFIDENCE, log_path=settings.ROUTER_LOG_PATH)
+        self._shadow_tasks = set()
 
-        self.prompt_template = jinja2.Template(template_content)
+    def _fast_route(self, state: State):
+        """Settle obvious queries locally; returns None when the LLM has to decide."""
+        if not settings.ROUTER_FAST_PATH:
+            return None
+        decision = self.router.classify(state.get("query"), state.get("locale"))
+        if decision.coordinator is None:
+            return None
+        if settings.ROUTER_SHADOW_RATE and random.random() < settings.ROUTER_SHADOW_RATE:
+            task = asyncio.create_task(self._shadow_check(state, decision))
+            self._shadow_tasks.add(task)
+            task.add_done_callback(self._shadow_tasks.discard)
+        return decision
 
-    async def process(self, state: State) -> Command:
+    async def _shadow_check(self, state: State, decision: RouteDecision):
+        """Ask the LLM as well and log whether it agrees, to measure fast-path accuracy."""
+        try:
+            result = parse_decision((await self.llm.ainvoke(self._messages(state))).content)
+            self.router.log(state.get("query"), decision, source="shadow",
+                            llm_coordinator=result.get("coordinator"),
+                            agree=result.get("coordinator") == decision.coordinator)
+        except Exception as e:
+            print(f"Warning: Router shadow check failed: {e}")
+
+    def _messages(self, state: State):
         locale = state.get("locale", "en")
         prompt_content = self.prompt_template.render(query=state.get("query"), locale=locale, CURRENT_TIME=state.get("current_time"))
+        return [SystemMessage(content=prompt_content), HumanMessage(content=state.get("query"))]
+
+    def _log_llm_decision(self, state: State, result: dict):
+        self.router.log(state.get("query"), RouteDecision(
+            result.get("coordinator"), 1.0, result.get("locale", state.get("locale", "en")), "llm",
+            search_keyword=result.get("search_keyword"), response=result.get("response"),
+        ), source="llm")
+
+    async def process(self, state: State) -> Command:
+        locale = state.get("locale", "en")
+        fast = self._fast_route(state)
+        if fast is not None:
+            return Command(
+                goto="researcher_node" if fast.coordinator == "requires_research" else "END",
+                update=fast.as_update()
+            )
+
         chain = self.llm
-        messages = [SystemMessage(content=prompt_content), HumanMessage(content=state.get("query"))]
-        result = await chain.ainvoke(messages)
+        messages = self._messages(state)
+        # Search the raw query while the LLM decides; only kept if it routes to research
+        speculation_id = speculator.start(state)
+        try:
+            result = parse_decision((await chain.ainvoke(messages)).content)
+        except BaseException:
+            speculator.cancel(speculation_id)
+            raise
+        self._log_llm_decision(state, result)
+        if result.get("coordinator") != "requires_research":
+            speculator.cancel(speculation_id)
+            speculation_id = None
 
         # Use the detected locale from the LLM response, or fall back to the current locale
         detected_locale = result.get("locale", locale)
@@ -37,64 +106,93 @@ class CoordinatorAgent(BaseAgent):
                     "response": result.get("response"),
                     "locale": detected_locale,
                     "search_keyword": result.get("search_keyword"),
+                    "speculation_id": speculation_id,
                     }
         )
 
     async def process_stream(self, state: State):
         locale = state.get("locale", "en")
-        prompt_content = self.prompt_template.render(query=state.get("query"), locale=locale, CURRENT_TIME=state.get("current_time"))
+        fast = self._fast_route(state)
+        if fast is not None:
+            yield Command(
+                goto="researcher_node" if fast.coordinator == "requires_research" else "END",
+                update={**fast.as_update(), "stream_buffer": None}
+            )
+            return
+
         chain = self.llm
-        messages = [SystemMessage(content=prompt_content), HumanMessage(content=state.get("query"))]
-        
-        # 用于累积完整的流式输出内容
-        full_content = "" 
-
-        # Stream the response
-        async for chunk in chain.astream(messages):
-            if chunk:
-                current_chunk_content = ""
-                if isinstance(chunk, AIMessageChunk):
-                    current_chunk_content = chunk.content
-                elif isinstance(chunk, dict) and "response" in chunk: # Fallback for non-AIMessageChunk if chain returns dict
-                    current_chunk_content = chunk.get("response", "")
-                
-                full_content += current_chunk_content # 累积所有分块的内容
-
-                # 更新流式缓冲区，只发送当前 chunk 的内容
-                state["stream_buffer"] = current_chunk_content 
-                # 立即返回流式更新
-                yield Command(
-                    goto=None, # Stay on the same node for streaming updates
-                    update={"stream_buffer": state.get("stream_buffer")}
-                )
-
-        # Get final result from the accumulated full_content
-        # 尝试从累积的完整内容中解析 JSON
+        messages = self._messages(state)
+        # Search the raw query while the LLM decides; only kept if it routes to research
+        speculation_id = speculator.start(state)
+        handed_off = False
+
+        # 用于累积完整的流式输出内容（分块收集，最后一次性拼接）
+        chunks = []
+        parser = IncrementalJSONParser()
+
         try:
-            # 清理 JSON 字符串，去除可能的 Markdown 标记
-            result_str = full_content.replace("```json", "").replace("```", "").strip()
-            result = json.loads(result_str)
-        except json.JSONDecodeError:
-            # 如果解析失败，回退到将整个内容作为响应
-            print(f"Warning: Could not parse JSON from streamed content. Full content: {full_content}")
-            result = {"response": full_content} # 确保 result 是一个字典以便后续访问
+            # Stream the response
+            async for chunk in chain.astream(messages):
+                if chunk:
+                    current_chunk_content = ""
+                    if isinstance(chunk, AIMessageChunk):
+                        current_chunk_content = chunk.content
+                    elif isinstance(chunk, dict) and "response" in chunk: # Fallback for non-AIMessageChunk if chain returns dict
+                        current_chunk_content = chunk.get("response", "")
 
-        detected_locale = result.get("locale", locale)
+                    chunks.append(current_chunk_content) # 累积所有分块的内容
 
-        # Update state with final result
-        state["coordinator"] = result.get("coordinator")
-        state["response"] = result.get("response")
-        state["locale"] = detected_locale
-        state["search_keyword"] = result.get("search_keyword")
+                    # Act on each field as soon as it is complete instead of after the last token
+                    for key, value in parser.feed(current_chunk_content):
+                        if key == "coordinator" and value == "requires_research":
+                            # The route is settled: start searching now if speculation didn't already
+                            if speculation_id is None:
+                                speculation_id = speculator.start(state, force=True)
+                        elif key == "coordinator":
+                            speculator.cancel(speculation_id)
+                            speculation_id = None
+                        elif key == "search_keyword" and parser.fields.get("coordinator") == "requires_research":
+                            if normalize_query(value) != normalize_query(state.get("query")):
+                                speculator.prefetch(value, state)
 
-        # Yield final command with all updates
-        yield Command(
-            goto="researcher_node" if result.get("coordinator") == "requires_research" else "END",
-            update={
-                "coordinator": result.get("coordinator"),
-                "response": result.get("response"),
-                "locale": detected_locale,
-                "search_keyword": result.get("search_keyword"),
-                "stream_buffer": None  # Clear the stream buffer
-            }
-        )
+                    # 更新流式缓冲区，只发送当前 chunk 的内容
+                    state["stream_buffer"] = current_chunk_content 
+                    # 立即返回流式更新
+                    yield Command(
+                        goto=None, # Stay on the same node for streaming updates
+                        update={"stream_buffer": state.get("stream_buffer")}
+                    )
+                    if parser.done:
+                        # Nothing useful follows the closing brace (at most a Markdown fence)
+                        break
+
+            # Get final result from the incrementally parsed fields
+            # 若增量解析失败，回退到从累积的完整内容中解析 JSON
+            result = parser.fields if parser.done else parse_decision("".join(chunks))
+            self._log_llm_decision(state, result)
+
+            detected_locale = result.get("locale", locale)
+            research = result.get("coordinator") == "requires_research"
+
+            # Update state with final result
+            state["coordinator"] = result.get("coordinator")
+            state["response"] = result.get("response")
+            state["locale"] = detected_locale
+            state["search_keyword"] = result.get("search_keyword")
+
+            handed_off = research
+            # Yield final command with all updates
+            yield Command(
+                goto="researcher_node" if research else "END",
+                update={
+                    "coordinator": result.get("coordinator"),
+                    "response": result.get("response"),
+                    "locale": detected_locale,
+                    "search_keyword": result.get("search_keyword"),
+                    "speculation_id": speculation_id if research else None,
+                    "stream_buffer": None  # Clear the stream buffer
+                }
+            )
+        finally:
+            if not handed_off:
+                speculator.cancel(speculation_id)
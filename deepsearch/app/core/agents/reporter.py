@@ -1,85 +1,92 @@
-import os
+import time
 
-import jinja2
 from langchain_core.messages import SystemMessage
-from langgraph.prebuilt import create_react_agent
+from langgraph.config import get_stream_writer
 from langgraph.types import Command
 
+from common.metrics import LatencyTracker
+from common.semantic_cache import chunk_text
+
 from app.core.agents.base import BaseAgent
+from app.core.answer_cache import store_answer
 from app.core.llm import get_llm
+from app.core.prompts import get_prompt
 from app.core.types import State
 
 
 class ReporterAgent(BaseAgent):
     def __init__(self):
-        self.llm = get_llm()
+        self.llm = get_llm("reporter")
 
-        # Load prompt template
-        template_path = os.path.join(
-            os.path.dirname(__file__), "../prompts/reporter.md"
-        )
-        with open(template_path, "r") as f:
-            template_content = f.read()
+        self.prompt_template = get_prompt("reporter")
 
-        self.prompt_template = jinja2.Template(template_content)
+        # Time to the first report token, from the reporter's LLM call and from request arrival
+        self.first_token_latency = LatencyTracker()
+        self.request_first_token_latency = LatencyTracker()
 
-    async def process(self, state: State) -> Command:
-        query = state.get("query")
-        locale = state.get("locale", "en")
-        search_result = state.get("search_result")
+    def _messages(self, state: State):
         prompt_content = self.prompt_template.render(
-            query=query, search_results=search_result, locale=locale, CURRENT_TIME=state.get("current_time")
+            query=state.get("query"), search_results=state.get("search_result"),
+            locale=state.get("locale", "en"), CURRENT_TIME=state.get("current_time")
         )
+        return [SystemMessage(content=prompt_content)]
 
-        agent = create_react_agent(
-            model=self.llm,
-            prompt=prompt_content,
-            tools=[],
-        )
-        messages = [SystemMessage(content=prompt_content)]
+    def _first_token(self, state: State, llm_started: float) -> None:
+        now = time.monotonic()
+        self.first_token_latency.observe(now - llm_started)
+        if state.get("started_at"):
+            self.request_first_token_latency.observe(now - state.get("started_at"))
+
+    def stats(self):
+        return {
+            "first_token": self.first_token_latency.stats(),
+            "request_to_first_token": self.request_first_token_latency.stats(),
+        }
+
+    async def process(self, state: State) -> Command:
+        locale = state.get("locale", "en")
+        cached = state.get("cached_answer")
+        if cached is not None:
+            return Command(goto="END", update={"reporter_result": cached, "locale": locale})
 
-        report = await agent.ainvoke({"input": messages[0].content})
-        ai_content = report.get("messages", [])[-1].content
+        report = await self.llm.ainvoke(self._messages(state))
+        ai_content = report.content
+        await store_answer(state, ai_content, state.get("search_result"))
 
         return Command(goto="END", update={"reporter_result": ai_content, "locale": locale})
 
-    async def process_stream(self, state: State):
-        query = state.get("query")
+    async def process_stream(self, state: State) -> Command:
+        """
+        Stream the report token by token.
+
+        Tokens reach the client through LangGraph's "messages" stream, which
+        picks up the chat model's ``astream`` directly; the node itself only
+        returns the final report, so each token is sent exactly once.
+        """
         locale = state.get("locale", "en")
-        search_result = state.get("search_result")
-        prompt_content = self.prompt_template.render(
-            query=query, search_results=search_result, locale=locale, CURRENT_TIME=state.get("current_time")
-        )
+        cached = state.get("cached_answer")
+        if cached is not None:
+            # Replay the cached report as stream tokens at once, then as the final result
+            write = get_stream_writer()
+            for text in chunk_text(cached):
+                write({"stream": text, "node": "reporter_node"})
+            return Command(goto="END", update={"reporter_result": cached, "locale": locale, "stream_buffer": None})
 
-        agent = create_react_agent(
-            model=self.llm,
-            prompt=prompt_content,
-            tools=[],
-        )
-        messages = [SystemMessage(content=prompt_content)]
-        full_content = ""
-        # Stream the response
-        async for chunk in agent.astream({"input": messages[0].content}):
-            if chunk and "messages" in chunk:
-                last_message = chunk["messages"][-1]
-                if hasattr(last_message, "content"):
-                    current_chunk_content = last_message.content
-                    full_content += current_chunk_content
-                    state["stream_buffer"] = current_chunk_content
-                    yield Command(
-                        goto=None,
-                        update={"stream_buffer": state.get("stream_buffer")}
-                    )
+        # Collect chunks and join once; repeated += copies the whole string each time
+        chunks = []
+        llm_started = time.monotonic()
+        async for chunk in self.llm.astream(self._messages(state)):
+            if not chunk.content:
+                continue
+            if not chunks:
+                self._first_token(state, llm_started)
+            chunks.append(chunk.content)
 
         # Get final result from the accumulated stream
-        ai_content = full_content
-
-        # Update state with final result
-        state["reporter_result"] = ai_content
-        state["locale"] = locale
+        ai_content = "".join(chunks)
+        await store_answer(state, ai_content, state.get("search_result"))
 
-        # Yield final command with all updates
-        yield Command(
+        return Command(
             goto="END",
             update={
                 "reporter_result": ai_content,
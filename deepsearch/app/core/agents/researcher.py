@@ -1,96 +1,236 @@
-import os
+import asyncio
+import json
+from typing import Any, Dict, List, Sequence, Tuple
 
-import jinja2
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import Tool
 from langgraph.prebuilt import create_react_agent
 from langgraph.types import Command
 
+from common.cache import normalize_query
+from common.context import ContextAssembler, ContextConfig, format_passages
+from common.results import format_results, reciprocal_rank_fusion
+
+from app.config.settings import settings
 from app.core.agents.base import BaseAgent
+from app.core.answer_cache import lookup_answer
+from app.core.http import http_client
 from app.core.llm import get_llm
+from app.core.pages import page_fetcher
+from app.core.prompts import get_prompt
 from app.core.search_engine import SearchEngine
+from app.core.speculation import speculator
 from app.core.types import State
 
 
 class ResearcherAgent(BaseAgent):
     def __init__(self):
-        self.llm = get_llm()
+        self.llm = get_llm("researcher")
         self.search_engine = SearchEngine()
 
-        template_path = os.path.join(
-            os.path.dirname(__file__), "../prompts/researcher.md"
+        self.prompt_template = get_prompt("researcher")
+        self.planner_template = get_prompt("planner")
+
+        self.context_assembler = ContextAssembler(ContextConfig(
+            token_budget=settings.CONTEXT_TOKEN_BUDGET,
+            passage_tokens=settings.CONTEXT_PASSAGE_TOKENS,
+            dedup_threshold=settings.CONTEXT_DEDUP_THRESHOLD,
+            tokenizer=settings.CONTEXT_TOKENIZER,
+        ))
+
+        # Build the tool and compile the ReAct graph once; per-request values
+        # travel in the input messages and in config["configurable"].
+        self.search_tool = Tool(
+            name="web_search_tool",
+            func=self._search,
+            coroutine=self._asearch,
+            description="Useful for when you need to search the web for information about the user query",
+            # The raw results ride along as the ToolMessage artifact for context assembly
+            response_format="content_and_artifact",
+        )
+        self.agent = create_react_agent(
+            model=self.llm,
+            tools=[self.search_tool],
         )
-        with open(template_path, "r") as f:
-            template_content = f.read()
 
-        self.prompt_template = jinja2.Template(template_content)
+    @staticmethod
+    def _use_cache(config: RunnableConfig) -> bool:
+        return (config or {}).get("configurable", {}).get("use_cache", True)
 
-    def _search(self, query: str) -> str:
+    def _search(self, query: str, config: RunnableConfig = None) -> Tuple[str, List[Dict[str, Any]]]:
         try:
-            results = self.search_engine.search(query, 20)
-            return "\n".join([res["content"] for res in results["results"]])
+            results = self.search_engine.search(query, 20, use_cache=self._use_cache(config))["results"]
+            return format_results(results), results
         except Exception as e:
             raise ValueError(f"Search failed: {e}") from e
 
-    async def process(self, state: State) -> Command:
-        query = state.get("query")
-        locale = state.get("locale", "en")
-        prompt_content = self.prompt_template.render(query=query, locale=locale, CURRENT_TIME=state.get("current_time"))
+    async def _asearch(self, query: str, config: RunnableConfig = None) -> Tuple[str, List[Dict[str, Any]]]:
+        try:
+            results = (await self.search_engine.asearch(query, 20, use_cache=self._use_cache(config)))["results"]
+            return format_results(results), results
+        except Exception as e:
+            raise ValueError(f"Search failed: {e}") from e
 
-        search_tool = Tool(
-            name="web_search_tool",
-            func=self._search,
-            description="Useful for when you need to search the web for information about the user query",
+    async def _assemble_context(self, query: str, results: Sequence[Dict[str, Any]],
+                                notes: Sequence[str] = ()) -> str:
+        """
+        Pack the researcher's notes plus the most relevant passages into the
+        token budget, reading the top pages first when page fetching is on.
+        """
+        if page_fetcher is not None and results:
+            if not http_client.started:
+                await http_client.start()
+            results = await page_fetcher.enrich(results)
+        notes_text = "\n".join(note for note in notes if note)
+        passages = self.context_assembler.assemble(
+            query, results, reserved_tokens=self.context_assembler.count_tokens(notes_text)
         )
+        return "\n\n".join(part for part in (notes_text, format_passages(passages)) if part)
 
-        agent = create_react_agent(
-            model=self.llm,
-            tools=[search_tool],
+    async def _plan_queries(self, state: State) -> List[str]:
+        """Ask the model for a few sub-queries covering other facets of the question."""
+        query = state.get("query")
+        prompt_content = self.planner_template.render(
+            query=query,
+            search_keyword=state.get("search_keyword") or query,
+            max_queries=settings.RESEARCH_SUB_QUERIES,
+            locale=state.get("locale", "en"),
+            CURRENT_TIME=state.get("current_time"),
         )
+        try:
+            result = await self.llm.ainvoke([SystemMessage(content=prompt_content), HumanMessage(content=query)])
+            content = result.content
+            queries = json.loads(content[content.index("["):content.rindex("]") + 1])
+        except Exception as e:
+            print(f"Warning: Could not plan sub-queries: {e}")
+            return []
+        return [q.strip() for q in queries if isinstance(q, str) and q.strip()]
+
+    async def _fan_out(self, state: State) -> Tuple[List[str], List[Dict[str, Any]]]:
+        """
+        Search the coordinator's keyword and planned sub-queries concurrently.
+
+        The keyword search starts while the sub-queries are still being planned.
+        Results are merged with reciprocal-rank fusion, which also drops
+        duplicate URLs and duplicate content.
+        """
+        keyword = state.get("search_keyword") or state.get("query")
+        use_cache = state.get("use_cache", True)
+        semaphore = asyncio.Semaphore(settings.RESEARCH_CONCURRENCY)
+
+        async def run(search_query: str) -> List[Dict[str, Any]]:
+            async with semaphore:
+                try:
+                    response = await self.search_engine.asearch(
+                        search_query, settings.RESEARCH_RESULTS_PER_QUERY, use_cache=use_cache
+                    )
+                    return response.get("results", [])
+                except Exception as e:
+                    print(f"Warning: Search for {search_query!r} failed: {e}")
+                    return []
+
+        async def warm() -> List[Dict[str, Any]]:
+            # Results of the search the coordinator started speculatively, if any
+            speculation = await speculator.claim(state.get("speculation_id"))
+            return speculation["results"] if speculation else []
+
+        keyword_search = asyncio.create_task(run(keyword))
+        warm_search = asyncio.create_task(warm())
+        try:
+            seen = {normalize_query(keyword)}
+            sub_queries = []
+            for sub_query in await self._plan_queries(state):
+                if normalize_query(sub_query) not in seen:
+                    seen.add(normalize_query(sub_query))
+                    sub_queries.append(sub_query)
+            sub_queries = sub_queries[:settings.RESEARCH_SUB_QUERIES]
+            rankings = await asyncio.gather(keyword_search, warm_search, *[run(q) for q in sub_queries])
+        finally:
+            keyword_search.cancel()
+            warm_search.cancel()
+
+        merged = reciprocal_rank_fusion(rankings, limit=settings.RESEARCH_MAX_SOURCES)
+        return [keyword] + sub_queries, merged
+
+    async def process(self, state: State) -> Command:
+        query = state.get("query")
+        locale = state.get("locale", "en")
+        cached = await lookup_answer(state)
+        if cached is not None:
+            # The reporter will serve the cached report; skip searching. This is the request's only lookup
+            return Command(goto="reporter_node", update={"search_result": cached.sources, "locale": locale,
+                                                         "cached_answer": cached.answer})
+        if settings.RESEARCH_MODE == "fanout":
+            _, results = await self._fan_out(state)
+            return Command(goto="reporter_node",
+                           update={"search_result": await self._assemble_context(query, results), "locale": locale})
+        prompt_content = self.prompt_template.render(query=query, locale=locale, CURRENT_TIME=state.get("current_time"))
 
         messages = [
             SystemMessage(content=prompt_content),
             HumanMessage(content=query),
             HumanMessage(content=state.get("search_keyword")),
         ]
+        warm = await self._warm_messages(state)
+        messages.extend(warm)
 
-        search_result = await agent.ainvoke({"messages": messages})
+        # Each model call in the run takes its own LLM slot, each search a search slot
+        search_result = await self.agent.ainvoke({"messages": messages}, config=self._request_config(state))
         result_messages = search_result.get("messages", [])
-        ret = self.parse_message(result_messages)
+        ret = await self.build_search_result(query, warm + result_messages[len(messages):])
 
         return Command(goto="reporter_node", update={"search_result": ret, "locale": locale})
 
     async def process_stream(self, state: State):
         query = state.get("query")
         locale = state.get("locale", "en")
+        cached = await lookup_answer(state)
+        if cached is not None:
+            # The reporter will serve the cached report; skip searching
+            yield Command(
+                goto="reporter_node",
+                update={"search_result": cached.sources, "locale": locale, "cached_answer": cached.answer,
+                        "stream_buffer": None}
+            )
+            return
+        if settings.RESEARCH_MODE == "fanout":
+            queries, results = await self._fan_out(state)
+            yield Command(
+                goto="researcher_node",
+                update={"stream_buffer": f"Searched {len(queries)} queries: {'; '.join(queries)} "
+                                         f"({len(results)} unique sources)"}
+            )
+            yield Command(
+                goto="reporter_node",
+                update={"search_result": await self._assemble_context(query, results), "locale": locale,
+                        "stream_buffer": None}
+            )
+            return
         prompt_content = self.prompt_template.render(query=query, locale=locale, CURRENT_TIME=state.get("current_time"))
 
-        search_tool = Tool(
-            name="web_search_tool",
-            func=self._search,
-            description="Useful for when you need to search the web for information about the user query",
-        )
-
-        agent = create_react_agent(
-            model=self.llm,
-            tools=[search_tool],
-        )
-
         messages = [
             SystemMessage(content=prompt_content),
             HumanMessage(content=query),
             HumanMessage(content=state.get("search_keyword")),
         ]
+        warm = await self._warm_messages(state)
+        if warm:
+            # Sources are already in hand; show them before the agent's first step
+            messages.extend(warm)
+            yield Command(goto="researcher_node", update={"stream_buffer": warm[-1].content})
 
         # Stream the response
         print("[DEBUG] ResearcherAgent: Starting streaming response")
 
         final_messages_from_stream = [] 
 
-        async for chunk in agent.astream({"messages": messages}):
+        # Each model call in the run takes its own LLM slot, each search a search slot
+        async for chunk in self.agent.astream({"messages": messages}, config=self._request_config(state)):
             if chunk and "messages" in chunk:
                 last_message = chunk["messages"][-1]
-                final_messages_from_stream.append(last_message) 
+                # Each chunk is the full message list; keep everything after our inputs
+                final_messages_from_stream = chunk["messages"][len(messages):]
                 #print type
                 if isinstance(last_message, AIMessage):
                     state["stream_buffer"] = last_message.content
@@ -107,9 +247,8 @@ class ResearcherAgent(BaseAgent):
                         update={"stream_buffer": state.get("stream_buffer")}
                     )
 
-
         # Get final result
-        ret = self.parse_message(final_messages_from_stream)
+        ret = await self.build_search_result(query, warm + final_messages_from_stream)
 
         # Update state with final result
         state["search_result"] = ret
@@ -124,11 +263,35 @@ class ResearcherAgent(BaseAgent):
             }
         )
 
-    def parse_message(self, messages):
-        ret = []
-        for message in messages:
-            if isinstance(message, AIMessage):
-                ret.append(message.content)
-            elif isinstance(message, ToolMessage):
-                ret.append(message.content)
-        return "\n".join(ret)
+    async def _warm_messages(self, state: State) -> List[Any]:
+        """
+        Turn the coordinator's speculative search into a completed tool call,
+        so the ReAct agent starts with those results instead of repeating the search.
+        """
+        speculation = await speculator.claim(state.get("speculation_id"))
+        if speculation is None:
+            return []
+        call_id = f"speculative_{state.get('speculation_id')}"
+        return [
+            AIMessage(content="", tool_calls=[{
+                "name": self.search_tool.name, "args": {"__arg1": speculation["query"]}, "id": call_id,
+            }]),
+            ToolMessage(content=format_results(speculation["results"]), artifact=speculation["results"],
+                        tool_call_id=call_id, name=self.search_tool.name),
+        ]
+
+    @staticmethod
+    def _request_config(state: State) -> RunnableConfig:
+        return {"configurable": {"use_cache": state.get("use_cache", True)}}
+
+    async def build_search_result(self, query: str, messages) -> str:
+        """
+        Build the reporter's context from the ReAct run: the agent's own notes
+        plus the search results it retrieved, fused, de-duplicated and packed
+        into the token budget.
+        """
+        notes = [message.content for message in messages if isinstance(message, AIMessage) and message.content]
+        rankings = [message.artifact for message in messages
+                    if isinstance(message, ToolMessage) and isinstance(message.artifact, list)]
+        return await self._assemble_context(query, reciprocal_rank_fusion(rankings), notes)
+
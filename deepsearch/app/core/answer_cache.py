@@ -0,0 +1,30 @@
+import asyncio
+from typing import Optional
+
+from common.semantic_cache import CachedAnswer, SemanticAnswerCache, SemanticCacheConfig
+
+from app.config.settings import settings
+from app.core.shared import shared_store
+from app.core.types import State
+
+answer_cache = SemanticAnswerCache(SemanticCacheConfig(
+    threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+    match_terms=settings.SEMANTIC_CACHE_MATCH_TERMS,
+    ttl=settings.SEMANTIC_CACHE_TTL,
+    max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+), store=shared_store) if settings.SEMANTIC_CACHE_ENABLED else None
+
+
+async def lookup_answer(state: State) -> Optional[CachedAnswer]:
+    """
+    Find a cached report for this query (or a paraphrase of it) in the query's locale.
+    Runs on a thread, since it may read answers from the shared store.
+    """
+    if answer_cache is None or not state.get("use_cache", True):
+        return None
+    return await asyncio.to_thread(answer_cache.lookup, state.get("query"), state.get("locale", "en"))
+
+
+async def store_answer(state: State, report: str, sources) -> None:
+    if answer_cache is not None:
+        await asyncio.to_thread(answer_cache.store, state.get("query"), report, sources, state.get("locale", "en"))
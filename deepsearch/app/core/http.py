@@ -0,0 +1,15 @@
+from common.http import HTTPPoolConfig, PooledHTTPClient
+
+from app.config.settings import settings
+
+# Process-wide HTTP client, started and closed by the FastAPI lifespan in main.py
+http_client = PooledHTTPClient(HTTPPoolConfig(
+    max_connections=settings.HTTP_MAX_CONNECTIONS,
+    max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+    http2=settings.HTTP2,
+    connect_timeout=settings.HTTP_CONNECT_TIMEOUT,
+    read_timeout=settings.HTTP_READ_TIMEOUT,
+    write_timeout=settings.HTTP_WRITE_TIMEOUT,
+    pool_timeout=settings.HTTP_POOL_TIMEOUT,
+))
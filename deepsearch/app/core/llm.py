@@ -1,16 +1,215 @@
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.rate_limiters import BaseRateLimiter
 from langchain_openai import ChatOpenAI
 
+from common.admission import Overloaded, TokenBucket
+from common.http import HTTPPoolConfig
+from common.llm import LLMClientRegistry
+from common.resilience import CircuitBreaker, CircuitOpen, is_retryable
+
 from app.config.settings import settings
+from app.core.admission import admission
+from app.core.resilience import llm_breaker
+from app.core.telemetry import llm_cached_tokens, llm_errors, llm_seconds, llm_tokens, llm_ttft_seconds, tracer
+
+
+class BucketRateLimiter(BaseRateLimiter):
+    """
+    Feed LangChain's per-call rate-limit hook from a shared token bucket.
+    A call that would wait longer than ``max_wait`` is refused with
+    ``Overloaded`` (a 429 for the client) instead of blocking. With a
+    ``breaker``, calls are refused with ``CircuitOpen`` while it is open.
+    """
+
+    def __init__(self, bucket: TokenBucket, breaker: Optional[CircuitBreaker] = None,
+                 max_wait: Optional[float] = None, name: str = "openai"):
+        self.bucket = bucket
+        self.breaker = breaker
+        self.max_wait = max_wait
+        self.name = name
+
+    def _try_now(self) -> bool:
+        """Non-blocking: take a token only if one is free right now."""
+        if self.bucket.reserve():
+            self.bucket.refund()
+            return False
+        return True
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        if self.breaker is not None:
+            self.breaker.before_call()
+        if not blocking:
+            return self._try_now()
+        self.bucket.acquire_sync(timeout=self.max_wait, name=self.name)
+        return True
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        if self.breaker is not None:
+            self.breaker.before_call()
+        if not blocking:
+            return self._try_now()
+        await self.bucket.acquire(timeout=self.max_wait, name=self.name)
+        return True
 
 
-def get_llm():
+class BreakerCallback(BaseCallbackHandler):
+    """Report the outcome of each chat-model call to a circuit breaker."""
+
+    def __init__(self, breaker: CircuitBreaker):
+        self.breaker = breaker
+
+    def on_llm_end(self, response: Any, **kwargs: Any) -> None:
+        self.breaker.record_success()
+
+    def on_llm_error(self, error: BaseException, **kwargs: Any) -> None:
+        if isinstance(error, (CircuitOpen, Overloaded)):
+            return  # Refused locally; upstream was never called
+        if is_retryable(error):
+            self.breaker.record_failure()
+        else:
+            self.breaker.abort()
+
+
+class TelemetryCallback(BaseCallbackHandler):
     """
-    Configure and return an OpenAI compatible LLM.
+    Time each chat-model call (wall time and time to first token), count its
+    tokens, including prompt tokens the provider served from its prefix
+    cache, and record it as a span of the request's trace. Metrics are
+    labelled with the graph node that made the call.
     """
-    return ChatOpenAI(
-        api_key=settings.OPENAI_API_KEY,
-        base_url=settings.OPENAI_BASE_URL if settings.OPENAI_BASE_URL else None,
-        model_name=settings.OPENAI_MODEL_NAME,
-        temperature=0.7,
-        streaming=True  # Enable streaming
-    )
+
+    run_inline = True  # Runs in the caller's context, so spans find their parent
+
+    def __init__(self):
+        self._calls: Dict[UUID, Dict[str, Any]] = {}
+
+    def on_chat_model_start(self, serialized: Any, messages: Any, *, run_id: UUID,
+                            metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        metadata = metadata or {}
+        # The top-level graph node, also for calls inside a subgraph such as the ReAct agent
+        namespace = metadata.get("checkpoint_ns") or metadata.get("langgraph_checkpoint_ns") or ""
+        node = namespace.split(":")[0] or metadata.get("langgraph_node", "none")
+        self._calls[run_id] = {"node": node, "span": tracer.start_span("llm", node=node),
+                               "first_token": None, "chunks": 0}
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        call = self._calls.get(run_id)
+        if call is None:
+            return
+        if call["first_token"] is None:
+            call["first_token"] = call["span"].elapsed()
+            llm_ttft_seconds.observe(call["first_token"], node=call["node"])
+        call["chunks"] += 1
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        call = self._calls.pop(run_id, None)
+        if call is None:
+            return
+        usage = _usage(response)
+        # Without reported usage, count streamed chunks; roughly one token each
+        tokens_in, tokens_out = usage.get("input_tokens", 0), usage.get("output_tokens", call["chunks"])
+        cached = usage.get("cached_tokens", 0)
+        node, span = call["node"], call["span"]
+        llm_tokens.inc(tokens_in, node=node, direction="in")
+        llm_tokens.inc(tokens_out, node=node, direction="out")
+        llm_cached_tokens.inc(cached, node=node)
+        span.set(tokens_in=tokens_in, tokens_out=tokens_out, tokens_cached=cached,
+                 ttft_ms=None if call["first_token"] is None else round(call["first_token"] * 1000, 1))
+        span.end()
+        llm_seconds.observe(span.elapsed(), node=node)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        call = self._calls.pop(run_id, None)
+        if call is None:
+            return
+        call["span"].end(error=error)
+        llm_errors.inc(node=call["node"])
+
+
+def _usage(response: Any) -> Dict[str, int]:
+    """Token usage of an ``LLMResult``: from the message metadata (streaming) or the provider output."""
+    for generations in getattr(response, "generations", None) or ():
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if metadata:
+                return {"input_tokens": metadata.get("input_tokens", 0),
+                        "output_tokens": metadata.get("output_tokens", 0),
+                        "cached_tokens": (metadata.get("input_token_details") or {}).get("cache_read", 0)}
+    usage = (getattr(response, "llm_output", None) or {}).get("token_usage") or {}
+    if usage:
+        return {"input_tokens": usage.get("prompt_tokens", 0), "output_tokens": usage.get("completion_tokens", 0),
+                "cached_tokens": (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)}
+    return {}
+
+
+# Process-wide LLM client; its pool is closed by the FastAPI lifespan in main.py
+llm_clients = LLMClientRegistry(
+    api_key=settings.OPENAI_API_KEY,
+    base_url=settings.OPENAI_BASE_URL,
+    model=settings.OPENAI_MODEL_NAME,
+    config=HTTPPoolConfig(
+        max_connections=settings.LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+        http2=settings.LLM_HTTP2,
+        connect_timeout=settings.LLM_CONNECT_TIMEOUT,
+        read_timeout=settings.LLM_READ_TIMEOUT,
+        write_timeout=settings.LLM_WRITE_TIMEOUT,
+        pool_timeout=settings.LLM_POOL_TIMEOUT,
+    ),
+    roles=settings.LLM_ROLES,
+    max_retries=max(0, settings.LLM_RETRY_ATTEMPTS - 1),  # The SDK backs off exponentially with jitter
+)
+
+class AdmittedChatOpenAI(ChatOpenAI):
+    """
+    ChatOpenAI that holds an admission "llm" slot for each model call, and
+    only for that call. Agents and the ReAct loop never hold a slot across
+    several calls or across the searches between them, so nested calls cannot
+    wait on slots their own request already holds.
+    """
+
+    async def _agenerate(self, *args: Any, **kwargs: Any):
+        if self.streaming:
+            # Delegates to _astream, which takes the slot
+            return await super()._agenerate(*args, **kwargs)
+        async with admission.slot("llm"):
+            return await super()._agenerate(*args, **kwargs)
+
+    async def _astream(self, *args: Any, **kwargs: Any):
+        async with admission.slot("llm"):
+            async for chunk in super()._astream(*args, **kwargs):
+                yield chunk
+
+
+# Every agent's model is a copy of this one: same clients, different request parameters
+_base_llm = AdmittedChatOpenAI(
+    api_key=settings.OPENAI_API_KEY,
+    model_name=settings.OPENAI_MODEL_NAME,
+    root_async_client=llm_clients.client,
+    async_client=llm_clients.client.chat.completions,
+    streaming=True,  # Enable streaming
+    rate_limiter=BucketRateLimiter(admission.buckets["openai"], llm_breaker, max_wait=admission.config.max_wait),
+    stream_usage=settings.LLM_STREAM_USAGE,
+    callbacks=[BreakerCallback(llm_breaker), TelemetryCallback()],
+)
+
+
+def get_llm(role: str = "default"):
+    """
+    Configure and return an OpenAI compatible LLM for an agent role.
+
+    Roles share ``llm_clients``'s connection pool; ``LLM_ROLES`` can set their
+    temperature, max_tokens or model without opening new connections.
+    """
+    params = llm_clients.params(role, temperature=0.7)
+    params["model_name"] = params.pop("model")
+    return _base_llm.model_copy(update=params)
+
+
+async def preconnect_llm() -> Dict[str, str]:
+    """Open a pooled connection to the LLM endpoint ahead of the first call."""
+    return await llm_clients.preconnect()
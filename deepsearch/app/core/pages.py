@@ -0,0 +1,18 @@
+from typing import Optional
+
+from common.fetch import FetchConfig, PageFetcher
+
+from app.config.settings import settings
+from app.core.http import http_client
+
+# Downloads the top search results over the shared pool; None when FETCH_PAGES is off
+page_fetcher: Optional[PageFetcher] = PageFetcher(lambda: http_client.client, FetchConfig(
+    top_k=settings.FETCH_TOP_K,
+    max_bytes=settings.FETCH_MAX_BYTES,
+    max_chars=settings.FETCH_MAX_CHARS,
+    per_host=settings.FETCH_PER_HOST,
+    concurrency=settings.FETCH_CONCURRENCY,
+    timeout=settings.FETCH_TIMEOUT,
+    cache_dir=settings.FETCH_CACHE_DIR,
+    cache_ttl=settings.FETCH_CACHE_TTL,
+)) if settings.FETCH_PAGES else None
@@ -0,0 +1,55 @@
+import os
+from typing import Any, Dict
+
+import jinja2
+import jinja2.meta
+
+PROMPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Separates a template's static part from its per-request part
+DYNAMIC_MARKER = "{# dynamic #}"
+
+# One environment for every agent prompt
+environment = jinja2.Environment(
+    loader=jinja2.FileSystemLoader(PROMPTS_DIR),
+    keep_trailing_newline=True,
+    auto_reload=False,
+)
+
+
+class Prompt:
+    """
+    A prompt template compiled into a static prefix and a dynamic suffix.
+
+    Everything above ``DYNAMIC_MARKER`` is rendered once, here, and must not
+    use any variable; the time, query, locale and search results go below
+    it. Every call therefore starts with the same bytes, which lets
+    OpenAI-compatible backends (and vLLM-style servers with prefix caching)
+    reuse the cached prefix instead of processing it again.
+    """
+
+    def __init__(self, name: str, env: jinja2.Environment = environment):
+        source, _, _ = env.loader.get_source(env, name)
+        static, marker, dynamic = source.partition(DYNAMIC_MARKER)
+        if not marker:
+            raise ValueError(f"Prompt {name} has no {DYNAMIC_MARKER} line before its per-request part")
+        variables = jinja2.meta.find_undeclared_variables(env.parse(static))
+        if variables:
+            raise ValueError(f"The static part of prompt {name} uses {sorted(variables)}; "
+                             f"move them below {DYNAMIC_MARKER}")
+        self.name = name
+        self.prefix = env.from_string(static).render()
+        self.suffix = env.from_string(dynamic.lstrip("\n"))
+
+    def render(self, **context: Any) -> str:
+        return self.prefix + self.suffix.render(**context)
+
+
+# Compiled once at import, so a broken template fails at startup
+prompts: Dict[str, Prompt] = {
+    name[:-len(".md")]: Prompt(name) for name in sorted(os.listdir(PROMPTS_DIR)) if name.endswith(".md")
+}
+
+
+def get_prompt(name: str) -> Prompt:
+    return prompts[name]
@@ -0,0 +1,20 @@
+from common.resilience import CircuitBreaker, ResilienceConfig
+
+from app.config.settings import settings
+
+# Retries, hedging and circuit breaking for remote search providers
+search_resilience = ResilienceConfig(
+    retry_attempts=settings.SEARCH_RETRY_ATTEMPTS,
+    retry_base_delay=settings.SEARCH_RETRY_BASE_DELAY,
+    retry_max_delay=settings.SEARCH_RETRY_MAX_DELAY,
+    hedge=settings.SEARCH_HEDGE,
+    hedge_quantile=settings.SEARCH_HEDGE_QUANTILE,
+    hedge_delay=settings.SEARCH_HEDGE_DELAY,
+    hedge_min_delay=settings.SEARCH_HEDGE_MIN_DELAY,
+    breaker_failure_threshold=settings.BREAKER_FAILURE_THRESHOLD,
+    breaker_recovery_time=settings.BREAKER_RECOVERY_TIME,
+)
+
+# Chat-model calls go through LangChain, which retries them itself (``max_retries``);
+# the breaker is checked and fed through the model's rate-limiter hook and callbacks
+llm_breaker = CircuitBreaker("openai", settings.BREAKER_FAILURE_THRESHOLD, settings.BREAKER_RECOVERY_TIME)
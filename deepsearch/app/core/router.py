@@ -0,0 +1,201 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from logging.handlers import QueueListener
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional
+
+from common.semantic_cache import guess_locale
+
+CASUAL = "casual_conversation"
+RESEARCH = "requires_research"
+
+_PUNCT_RE = re.compile(r"[\s\W_]+", re.UNICODE)
+_WORD_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+# Whole messages that are small talk in any supported language
+_CASUAL_EXACT = frozenset("""
+hi hello hey yo hiya howdy greetings thanks thankyou thx ty ok okay cool bye goodbye
+goodmorning goodafternoon goodevening goodnight howareyou whatsup sup whoareyou
+whatsyourname whatisyourname whatcanyoudo helpme test testing
+你好 您好 嗨 哈喽 谢谢 多谢 早上好 下午好 晚上好 晚安 再见 你是谁 你能做什么 你叫什么
+こんにちは こんばんは おはよう ありがとう さようなら 안녕 안녕하세요 감사합니다
+""".split())
+_GREETING_PREFIXES = ("hi ", "hello ", "hey ", "thanks ", "thank you", "good morning", "good evening",
+                      "你好", "您好", "谢谢")
+
+_QUESTION_WORDS = frozenset("""
+what why how when where who whom which whose is are does do did can could should would will
+compare explain analyze analyse research investigate summarize summarise list find latest news
+history price prices cost review reviews difference vs versus impact future trend trends
+tell give show describe
+""".split())
+_CJK_RESEARCH_MARKERS = ("什么", "为什么", "怎么", "如何", "多少", "哪", "吗", "研究", "分析", "对比", "比较",
+                         "介绍", "最新", "新闻", "历史", "未来", "影响", "价格", "趋势", "なぜ", "どう", "何")
+
+# Anything that may need a refusal or careful handling goes to the LLM
+_SENSITIVE = re.compile(
+    r"system prompt|ignore (all |the )?(previous|above)|jailbreak|pretend to be|impersonat|"
+    r"bomb|explosive|weapon|kill|suicide|self-harm|hack|malware|drugs?\b|"
+    r"提示词|系统指令|炸弹|武器|自杀|黑客",
+    re.IGNORECASE,
+)
+
+_LEADING_REQUEST = re.compile(
+    r"^((hi|hello|hey)[,!\s]+)?(please\s+)?(can you\s+|could you\s+)?"
+    r"(tell me( about)?|search( for)?|look up|find( out)?( about)?|research|investigate|explain|give me( an overview of)?|what (is|are|was|were)( the)?|"
+    r"who (is|was)|how (does|do|did|to))\s+",
+    re.IGNORECASE,
+)
+_LEADING_REQUEST_CJK = re.compile(r"^(请|帮我|麻烦)?(深入)?(研究|搜索|查一下|查询|介绍一下|介绍|分析)(一下)?\s*")
+_KEYWORD_STOPWORDS = frozenset("the a an of in on for about to me please is are was were".split())
+
+_RESPONSES = {
+    CASUAL: {
+        "en": "Hello! I'm DeepSearch. How can I help you today?",
+        "zh": "你好！我是 DeepSearch，有什么可以帮您？",
+        "ja": "こんにちは！DeepSearch です。何をお手伝いしましょうか？",
+        "ko": "안녕하세요! DeepSearch입니다. 무엇을 도와드릴까요?",
+    },
+    RESEARCH: {
+        "en": "Let me gather that information for you.",
+        "zh": "让我为您收集相关信息。",
+        "ja": "情報を収集します。",
+        "ko": "관련 정보를 수집하겠습니다.",
+    },
+}
+
+
+@dataclass
+class RouteDecision:
+    coordinator: Optional[str]  # None when the classifier is unsure
+    confidence: float
+    locale: str
+    reason: str
+    search_keyword: Optional[str] = None
+    response: Optional[str] = None
+    latency_us: float = 0.0
+
+    def as_update(self) -> Dict[str, Any]:
+        return {
+            "coordinator": self.coordinator,
+            "response": self.response,
+            "locale": self.locale,
+            "search_keyword": self.search_keyword,
+        }
+
+
+def extract_keyword(query: str) -> str:
+    """Strip request phrasing and filler words, keeping the topic the user asked about."""
+    keyword = query.strip().rstrip("?？!！.。")
+    keyword = _LEADING_REQUEST_CJK.sub("", _LEADING_REQUEST.sub("", keyword))
+    words = keyword.split()
+    while words and words[0].casefold() in _KEYWORD_STOPWORDS:
+        words.pop(0)
+    return " ".join(words) or query.strip()
+
+
+class QueryRouter:
+    """
+    Heuristic pre-classifier for the coordinator.
+
+    Settles obvious small talk and obvious research questions locally, with
+    a canned response and an extracted search keyword. Everything else
+    (including anything that may need a refusal) returns a decision whose
+    ``coordinator`` is None, meaning "ask the LLM".
+    """
+
+    def __init__(self, min_confidence: float = 0.85, log_path: Optional[str] = None):
+        self.min_confidence = min_confidence
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self._records: Optional[queue.SimpleQueue] = None
+        self._writer_pid: Optional[int] = None
+        self.counts = {"fast_casual": 0, "fast_research": 0, "fallback": 0}
+
+    def _decide(self, query: str, locale: str):
+        text = query.strip()
+        folded = text.casefold()
+        compact = _PUNCT_RE.sub("", folded)
+        words = _WORD_RE.findall(folded)
+        has_cjk = locale in ("zh", "ja", "ko")
+
+        if _SENSITIVE.search(text):
+            return None, 0.0, "sensitive"
+        if not compact or compact in _CASUAL_EXACT:
+            return CASUAL, 0.99, "casual_lexicon"
+        if len(words) <= 4 and folded.startswith(_GREETING_PREFIXES):
+            rest = [w for w in words[1:] if w in _QUESTION_WORDS]
+            if not rest:
+                return CASUAL, 0.9, "greeting"
+
+        question = text.endswith(("?", "？")) or bool(words and words[0] in _QUESTION_WORDS)
+        if has_cjk:
+            question = question or any(marker in text for marker in _CJK_RESEARCH_MARKERS)
+            substantial = len(compact) >= 6
+        else:
+            substantial = len([w for w in words if w not in _QUESTION_WORDS and w not in _KEYWORD_STOPWORDS]) >= 2
+        if question and substantial:
+            return RESEARCH, 0.9, "question"
+        if substantial and (len(words) >= 8 or (has_cjk and len(compact) >= 15)):
+            return RESEARCH, 0.85, "long_request"
+        return None, 0.5, "uncertain"
+
+    def classify(self, query: str, locale: Optional[str] = None) -> RouteDecision:
+        start = time.perf_counter()
+        detected = guess_locale(query or "")
+        # A non-Latin script overrides the caller's default locale
+        locale = detected if detected != "en" or not locale else locale
+        route, confidence, reason = self._decide(query or "", locale)
+        if route is not None and confidence < self.min_confidence:
+            route = None
+        decision = RouteDecision(route, confidence, locale, reason)
+        if route is not None:
+            decision.response = _RESPONSES[route].get(locale, _RESPONSES[route]["en"])
+            if route == RESEARCH:
+                decision.search_keyword = extract_keyword(query)
+        decision.latency_us = (time.perf_counter() - start) * 1e6
+        self.log(query, decision, source="fast")
+        return decision
+
+    def log(self, query: str, decision: RouteDecision, source: str, **extra: Any) -> None:
+        """
+        Count a decision and append it to ``log_path`` as a JSON line, for
+        offline hit-rate and accuracy analysis. ``source`` is "fast", "llm"
+        or "shadow" (an LLM check of a fast decision). The line is queued and
+        written by a background thread, so the event loop never waits on disk.
+        """
+        with self._lock:
+            if source == "fast":
+                if decision.coordinator == CASUAL:
+                    self.counts["fast_casual"] += 1
+                elif decision.coordinator == RESEARCH:
+                    self.counts["fast_research"] += 1
+                else:
+                    self.counts["fallback"] += 1
+            if not self.log_path:
+                return
+            record = {"ts": time.time(), "source": source, "query": query, **asdict(decision), **extra}
+            self._writer().put(logging.makeLogRecord({"msg": json.dumps(record, ensure_ascii=False)}))
+
+    def _writer(self) -> queue.SimpleQueue:
+        # Threads do not survive fork(), so each worker process starts its own writer
+        if self._writer_pid != os.getpid():
+            handler = logging.FileHandler(self.log_path, encoding="utf-8", delay=True)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._records = queue.SimpleQueue()
+            listener = QueueListener(self._records, handler)
+            listener.start()
+            atexit.register(listener.stop)
+            self._writer_pid = os.getpid()
+        return self._records
+
+    def stats(self) -> Dict[str, Any]:
+        total = sum(self.counts.values())
+        fast = self.counts["fast_casual"] + self.counts["fast_research"]
+        return {**self.counts, "hit_rate": round(fast / total, 4) if total else 0.0}
@@ -1,34 +1,145 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
 from tavily import TavilyClient
 
+from common.admission import Overloaded
+from common.cache import SearchCache, SearchCacheConfig, cache_key
+from common.resilience import CircuitOpen
+from common.search import SearchBackend, create_provider
+from common.singleflight import SingleFlight, SyncSingleFlight
+
 from app.config.settings import settings
+from app.core.admission import admission
+from app.core.http import http_client
+from app.core.resilience import search_resilience
+from app.core.shared import shared_store
+from app.core.telemetry import observe_search, tracer
+
+# Bounded pool for providers that only ship a blocking SDK, so a burst of
+# searches cannot spawn an unbounded number of threads.
+_sync_executor = ThreadPoolExecutor(max_workers=settings.SEARCH_SYNC_WORKERS, thread_name_prefix="search")
+
+search_cache = SearchCache(SearchCacheConfig(
+    max_entries=settings.SEARCH_CACHE_MAX_ENTRIES,
+    ttl=settings.SEARCH_CACHE_TTL,
+    stale_ttl=settings.SEARCH_CACHE_STALE_TTL,
+    disk_path=settings.SEARCH_CACHE_PATH,
+), store=shared_store)
+search_flight = SingleFlight(store=shared_store)
+sync_search_flight = SyncSingleFlight(store=shared_store)
+
+
+def _provider_options(name: str):
+    """Constructor arguments of the built-in providers; registered providers are built without any."""
+    if name == "tavily":
+        return dict(client=lambda: http_client.client, api_key=settings.TAVILY_API_KEY,
+                    base_url=settings.TAVILY_BASE_URL,
+                    sdk=TavilyClient(api_key=settings.TAVILY_API_KEY, api_base_url=settings.TAVILY_BASE_URL),
+                    search_depth="advanced", include_images=True)
+    if name == "local":
+        return dict(path=settings.LOCAL_SEARCH_PATH, index_dir=settings.LOCAL_INDEX_DIR,
+                    dense=settings.LOCAL_INDEX_DENSE, refresh_interval=settings.LOCAL_INDEX_REFRESH_INTERVAL)
+    return {}
+
+
+search_backend = SearchBackend(
+    [create_provider(name, **_provider_options(name))
+     for name in (n.strip() for n in settings.SEARCH_PROVIDERS.split(",")) if name],
+    mode=settings.SEARCH_MODE,
+    race_min_results=settings.SEARCH_RACE_MIN_RESULTS,
+    merge_timeout=settings.SEARCH_MERGE_TIMEOUT,
+    resilience=search_resilience,
+    # Every attempt, including retries and hedges, counts against the provider's rate limit
+    before_attempt=admission.throttle,
+    before_attempt_sync=admission.throttle_sync,
+)
 
 
 class SearchEngine:
     def __init__(self):
-        self.client = TavilyClient(api_key=settings.TAVILY_API_KEY)
+        self.backend = search_backend
+        self.http_client = http_client
+        self.cache = search_cache
 
-    def search(self, query: str, max_results: int = 10):
+    def search(self, query: str, max_results: int = 10, use_cache: bool = True):
         """
-        Execute a search query using Tavily.
-        
+        Execute a search query on the configured providers.
+
         Args:
             query: Search query string
             max_results: Maximum number of results to return
-            
+            use_cache: Serve from and store into the search-result cache
+
         Returns:
             List of search results
         """
+        key = cache_key(query, "advanced", max_results, self.backend.key)
+
+        def fetch():
+            if not settings.COALESCE_REQUESTS:
+                return self._search(query, max_results)
+            return sync_search_flight.do(key, lambda: self._search(query, max_results))
+
+        with tracer.span("search", query=query, method="sync") as span:
+            response = self.cache.get_or_fetch_sync(key, fetch, use_cache)
+            span.set(results=len(response.get("results") or []))
+        observe_search("sync", response, span.elapsed())
+        return response
+
+    def _search(self, query: str, max_results: int):
         try:
             print(f"Executing search with query: {query}")
-            response = self.client.search(
-                query=query,
-                search_depth="advanced",
-                max_results=max_results,
-                include_answer=False,
-                include_raw_content=False,
-                include_images=True,
-            )
+            response = self.backend.search_sync(query, max_results)
             print(f"Search response: {response}")
             return response
+        except CircuitOpen:
+            raise
         except Exception as e:
             raise ValueError(f"Search failed: {str(e)}") from e
+
+    async def asearch(self, query: str, max_results: int = 10, use_cache: bool = True):
+        """
+        Async version of ``search`` that does not block the event loop.
+
+        Uses the shared pooled HTTP client when ``SEARCH_ASYNC_HTTP`` is on,
+        otherwise runs the sync SDK on the bounded search thread pool.
+        """
+        if not settings.SEARCH_ASYNC_HTTP:
+            # The provider rate limits apply per attempt, inside search_sync
+            async with admission.slot("search"):
+                return await run_sync(self.search, query, max_results, use_cache)
+
+        key = cache_key(query, "advanced", max_results, self.backend.key)
+
+        async def fetch():
+            if not settings.COALESCE_REQUESTS:
+                return await self._asearch(query, max_results)
+            return await search_flight.do(key, lambda: self._asearch(query, max_results))
+
+        with tracer.span("search", query=query, method="async") as span:
+            response = await self.cache.get_or_fetch(key, fetch, use_cache)
+            span.set(results=len(response.get("results") or []))
+        observe_search("async", response, span.elapsed())
+        return response
+
+    async def _asearch(self, query: str, max_results: int):
+        try:
+            print(f"Executing async search with query: {query}")
+            if not self.http_client.started:
+                await self.http_client.start()
+            async with admission.slot("search"):
+                return await self.backend.search(query, max_results)
+        except (Overloaded, CircuitOpen):
+            raise
+        except Exception as e:
+            raise ValueError(f"Search failed: {str(e)}") from e
+
+
+async def run_sync(func, *args, **kwargs):
+    """Run a blocking provider call on the bounded search thread pool, in the caller's context."""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_sync_executor, functools.partial(context.run, func, *args, **kwargs))
@@ -0,0 +1,13 @@
+from typing import Optional
+
+from common.serve import resolve_workers
+from common.shared import SharedStore, default_store_url, open_store
+
+from app.config.settings import settings
+
+# State shared by the worker processes; each worker opens its own connection,
+# so the store is safe to create before forking. None with a single process.
+shared_store: Optional[SharedStore] = None
+if settings.SHARED_STORE_URL or resolve_workers(settings.WORKERS) > 1:
+    shared_store = open_store(settings.SHARED_STORE_URL or default_store_url("deepsearch", settings.PORT),
+                              "deepsearch")
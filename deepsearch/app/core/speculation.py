@@ -0,0 +1,137 @@
+import asyncio
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from app.config.settings import settings
+from app.core.search_engine import SearchEngine
+from app.core.types import State
+
+
+class _Speculation:
+    __slots__ = ("query", "task", "started_at", "finished_at")
+
+    def __init__(self, query: str, task: asyncio.Task):
+        self.query = query
+        self.task = task
+        self.started_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        task.add_done_callback(self._finished)
+
+    def _finished(self, _task: asyncio.Task) -> None:
+        self.finished_at = time.monotonic()
+
+    def elapsed_ms(self) -> float:
+        """Time the search ran: until it finished, or until now if it still runs."""
+        return ((self.finished_at or time.monotonic()) - self.started_at) * 1000
+
+
+class SearchSpeculator:
+    """
+    Start a web search on the raw query while the coordinator is still deciding.
+
+    The coordinator hands the speculation id to the researcher through the
+    state when it routes to research, and cancels the search when it routes
+    to casual conversation. Speculations nobody claims within
+    ``SPECULATIVE_SEARCH_TTL`` (e.g. after a client disconnect) are dropped.
+    """
+
+    def __init__(self, search_engine: Optional[SearchEngine] = None, ttl: float = 60.0):
+        self.search_engine = search_engine or SearchEngine()
+        self.ttl = ttl
+        self._pending: Dict[str, _Speculation] = {}
+        self._prefetches = set()
+        self.counts = {"started": 0, "used": 0, "cancelled": 0, "expired": 0, "failed": 0, "prefetched": 0}
+        self.saved_ms = 0.0  # Search time already spent when the researcher picked the results up
+        self.wasted_ms = 0.0  # Search time spent on speculations that were thrown away
+
+    @staticmethod
+    def max_results() -> int:
+        # Match the researcher's first search so the cache entry is reusable
+        return settings.RESEARCH_RESULTS_PER_QUERY if settings.RESEARCH_MODE == "fanout" else 20
+
+    def start(self, state: State, force: bool = False) -> Optional[str]:
+        """
+        Kick off the search on the raw query; returns its id, or None when disabled.
+        ``force`` starts it regardless of ``SPECULATIVE_SEARCH``, once research is certain.
+        """
+        if not (settings.SPECULATIVE_SEARCH or force):
+            return None
+        self._expire()
+        query = state.get("query")
+        speculation_id = uuid.uuid4().hex
+        task = asyncio.create_task(
+            self.search_engine.asearch(query, self.max_results(), use_cache=state.get("use_cache", True))
+        )
+        # Failures surface to whoever claims the results; don't warn about unretrieved exceptions
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._pending[speculation_id] = _Speculation(query, task)
+        self.counts["started"] += 1
+        return speculation_id
+
+    def prefetch(self, query: str, state: State) -> None:
+        """Warm the search cache for a query the researcher is about to run."""
+        if not query or not state.get("use_cache", True):
+            return
+        task = asyncio.create_task(
+            self.search_engine.asearch(query, self.max_results(), use_cache=True)
+        )
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._prefetches.add(task)
+        task.add_done_callback(self._prefetches.discard)
+        self.counts["prefetched"] += 1
+
+    def cancel(self, speculation_id: Optional[str]) -> None:
+        """Drop a speculation the coordinator decided not to use."""
+        speculation = self._pending.pop(speculation_id, None) if speculation_id else None
+        if speculation is None:
+            return
+        self.counts["cancelled"] += 1
+        self.wasted_ms += speculation.elapsed_ms()
+        speculation.task.cancel()
+
+    async def claim(self, speculation_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        Wait for the speculative search and return ``{"query", "results"}``,
+        or None when there is nothing to claim or the search failed.
+        """
+        speculation = self._pending.pop(speculation_id, None) if speculation_id else None
+        if speculation is None:
+            return None
+        head_start = time.monotonic() - speculation.started_at
+        try:
+            response = await speculation.task
+        except asyncio.CancelledError:
+            speculation.task.cancel()
+            raise
+        except Exception as e:
+            self.counts["failed"] += 1
+            print(f"Warning: Speculative search for {speculation.query!r} failed: {e}")
+            return None
+        total = time.monotonic() - speculation.started_at
+        self.counts["used"] += 1
+        self.saved_ms += min(head_start, total) * 1000
+        results: List[Dict[str, Any]] = response.get("results", [])
+        return {"query": speculation.query, "results": results}
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        for speculation_id, speculation in list(self._pending.items()):
+            if now - speculation.started_at > self.ttl:
+                del self._pending[speculation_id]
+                speculation.task.cancel()
+                self.counts["expired"] += 1
+                self.wasted_ms += speculation.elapsed_ms()
+
+    def stats(self) -> Dict[str, Any]:
+        settled = self.counts["used"] + self.counts["cancelled"] + self.counts["expired"]
+        return {
+            **self.counts,
+            "pending": len(self._pending),
+            "waste_rate": round((self.counts["cancelled"] + self.counts["expired"]) / settled, 4) if settled else 0.0,
+            "saved_ms": round(self.saved_ms, 1),
+            "wasted_ms": round(self.wasted_ms, 1),
+        }
+
+
+speculator = SearchSpeculator(ttl=settings.SPECULATIVE_SEARCH_TTL)
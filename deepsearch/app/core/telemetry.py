@@ -0,0 +1,51 @@
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from common.telemetry import Registry, SamplingProfiler, Tracer, result_bytes
+
+from app.config.settings import settings
+
+# Exposed on /metrics; every worker process reports its own
+metrics = Registry("deepsearch_")
+query_seconds = metrics.histogram("query_duration_seconds", "Wall time of a query through the graph", ["mode"])
+node_seconds = metrics.histogram("node_duration_seconds", "Wall time of a graph node", ["node"])
+search_seconds = metrics.histogram("search_duration_seconds", "Wall time of a search, cache included", ["method"])
+search_results = metrics.histogram("search_results", "Results returned by a search", ["method"],
+                                   buckets=(0, 1, 2, 5, 10, 20, 50, 100))
+search_bytes = metrics.histogram("search_result_bytes", "Text bytes in the results of a search", ["method"],
+                                 buckets=(1e3, 4e3, 16e3, 64e3, 256e3, 1e6, 4e6))
+llm_seconds = metrics.histogram("llm_duration_seconds", "Wall time of a chat-model call", ["node"])
+llm_ttft_seconds = metrics.histogram("llm_time_to_first_token_seconds", "Time to the first streamed token", ["node"])
+llm_tokens = metrics.counter("llm_tokens_total", "Chat-model tokens, prompt (in) and completion (out)",
+                             ["node", "direction"])
+llm_cached_tokens = metrics.counter("llm_cached_prompt_tokens_total",
+                                    "Prompt tokens served from the provider's prefix cache", ["node"])
+llm_errors = metrics.counter("llm_errors_total", "Failed chat-model calls", ["node"])
+
+tracer = Tracer(settings.TRACE_SAMPLE_RATE, settings.TRACE_KEEP, settings.TRACE_EXPORT_PATH)
+profiler = SamplingProfiler(settings.PROFILE_INTERVAL_MS / 1000)
+
+# Set per request by the endpoints, like ``client_key``: the trace id when the
+# request is traced, and whether it is profiled
+request_trace: ContextVar[Optional[str]] = ContextVar("request_trace", default=None)
+request_profile: ContextVar[bool] = ContextVar("request_profile", default=False)
+
+
+def observe_search(method: str, response: Optional[Dict[str, Any]], seconds: float) -> None:
+    results = (response or {}).get("results") or []
+    search_seconds.observe(seconds, method=method)
+    search_results.observe(len(results), method=method)
+    search_bytes.observe(result_bytes(results), method=method)
+
+
+def prompt_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Prompt tokens, tokens read from the provider's prefix cache and the hit rate, per graph node."""
+    cached = {node: value for (node,), value in llm_cached_tokens.values().items()}
+    stats = {}
+    for (node, direction), value in sorted(llm_tokens.values().items()):
+        if direction != "in":
+            continue
+        hits = cached.get(node, 0)
+        stats[node] = {"prompt_tokens": int(value), "cached_tokens": int(hits),
+                       "hit_rate": round(hits / value, 3) if value else 0.0}
+    return stats
@@ -15,3 +15,7 @@ class State(MessagesState):
     search_keyword: Optional[str] = None
     is_streaming: bool = False
     stream_buffer: Optional[str] = None
+    use_cache: bool = True
+    speculation_id: Optional[str] = None
+    started_at: Optional[float] = None  # time.monotonic() at request arrival
+    cached_answer: Optional[str] = None  # Report found in the semantic answer cache by the researcher
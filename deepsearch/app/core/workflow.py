@@ -0,0 +1,265 @@
+"""
+The DeepSearch agent workflow: the agents, the compiled LangGraph graph and
+the event stream it produces. Importing this module pulls in LangChain,
+LangGraph, the OpenAI and Tavily clients and compiles the graph; with
+``LAZY_INIT`` main.py defers that to the warm-up or the first request.
+"""
+import inspect
+import json
+import logging
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from typing import AsyncGenerator, Optional, Union
+
+from langchain_core.messages import AIMessageChunk, HumanMessage
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langgraph.graph import END, StateGraph
+
+from common.cache import normalize_query
+from common.singleflight import SingleFlight, StreamFanout
+from common.sse import SSEEncoder, TextDelta, coalesce
+
+from app.config.settings import settings
+from app.core.agents.coordinator import CoordinatorAgent
+from app.core.agents.reporter import ReporterAgent
+from app.core.agents.researcher import ResearcherAgent
+# Re-exported for the stats endpoints in main.py, which only import this module lazily
+from app.core.answer_cache import answer_cache  # noqa: F401
+from app.core.llm import llm_clients, preconnect_llm  # noqa: F401
+from app.core.search_engine import search_backend, search_cache, search_flight, sync_search_flight  # noqa: F401
+from app.core.speculation import speculator  # noqa: F401
+from app.core.telemetry import node_seconds, profiler, query_seconds, request_profile, request_trace, tracer
+from app.core.types import State
+
+logger = logging.getLogger(__name__)
+
+# Initialize agents
+coordinator_agent = CoordinatorAgent()
+researcher_agent = ResearcherAgent()
+reporter_agent = ReporterAgent()
+
+
+def route_coordinator(state: State):
+    if not state.get("coordinator"):
+        return "casual"
+    if state.get('coordinator') == "requires_research":
+        return "research"
+    elif state.get('coordinator') == "casual_conversation":
+        return "casual"
+    return "casual"
+
+
+def route_planner(state):
+    if state.get("planner", {}).get("needs_search"):
+        return "researcher_node"
+    return END
+
+
+route_coordinator_runnable = RunnableLambda(route_coordinator)
+route_planner_runnable = RunnableLambda(route_planner)
+
+
+def timed_node(name: str, fn):
+    """
+    Wrap a node (coroutine or async generator) in a span and the node-duration
+    histogram. The request's root span comes in through the run config: a
+    streamed run is resumed from a new task per event, so context variables
+    set around ``graph.astream`` do not reach later nodes.
+    """
+    if inspect.isasyncgenfunction(fn):
+        async def node(state: State, config: RunnableConfig):
+            with tracer.span(name, _root_span(config)) as span:
+                try:
+                    async for update in fn(state):
+                        yield update
+                finally:
+                    node_seconds.observe(span.elapsed(), node=name)
+    else:
+        async def node(state: State, config: RunnableConfig):
+            with tracer.span(name, _root_span(config)) as span:
+                try:
+                    return await fn(state)
+                finally:
+                    node_seconds.observe(span.elapsed(), node=name)
+    node.__name__ = name
+    return node
+
+
+def _root_span(config: RunnableConfig):
+    return (config.get("configurable") or {}).get("root_span")
+
+
+# Create workflow graph
+def build_graph():
+    workflow = StateGraph(State)
+
+    # Define nodes with more specific names
+    workflow.add_node("coordinator_node", timed_node(
+        "coordinator_node", coordinator_agent.process_stream if settings.STREAMING else coordinator_agent.process))
+    workflow.add_node("researcher_node", timed_node(
+        "researcher_node", researcher_agent.process_stream if settings.STREAMING else researcher_agent.process))
+    workflow.add_node("reporter_node", timed_node(
+        "reporter_node", reporter_agent.process_stream if settings.STREAMING else reporter_agent.process))
+
+    # Define edges with separate routing functions
+    workflow.add_conditional_edges(
+        "coordinator_node",
+        route_coordinator_runnable,
+        {
+            "research": "researcher_node",
+            "casual": END
+        }
+    )
+
+    workflow.add_edge("researcher_node", "reporter_node")
+    workflow.add_edge("reporter_node", END)
+
+    # Set entrypoint
+    workflow.set_entry_point("coordinator_node")
+
+    return workflow.compile()
+
+
+graph = build_graph()
+
+# Identical concurrent queries share one graph run
+query_flight = SingleFlight()
+stream_fanout = StreamFanout()
+
+
+@contextmanager
+def instrumented(state: State, mode: str):
+    """
+    Root span and duration of one graph run. When the request asked for a
+    profile, the stacks sampled meanwhile are written to ``PROFILE_DIR``.
+    """
+    session = profiler.session() if request_profile.get() else nullcontext()
+    with tracer.trace("query", request_trace.get(), query=state.get("query"), mode=mode) as span, \
+            session as stacks:
+        try:
+            yield span
+        finally:
+            query_seconds.observe(span.elapsed(), mode=mode)
+            if stacks is not None:
+                name = f"{time.strftime('%Y%m%d-%H%M%S')}-{span.trace_id or uuid.uuid4().hex[:8]}"
+                logger.info("Profile written to %s", profiler.dump(stacks, settings.PROFILE_DIR, name))
+
+
+async def run_graph(state: State) -> dict:
+    with instrumented(state, "invoke") as span:
+        return await graph.ainvoke(state, {"recursion_limit": 10, "configurable": {"root_span": span}})
+
+
+def query_key(state: State) -> Optional[str]:
+    """
+    Key under which identical concurrent queries share one graph run, or None
+    when the request must run alone. Traced and profiled requests run alone,
+    so their spans and stacks describe their own run. A shared run's LLM
+    calls count against the client that started it; the others only hold
+    their request slot.
+    """
+    if request_trace.get() or request_profile.get():
+        return None
+    return json.dumps([normalize_query(state.get("query")), state.get("use_cache", True)], ensure_ascii=False)
+
+
+def coalesced_stream(state: State) -> AsyncGenerator[str, None]:
+    """
+    Run ``process_stream`` once per distinct in-flight query (see ``query_key``).
+    Late joiners replay the events produced so far, then follow the live stream.
+    """
+    key = query_key(state) if settings.COALESCE_REQUESTS else None
+    if key is None:
+        return encoded_stream(state)
+    return stream_fanout.subscribe(key, lambda: encoded_stream(state))
+
+
+def encoded_stream(state: State) -> AsyncGenerator[str, None]:
+    """SSE text for ``process_stream``, with token chunks batched into fewer, larger frames."""
+    return coalesce(process_stream(state), sse_encoder,
+                    interval=settings.SSE_COALESCE_INTERVAL_MS / 1000, max_bytes=settings.SSE_COALESCE_MAX_BYTES)
+
+
+# Node update field -> (data type, done, SSE event); the first field present wins
+UPDATE_EVENTS = (
+    ("stream_buffer", "intermediate", False, "stream"),
+    ("reporter_result", "reporter_result", True, "final"),
+    ("search_result", "search_result", True, "final"),
+    ("response", "final", True, "final"),
+)
+
+sse_encoder = SSEEncoder()
+
+
+def _update_event(node_name: str, node_data: dict):
+    for field, data_type, done, event_type in UPDATE_EVENTS:
+        value = node_data.get(field)
+        if value:
+            if not done:
+                return TextDelta(event_type, value, (("type", data_type), ("done", False), ("node", node_name)))
+            return sse_encoder.encode(event_type, {'chunk': value, 'type': data_type, 'done': True, 'node': node_name})
+    return None
+
+
+async def process_stream(state: State) -> AsyncGenerator[Union[str, TextDelta], None]:
+    """
+    Process the query with streaming response.
+    Returns an async generator of server-sent events; token chunks are
+    yielded as ``TextDelta`` so ``coalesce`` can batch them.
+    """
+    try:
+        with instrumented(state, "stream") as span:
+            async for _, mode, chunk in graph.astream(state,
+                                                      config={
+                                                          "max_plan_iterations": 1,
+                                                          "recursion_limit": 10,
+                                                          "configurable": {"root_span": span},
+                                                      },
+                                                      stream_mode=["messages", "updates", "custom"],
+                                                      subgraphs=True,
+                                                      ):
+                if mode == "custom":
+                    # Tokens a node writes itself, e.g. a cached report replayed by the reporter
+                    if isinstance(chunk, dict) and chunk.get("stream"):
+                        yield TextDelta("stream", chunk["stream"], (
+                            ("type", "stream"), ("done", False), ("node", chunk.get("node", "unknown")),
+                        ))
+
+                elif mode == "messages":
+                    # 中间过程：LLM token（ToolMessage 不下发）
+                    message_chunk, metadata = chunk[0], chunk[1] or {}
+                    if isinstance(message_chunk, AIMessageChunk) and message_chunk.content:
+                        yield TextDelta("stream", message_chunk.content, (
+                            ("type", "stream"), ("done", False), ("node", metadata.get('langgraph_node', 'unknown')),
+                        ))
+
+                elif isinstance(chunk, dict):
+                    # 节点更新
+                    for node_name, node_data in chunk.items():
+                        if isinstance(node_data, dict):
+                            event = _update_event(node_name, node_data)
+                            if event is not None:
+                                yield event
+
+    except Exception as e:
+        error_message = f"Error processing query: {str(e)}"
+        logger.exception("Error in process_stream")
+        yield sse_encoder.encode("error", {'error': error_message})
+
+
+def new_state(query: str, stream: bool, use_cache: bool) -> State:
+    """Initial graph state for a query arriving now."""
+    return State(
+        query=query,
+        messages=[HumanMessage(content=query)],
+        coordinator=None,
+        planner=None,
+        researcher=None,
+        reporter=None,
+        current_time=datetime.now().strftime("%a %b %d %Y %H:%M:%S %z"),
+        started_at=time.monotonic(),
+        is_streaming=stream,
+        use_cache=use_cache,
+    )
@@ -1,332 +1,372 @@
-import json
-from datetime import datetime
-from typing import AsyncGenerator
+import asyncio
+import logging
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import uvicorn
-from fastapi import FastAPI, HTTPException, Body
-from fastapi.responses import StreamingResponse
-from langchain_core.messages import AIMessageChunk, ToolMessage
-from langchain_core.messages import HumanMessage
-from langgraph.graph import END, StateGraph
-from langgraph.pregel.io import AddableUpdatesDict
+from fastapi import FastAPI, HTTPException, Body, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 
+from common.admission import Overloaded, Permit, client_key, request_client_key, stream_until_disconnect
+from common.readiness import Readiness
+from common.resilience import CircuitOpen
+from common.serve import resolve_workers, serve
+
 from app.config.settings import settings
-from app.core.agents.coordinator import CoordinatorAgent
-from app.core.agents.reporter import ReporterAgent
-from app.core.agents.researcher import ResearcherAgent
-from app.core.types import State
+from app.core.admission import admission
+from app.core.http import http_client
+from app.core.pages import page_fetcher
+from app.core.resilience import llm_breaker
+from app.core.telemetry import metrics, profiler, prompt_cache_stats, request_profile, request_trace, tracer
 
-app = FastAPI(title=settings.PROJECT_NAME)
+logger = logging.getLogger(__name__)
 
-# 修复跨域
-from fastapi.middleware.cors import CORSMiddleware
+_workflow = None
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 
-# Initialize agents
-coordinator_agent = CoordinatorAgent()
-researcher_agent = ResearcherAgent()
-reporter_agent = ReporterAgent()
+def load_workflow():
+    """
+    The agents, compiled graph and search stack (``app.core.workflow``).
+    Already imported at startup, or imported on first use with ``LAZY_INIT``.
+    """
+    global _workflow
+    if _workflow is None:
+        import app.core.workflow as workflow
+        _workflow = workflow
+    return _workflow
 
 
-class QueryInput(BaseModel):
-    query: str
-    stream: bool = False
+async def aload_workflow():
+    """``load_workflow`` for request handlers: a cold import runs on a thread, not on the event loop."""
+    return _workflow or await asyncio.to_thread(load_workflow)
 
 
-class SearchRequest(BaseModel):
-    query: str
+if not settings.LAZY_INIT:
+    load_workflow()
 
 
-from langchain_core.runnables import RunnableLambda
+def preload() -> None:
+    """Everything a worker needs before serving: the workflow and the local search index."""
+    load_workflow().search_backend.warm_up()
 
 
-def route_coordinator(state: State):
-    if not state.get("coordinator"):
-        return "casual"
-    if state.get('coordinator') == "requires_research":
-        return "research"
-    elif state.get('coordinator') == "casual_conversation":
-        return "casual"
-    return "casual"
+readiness = Readiness(timeout=settings.WARM_UP_TIMEOUT)
 
 
-def route_planner(state):
-    if state.get("planner", {}).get("needs_search"):
-        return "researcher_node"
-    return END
+async def _connect_pools():
+    search, llm = await asyncio.gather(http_client.preconnect([settings.TAVILY_BASE_URL]),
+                                       load_workflow().preconnect_llm())
+    return {**search, **llm}
 
 
-route_coordinator_runnable = RunnableLambda(route_coordinator)
-route_planner_runnable = RunnableLambda(route_planner)
+async def _priming_query():
+    workflow = await aload_workflow()
+    result = await workflow.run_graph(workflow.new_state(settings.WARM_UP_QUERY, stream=False, use_cache=True))
+    return {"nodes": list(result.keys())}
 
 
-# Create workflow graph
-def build_graph():
-    workflow = StateGraph(State)
+# Warm-up before /api/ready reports ready; the import runs on a thread so the
+# server keeps answering liveness probes meanwhile
+readiness.add("workflow", lambda: asyncio.to_thread(preload))
+if settings.WARM_UP_CONNECT:
+    readiness.add("pools", _connect_pools, required=False)
+if settings.WARM_UP_QUERY:
+    readiness.add("priming_query", _priming_query, required=False)
 
-    # Define nodes with more specific names
-    workflow.add_node("coordinator_node",
-                      coordinator_agent.process_stream if settings.STREAMING else coordinator_agent.process)
-    workflow.add_node("researcher_node",
-                      researcher_agent.process_stream if settings.STREAMING else researcher_agent.process)
-    workflow.add_node("reporter_node", reporter_agent.process_stream if settings.STREAMING else reporter_agent.process)
 
-    # Define edges with separate routing functions
-    workflow.add_conditional_edges(
-        "coordinator_node",
-        route_coordinator_runnable,
-        {
-            "research": "researcher_node",
-            "casual": END
-        }
-    )
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await http_client.start()
+    warm_up = None
+    if settings.WARM_UP:
+        warm_up = asyncio.create_task(readiness.run())
+    else:
+        readiness.ready = True
+    try:
+        yield
+    finally:
+        if warm_up is not None:
+            warm_up.cancel()
+        await http_client.aclose()
+        if _workflow is not None:
+            await _workflow.llm_clients.aclose()
+            _workflow.search_cache.close()
 
-    workflow.add_edge("researcher_node", "reporter_node")
-    workflow.add_edge("reporter_node", END)
 
-    # Set entrypoint
-    workflow.set_entry_point("coordinator_node")
+app = FastAPI(title=settings.PROJECT_NAME, lifespan=lifespan)
 
-    return workflow.compile()
+# 修复跨域
+from fastapi.middleware.cors import CORSMiddleware
 
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
 
-graph = build_graph()
+class QueryInput(BaseModel):
+    query: str
+    stream: bool = False
+    use_cache: bool = True
 
 
-async def process_stream(state: State) -> AsyncGenerator[str, None]:
-    """
-    Process the query with streaming response.
-    Returns an async generator that yields server-sent events.
-    """
+class SearchRequest(BaseModel):
+    query: str
+    use_cache: bool = True
 
-    def _make_event(data: any, event_type: str) -> str:
-        if isinstance(data, dict) and data.get("content") == "":
-            data.pop("content")
-        return f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
+async def admit(request: Request) -> Permit:
+    """Take a request slot for the caller, or answer 429 with Retry-After when overloaded."""
+    client_key.set(request_client_key(request.headers, request.client.host if request.client else None))
     try:
-        async for agent, _, chunk in graph.astream(state,
-                                                   config={
-                                                       "max_plan_iterations": 1,
-                                                       "recursion_limit": 10,
-                                                   },
-                                                   stream_mode=["messages", "updates"],
-                                                   subgraphs=True,
-                                                   ):
-            if isinstance(chunk, tuple) and len(chunk) >= 2:
-                # 中间过程
-                message_chunk = chunk[0]
-                metadata = chunk[1] if len(chunk) > 1 else {}
-
-                # 处理 AIMessageChunk
-                if isinstance(message_chunk, AIMessageChunk):
-                    data = {
-                        'chunk': message_chunk.content,
-                        'type': 'stream',
-                        'done': False,
-                        'node': metadata.get('langgraph_node', 'unknown')
-                    }
-                    yield _make_event(data=data, event_type="stream")
-
-                # 处理 ToolMessage
-                elif isinstance(message_chunk, ToolMessage):
-                    continue
-                    data = {
-                        'chunk': message_chunk.content,
-                        'type': 'tool_result',
-                        'done': False,
-                        'node': metadata.get('langgraph_node', 'unknown'),
-                        'tool_call_id': getattr(message_chunk, 'tool_call_id', None)
-                    }
-                    yield _make_event(data=data, event_type="stream")
-
-                continue
-
-            # 处理嵌套的chunk结构
-            elif isinstance(chunk, dict):
-                if isinstance(chunk, AddableUpdatesDict):
-                    for key, value in chunk.items():
-                        # 处理各种类型的节点数据
-                        if isinstance(value, dict):
-                            if value.get("stream_buffer"):
-                                data = {
-                                    'chunk': value['stream_buffer'],
-                                    'type': 'intermediate',
-                                    'done': False,
-                                    'node': key
-                                }
-                                yield _make_event(data=data, event_type="stream")
-
-                            # 处理最终结果
-                            elif value.get("reporter_result"):
-                                data = {
-                                    'chunk': value['reporter_result'],
-                                    'type': 'reporter_result',
-                                    'done': True,
-                                    'node': key
-                                }
-                                yield _make_event(data=data, event_type="final")
-
-                            elif value.get("search_result"):
-                                data = {
-                                    'chunk': value['search_result'],
-                                    'type': 'search_result',
-                                    'done': True,
-                                    'node': key
-                                }
-                                yield _make_event(data=data, event_type="final")
-
-                            elif value.get("response"):
-                                data = {
-                                    'chunk': value['response'],
-                                    'type': 'final',
-                                    'done': True,
-                                    'node': key
-                                }
-                                yield _make_event(data=data, event_type="final")
-
-                else:
-                    # 处理常规字典
-                    for node_name, node_data in chunk.items():
-                        if not isinstance(node_data, dict):
-                            continue
-
-                        # 处理各种类型的节点数据
-                        if node_data.get("stream_buffer"):
-                            data = {
-                                'chunk': node_data['stream_buffer'],
-                                'type': 'intermediate',
-                                'done': False,
-                                'node': node_name
-                            }
-                            yield _make_event(data=data, event_type="stream")
-
-                        elif node_data.get("reporter_result"):
-                            data = {
-                                'chunk': node_data['reporter_result'],
-                                'type': 'reporter_result',
-                                'done': True,
-                                'node': node_name
-                            }
-                            yield _make_event(data=data, event_type="final")
-
-                        elif node_data.get("search_result"):
-                            data = {
-                                'chunk': node_data['search_result'],
-                                'type': 'search_result',
-                                'done': True,
-                                'node': node_name
-                            }
-                            yield _make_event(data=data, event_type="final")
-
-                        elif node_data.get("response"):
-                            data = {
-                                'chunk': node_data['response'],
-                                'type': 'final',
-                                'done': True,
-                                'node': node_name
-                            }
-                            yield _make_event(data=data, event_type="final")
-
-            else:
-                continue
+        return await admission.acquire("request")
+    except Overloaded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(int(e.retry_after))})
 
-    except Exception as e:
-        error_message = f"Error processing query: {str(e)}"
-        import traceback
-        traceback.print_exc()
-        print(f"[mainDebug] Error in process_stream: {error_message}")
-        yield _make_event(data={'error': error_message}, event_type="error")
+
+def trace_request(request: Request) -> Optional[str]:
+    """
+    Decide whether this request is traced (``X-Trace: 1`` or sampled) and
+    profiled (``X-Profile: 1``, with ``PROFILING_ENABLED``); returns the trace id.
+    """
+    trace_id = tracer.sample(request.headers.get("x-trace") == "1")
+    request_trace.set(trace_id)
+    request_profile.set(settings.PROFILING_ENABLED and request.headers.get("x-profile") == "1")
+    return trace_id
+
+
+def streaming_response(request: Request, workflow, state: dict, permit: Permit) -> StreamingResponse:
+    """
+    SSE response that stops the graph as soon as the client disconnects.
+    The request slot is released when the stream ends, or by the background
+    task if the stream never started.
+    """
+    trace_id = trace_request(request)
+    return StreamingResponse(
+        stream_until_disconnect(request, workflow.coalesced_stream(state), settings.DISCONNECT_POLL_INTERVAL, permit),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+            "Content-Type": "text/event-stream",
+            "Transfer-Encoding": "chunked",
+            **({"X-Trace-Id": trace_id} if trace_id else {}),
+        },
+        background=BackgroundTask(permit.release),
+    )
 
 
 @app.post("/api/query")
-async def process_query(input_data: QueryInput = Body(...)):
+async def process_query(request: Request, response: Response, input_data: QueryInput = Body(...)):
     """
     Process a user query through the agent workflow.
     """
+    permit = await admit(request)
     try:
-        # Initialize state with the query
-        initial_state = State(
-            query=input_data.query,
-            messages=[HumanMessage(content=input_data.query)],
-            coordinator=None,
-            planner=None,
-            researcher=None,
-            reporter=None,
-            current_time=datetime.now().strftime("%a %b %d %Y %H:%M:%S %z"),
-            is_streaming=input_data.stream
-        )
+        workflow = await aload_workflow()
+        initial_state = workflow.new_state(input_data.query, stream=input_data.stream, use_cache=input_data.use_cache)
 
         if input_data.stream:
-            return StreamingResponse(
-                process_stream(initial_state),
-                media_type="text/event-stream",
-                headers={
-                    "Cache-Control": "no-cache",
-                    "Connection": "keep-alive",
-                    "X-Accel-Buffering": "no",
-                    "Content-Type": "text/event-stream",
-                    "Transfer-Encoding": "chunked"
-                }
-            )
+            streaming, permit = streaming_response(request, workflow, initial_state, permit), None
+            return streaming
 
         # Run the graph for non-streaming response
-        result = await graph.ainvoke(initial_state, {"recursion_limit": 10})
-        response = result.get("response", "No response generated.")
+        trace_id = trace_request(request)
+        if trace_id:
+            response.headers["X-Trace-Id"] = trace_id
+        key = workflow.query_key(initial_state) if settings.COALESCE_REQUESTS else None
+        if key is not None:
+            result = await workflow.query_flight.do(key, lambda: workflow.run_graph(initial_state))
+        else:
+            result = await workflow.run_graph(initial_state)
+        answer = result.get("response", "No response generated.")
         reporter_result = result.get("reporter_result")
         return {
             "query": input_data.query,
-            "response": reporter_result if reporter_result else response,
+            "response": reporter_result if reporter_result else answer,
             "workflow_path": list(result.keys())
         }
 
+    except Overloaded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(int(e.retry_after))})
+    except CircuitOpen as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after))})
     except Exception as e:
-        print(f"[DEBUG] Error in process_query: {str(e)}")
+        logger.exception("Error in process_query")
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
+    finally:
+        if permit is not None:
+            permit.release()
 
 
 @app.post("/api/query_stream")
-async def process_query_stream(request: SearchRequest):
+async def process_query_stream(http_request: Request, request: SearchRequest):
     """
     Process a user query through the agent workflow with streaming response.
     """
+    permit = await admit(http_request)
     try:
-        # Initialize state with the query
-        initial_state = State(
-            query=request.query,
-            messages=[HumanMessage(content=request.query)],
-            coordinator=None,
-            planner=None,
-            researcher=None,
-            reporter=None,
-            current_time=datetime.now().strftime("%a %b %d %Y %H:%M:%S %z"),
-            is_streaming=True
-        )
-
-        return StreamingResponse(
-            process_stream(initial_state),
-            media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "X-Accel-Buffering": "no",
-                "Content-Type": "text/event-stream",
-                "Transfer-Encoding": "chunked"
-            }
-        )
+        workflow = await aload_workflow()
+        initial_state = workflow.new_state(request.query, stream=True, use_cache=request.use_cache)
+
+        return streaming_response(http_request, workflow, initial_state, permit)
 
     except Exception as e:
-        print(f"[DEBUG] Error in query_stream: {str(e)}")
+        permit.release()
+        logger.exception("Error in query_stream")
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
 
+@app.get("/api/health")
+async def health():
+    """Liveness: the process is up and serving, warmed up or not."""
+    return {"status": "ok"}
+
+
+@app.get("/api/ready")
+async def ready():
+    """
+    Readiness: 200 once the warm-up has finished (graph compiled, connection
+    pools open, priming query run), 503 until then; the body lists each step.
+    """
+    stats = readiness.stats()
+    return JSONResponse(stats, status_code=200 if stats["ready"] else 503)
+
+
+@app.get("/api/stats/cache")
+async def search_cache_stats():
+    """Hit/miss/eviction counters of the search-result cache."""
+    workflow = await aload_workflow()
+    return workflow.search_cache.stats_dict()
+
+
+@app.get("/api/stats/http_pool")
+async def http_pool_stats():
+    """Connection-pool occupancy of the shared HTTP client."""
+    return http_client.stats()
+
+
+@app.get("/api/stats/llm_pool")
+async def llm_pool_stats():
+    """Connection reuse and occupancy of the LLM client shared by all agents, and the settings of each role."""
+    workflow = await aload_workflow()
+    return workflow.llm_clients.stats()
+
+
+@app.get("/api/stats/answer_cache")
+async def answer_cache_stats():
+    """Hit/miss counters of the semantic answer cache."""
+    answer_cache = (await aload_workflow()).answer_cache
+    return answer_cache.stats() if answer_cache is not None else {"enabled": False}
+
+
+@app.get("/api/stats/reporter")
+async def reporter_stats():
+    """Time to the first report token, measured from the reporter's LLM call and from request arrival."""
+    workflow = await aload_workflow()
+    return workflow.reporter_agent.stats()
+
+
+@app.get("/api/stats/admission")
+async def admission_stats():
+    """Concurrency, queue depth, wait times and rejections of admission control, plus upstream rate limits."""
+    return admission.stats()
+
+
+@app.get("/api/stats/resilience")
+async def resilience_stats():
+    """Retries, hedges, latency and circuit-breaker state per upstream provider."""
+    workflow = await aload_workflow()
+    return {**workflow.search_backend.resilience_stats(), "openai": {"breaker": llm_breaker.stats()}}
+
+
+@app.get("/api/stats/search")
+async def search_provider_stats():
+    """Calls, errors, wins and latency per search provider."""
+    workflow = await aload_workflow()
+    return workflow.search_backend.stats()
+
+
+@app.get("/api/stats/fetch")
+async def fetch_stats():
+    """Pages fetched, cache hits, bytes and latency of the page fetch stage."""
+    if page_fetcher is None:
+        return {"enabled": False}
+    return {"enabled": True, **page_fetcher.stats()}
+
+
+@app.get("/api/stats/router")
+async def router_stats():
+    """How often the local fast path settled routing without the coordinator LLM."""
+    workflow = await aload_workflow()
+    return workflow.coordinator_agent.router.stats()
+
+
+@app.get("/api/stats/speculation")
+async def speculation_stats():
+    """Speculative searches used vs. thrown away, and the search time they saved or wasted."""
+    workflow = await aload_workflow()
+    return workflow.speculator.stats()
+
+
+@app.get("/api/stats/coalescing")
+async def coalescing_stats():
+    """How many requests shared an in-flight search, query or stream."""
+    workflow = await aload_workflow()
+    return {
+        "search": workflow.search_flight.stats(),
+        "search_sync": workflow.sync_search_flight.stats(),
+        "query": workflow.query_flight.stats(),
+        "query_stream": workflow.stream_fanout.stats(),
+    }
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Node, search and LLM latency, time to first token, tokens and result sizes, in the Prometheus format."""
+    return PlainTextResponse(metrics.render(), media_type=metrics.content_type)
+
+
+@app.get("/api/stats/prompt_cache")
+async def prompt_cache():
+    """Share of prompt tokens the LLM provider served from its prefix cache, per graph node."""
+    return prompt_cache_stats()
+
+
+@app.get("/api/stats/traces")
+async def recent_traces():
+    """Spans of the most recent traced requests (``X-Trace: 1`` or ``TRACE_SAMPLE_RATE``)."""
+    return tracer.recent()
+
+
+@app.post("/api/profile")
+async def profile_window(seconds: float = 10.0):
+    """
+    Sample every thread for ``seconds`` and return the stacks in the folded
+    format read by flamegraph.pl and speedscope; a copy is written to ``PROFILE_DIR``.
+    """
+    if not settings.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled; set PROFILING_ENABLED=true")
+    seconds = max(0.1, min(seconds, 300.0))
+    with profiler.session() as stacks:
+        await asyncio.sleep(seconds)
+    path = profiler.dump(stacks, settings.PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-window")
+    return PlainTextResponse(profiler.folded(stacks), headers={"X-Profile-Path": path})
+
+
 if __name__ == "__main__":
-    uvicorn.run("__main__:app", host="0.0.0.0", port=8081, reload=True, workers=1)
+    if settings.WORKERS:
+        serve(app, settings.HOST, settings.PORT, resolve_workers(settings.WORKERS),
+              settings.GRACEFUL_SHUTDOWN_TIMEOUT, warm_up=preload)
+    else:
+        uvicorn.run("__main__:app", host=settings.HOST, port=settings.PORT, reload=True, workers=1)
@@ -0,0 +1,135 @@
+"""
+Streaming behaviour of the app against the stub OpenAI and Tavily servers.
+
+The app runs as a uvicorn subprocess, so client disconnects travel over a
+real socket. Each test sends a distinct query, so requests from different
+tests never share a stream.
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROOT = os.path.dirname(APP_DIR)
+sys.path.insert(0, ROOT)
+
+from common.stubs import openai as openai_stub  # noqa: E402
+from common.stubs import tavily as tavily_stub  # noqa: E402
+from common.stubs.server import BackgroundServer, free_port  # noqa: E402
+
+# Each completion streams 60 tokens over about 3 seconds
+TOKENS, TOKEN_DELAY = 60, 0.05
+FIRST_TOKEN = '"type":"stream"'
+
+
+@pytest.fixture(scope="module")
+def servers():
+    llm_app = openai_stub.create_app(token_delay=TOKEN_DELAY, tokens=TOKENS)
+    with BackgroundServer(llm_app) as llm, BackgroundServer(tavily_stub.create_app()) as search:
+        port = free_port()
+        env = {
+            **os.environ,
+            "OPENAI_API_KEY": "test",
+            "TAVILY_API_KEY": "test",
+            "OPENAI_BASE_URL": f"{llm.url}/v1",
+            "TAVILY_BASE_URL": search.url,
+            "RESEARCH_MODE": "fanout",
+            "DISCONNECT_POLL_INTERVAL": "0.05",
+            "PYTHONPATH": ROOT,
+        }
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+             "--log-level", "warning"],
+            cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        url = f"http://127.0.0.1:{port}"
+        try:
+            deadline = time.monotonic() + 60
+            while True:
+                try:
+                    httpx.get(f"{url}/docs")
+                    break
+                except httpx.TransportError:
+                    pass
+                if time.monotonic() > deadline or process.poll() is not None:
+                    raise RuntimeError("deepsearch did not start")
+                time.sleep(0.1)
+            yield url, llm_app.state.streams
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+
+
+async def read_until(lines, marker: str) -> None:
+    async for line in lines:
+        if marker in line:
+            return
+    raise AssertionError(f"stream ended before {marker!r}")
+
+
+async def wait_closed(streams, since: int, timeout: float = 5.0):
+    """The upstream completion streams opened after ``since``, once all of them have ended."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        opened = streams[since:]
+        if opened and all(s["ended"] is not None for s in opened):
+            return opened
+        await asyncio.sleep(0.02)
+    raise AssertionError("upstream completion stream still open")
+
+
+def test_disconnect_closes_the_upstream_completion(servers):
+    url, streams = servers
+
+    async def run():
+        before = len(streams)
+        body = {"query": "How tall is the Burj Khalifa in Dubai?", "use_cache": False}
+        async with httpx.AsyncClient(base_url=url, timeout=30) as client:
+            async with client.stream("POST", "/api/query_stream", json=body) as response:
+                assert response.status_code == 200
+                await read_until(response.aiter_lines(), FIRST_TOKEN)
+                disconnected = time.monotonic()
+        return disconnected, await wait_closed(streams, before)
+
+    disconnected, opened = asyncio.run(run())
+
+    last = max(opened, key=lambda s: s["ended"])
+    assert not last["completed"]
+    assert last["sent"] < TOKENS
+    # Well before the remaining tokens would have been streamed
+    assert last["ended"] - disconnected < 1.0
+
+
+def test_coalesced_stream_survives_its_first_client_leaving(servers):
+    url, streams = servers
+
+    async def run():
+        before = len(streams)
+        body = {"query": "When was the Eiffel Tower in Paris built?", "use_cache": False}
+        async with httpx.AsyncClient(base_url=url, timeout=60) as first, \
+                httpx.AsyncClient(base_url=url, timeout=60) as second:
+            async with first.stream("POST", "/api/query_stream", json=body) as leader:
+                # Keep the iterator: finalizing it would close the connection early
+                lines = leader.aiter_lines()
+                await read_until(lines, FIRST_TOKEN)
+                joiner = asyncio.ensure_future(second.post("/api/query_stream", json=body))
+                # Leave only once the second request has joined the stream in flight
+                while (await first.get("/api/stats/coalescing")).json()["query_stream"]["joins"] < 1:
+                    await asyncio.sleep(0.02)
+                await lines.aclose()
+            response = await joiner
+            coalescing = (await first.get("/api/stats/coalescing")).json()["query_stream"]
+        return response, coalescing, streams[before:]
+
+    response, coalescing, opened = asyncio.run(run())
+
+    assert response.status_code == 200
+    assert '"type":"reporter_result"' in response.text
+    assert coalescing["in_flight"] == 0
+    # The leader leaving did not cut the shared completions short
+    assert opened and all(s["completed"] for s in opened)
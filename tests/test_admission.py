@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from common.admission import Limiter, Overloaded, TokenBucket, stream_until_disconnect
+
+
+class FakeRequest:
+    def __init__(self):
+        self.disconnected = False
+
+    async def is_disconnected(self) -> bool:
+        return self.disconnected
+
+
+class FakePermit:
+    def __init__(self):
+        self.released = 0
+
+    def release(self) -> None:
+        self.released += 1
+
+
+def test_disconnect_cancels_the_pending_upstream_step():
+    upstream = {"cancelled": False, "closed": False}
+
+    async def source():
+        try:
+            yield "first"
+            await asyncio.sleep(60)  # A slow upstream call
+            yield "never"
+        except asyncio.CancelledError:
+            upstream["cancelled"] = True
+            raise
+        finally:
+            upstream["closed"] = True
+
+    async def run():
+        request, permit = FakeRequest(), FakePermit()
+        stream = stream_until_disconnect(request, source(), poll_interval=0.01, permit=permit)
+        received = [await stream.__anext__()]
+
+        async def disconnect():
+            await asyncio.sleep(0.05)
+            request.disconnected = True
+
+        asyncio.ensure_future(disconnect())
+        received += [item async for item in stream]
+        return received, permit
+
+    received, permit = asyncio.run(asyncio.wait_for(run(), 5))
+
+    assert received == ["first"]
+    assert upstream == {"cancelled": True, "closed": True}
+    assert permit.released == 1
+
+
+def test_finished_stream_releases_the_permit():
+    async def source():
+        yield "a"
+        yield "b"
+
+    async def run():
+        permit = FakePermit()
+        items = [item async for item in stream_until_disconnect(FakeRequest(), source(), 0.01, permit)]
+        return items, permit
+
+    items, permit = asyncio.run(run())
+
+    assert items == ["a", "b"]
+    assert permit.released == 1
+
+
+def test_token_bucket_rejects_waits_beyond_the_timeout():
+    bucket = TokenBucket(rate=1, burst=1)
+    asyncio.run(bucket.acquire())
+
+    with pytest.raises(Overloaded) as raised:
+        asyncio.run(bucket.acquire(timeout=0.1, name="openai"))
+    assert raised.value.resource == "openai"
+    # The rejected reservation was refunded, so the wait did not grow
+    assert bucket.reserve() <= 1.0
+
+
+def test_full_queue_is_rejected_at_once():
+    async def run():
+        limiter = Limiter("search", max_concurrent=1, max_queue=0)
+        acquired = await limiter.acquire()
+        with pytest.raises(Overloaded) as raised:
+            await limiter.acquire()
+        limiter.release(acquired)
+        return limiter, raised.value
+
+    limiter, error = asyncio.run(run())
+
+    assert error.reason == "queue_full"
+    assert limiter.stats()["rejected"]["queue_full"] == 1
+    assert limiter.idle
+
+
+def test_blocking_acquire_rejects_waits_beyond_the_timeout():
+    bucket = TokenBucket(rate=1, burst=1)
+    bucket.acquire_sync()
+
+    with pytest.raises(Overloaded):
+        bucket.acquire_sync(timeout=0.1, name="openai")
+    assert bucket.reserve() <= 1.0
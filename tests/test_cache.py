@@ -0,0 +1,122 @@
+import asyncio
+import threading
+import time
+
+from common.cache import FRESH, STALE, SearchCache, SearchCacheConfig, cache_key
+
+
+def stale_cache(value="old"):
+    """A cache holding ``value`` under "key", already past its TTL but within the stale window."""
+    cache = SearchCache(SearchCacheConfig(ttl=60, stale_ttl=60))
+    cache.set("key", value, ttl=0)
+    return cache
+
+
+def test_stale_hit_is_served_while_one_refresh_runs():
+    async def run():
+        cache = stale_cache()
+        release, calls = asyncio.Event(), []
+
+        async def fetch():
+            calls.append(True)
+            await release.wait()
+            return "new"
+
+        # Both callers get the stale value at once; only the first starts a refresh
+        served = [await cache.get_or_fetch("key", fetch), await cache.get_or_fetch("key", fetch)]
+        refreshing = cache.stats_dict()["refreshing"]
+        release.set()
+        while cache.stats_dict()["refreshing"]:
+            await asyncio.sleep(0.01)
+        return cache, served, refreshing, calls
+
+    cache, served, refreshing, calls = asyncio.run(run())
+
+    assert served == ["old", "old"]
+    assert refreshing == 1
+    assert calls == [True]
+    assert cache.get("key") == ("new", FRESH)
+    stats = cache.stats_dict()
+    assert stats["stale_hits"] == 2
+    assert stats["refreshes"] == 1
+
+
+def test_failed_refresh_keeps_the_stale_value():
+    async def run():
+        cache = stale_cache()
+
+        async def fetch():
+            raise RuntimeError("upstream down")
+
+        served = await cache.get_or_fetch("key", fetch)
+        while cache.stats_dict()["refreshing"]:
+            await asyncio.sleep(0.01)
+        return cache, served
+
+    cache, served = asyncio.run(run())
+
+    assert served == "old"
+    assert cache.get("key") == ("old", STALE)
+    assert cache.stats_dict()["refresh_errors"] == 1
+
+
+def test_entry_past_the_stale_window_is_fetched_again():
+    cache = SearchCache(SearchCacheConfig(ttl=60, stale_ttl=0))
+    cache.set("key", "old", ttl=0)
+    time.sleep(0.01)
+
+    assert asyncio.run(cache.get_or_fetch("key", lambda: asyncio.sleep(0, "new"))) == "new"
+    assert cache.stats_dict()["misses"] == 1
+
+
+def test_sync_stale_hit_refreshes_on_a_helper_thread():
+    cache = stale_cache()
+
+    assert cache.get_or_fetch_sync("key", lambda: "new") == "old"
+    deadline = time.monotonic() + 5
+    while cache.stats_dict()["refreshing"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    cache.close()
+
+    assert cache.get("key") == ("new", FRESH)
+
+
+class RecordingStore:
+    """A shared store that remembers which thread each call ran on."""
+
+    def __init__(self):
+        self.rows, self.threads = {}, []
+
+    def get(self, key, now=None):
+        self.threads.append(threading.current_thread())
+        return self.rows.get(key)
+
+    def set(self, key, value, expires_at, stale_until):
+        self.threads.append(threading.current_thread())
+        self.rows[key] = (value, expires_at, stale_until)
+
+
+def test_async_lookups_reach_the_store_off_the_event_loop():
+    store = RecordingStore()
+    cache = SearchCache(store=store)
+
+    assert asyncio.run(cache.get_or_fetch("key", lambda: asyncio.sleep(0, "fetched"))) == "fetched"
+    cache.memory.clear()
+    assert asyncio.run(cache.get_or_fetch("key", lambda: asyncio.sleep(0, "refetched"))) == "fetched"
+
+    assert len(store.threads) == 3
+    assert threading.main_thread() not in store.threads
+    assert cache.stats_dict()["disk_hits"] == 1
+
+
+def test_bypass_skips_the_cache():
+    cache = SearchCache()
+    cache.set("key", "cached")
+
+    assert asyncio.run(cache.get_or_fetch("key", lambda: asyncio.sleep(0, "fetched"), use_cache=False)) == "fetched"
+    assert cache.stats_dict()["bypasses"] == 1
+
+
+def test_cache_key_normalizes_the_query():
+    assert cache_key("  Tesla   Model 3 ", "basic", 5, "tavily") == cache_key("tesla model 3", "basic", 5, "tavily")
+    assert cache_key("tesla", "basic", 5, "tavily") != cache_key("tesla", "basic", 10, "tavily")
@@ -0,0 +1,50 @@
+import asyncio
+
+import httpx
+
+from common.http import _CountingTransport
+
+
+class HangingTransport(httpx.AsyncBaseTransport):
+    """A transport whose requests never get a response."""
+
+    async def handle_async_request(self, request):
+        await asyncio.Event().wait()
+
+
+class Body(httpx.AsyncByteStream):
+    async def __aiter__(self):
+        yield b"ok"
+
+
+def test_cancelled_request_leaves_the_in_flight_count():
+    async def run():
+        transport = _CountingTransport(HangingTransport())
+        async with httpx.AsyncClient(transport=transport) as client:
+            request = asyncio.ensure_future(client.get("http://upstream/"))
+            await asyncio.sleep(0.01)
+            in_flight = transport.in_flight
+            request.cancel()
+            await asyncio.gather(request, return_exceptions=True)
+        return transport, in_flight
+
+    transport, in_flight = asyncio.run(run())
+
+    assert in_flight == 1
+    assert transport.in_flight == 0
+    assert transport.errors_total == 0
+
+
+def test_response_releases_the_in_flight_count_once_closed():
+    async def run():
+        transport = _CountingTransport(httpx.MockTransport(lambda request: httpx.Response(200, stream=Body())))
+        async with httpx.AsyncClient(transport=transport) as client:
+            async with client.stream("GET", "http://upstream/") as response:
+                in_flight = transport.in_flight
+                await response.aread()
+        return transport, in_flight
+
+    transport, in_flight = asyncio.run(run())
+
+    assert in_flight == 1
+    assert transport.in_flight == 0
@@ -0,0 +1,124 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from common.resilience import CircuitBreaker, CircuitOpen, ResilienceConfig, ResilientCaller, is_retryable
+
+
+def status_error(status: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "https://upstream.test/search")
+    return httpx.HTTPStatusError(f"{status}", request=request, response=httpx.Response(status, request=request))
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("upstream", failure_threshold=2, recovery_time=60)
+
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    with pytest.raises(CircuitOpen) as raised:
+        breaker.before_call()
+    assert 0 < raised.value.retry_after <= 60
+    assert breaker.stats() == {"state": "open", "consecutive_failures": 2, "trips": 1, "short_circuited": 1}
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker("upstream", failure_threshold=2, recovery_time=60)
+
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+
+    assert breaker.state == "closed"
+
+
+def test_half_open_trial_success_closes_the_circuit():
+    breaker = CircuitBreaker("upstream", failure_threshold=1, recovery_time=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    # Only one trial call at a time
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+    breaker.record_success()
+
+    assert breaker.state == "closed"
+    breaker.before_call()
+
+
+def test_half_open_trial_failure_reopens_the_circuit():
+    breaker = CircuitBreaker("upstream", failure_threshold=3, recovery_time=0.05)
+    for _ in range(3):
+        breaker.record_failure()
+    time.sleep(0.06)
+
+    breaker.before_call()
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+    assert breaker.trips == 2
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+
+
+def test_aborted_trial_lets_the_next_call_try():
+    breaker = CircuitBreaker("upstream", failure_threshold=1, recovery_time=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+
+    breaker.before_call()
+    breaker.abort()
+    breaker.before_call()
+
+    assert breaker.state == "half_open"
+
+
+def test_caller_retries_then_fails_fast_once_open():
+    caller = ResilientCaller("upstream", ResilienceConfig(retry_attempts=2, retry_base_delay=0, retry_max_delay=0,
+                                                          breaker_failure_threshold=2, breaker_recovery_time=60))
+    calls = []
+
+    async def fail():
+        calls.append(True)
+        raise status_error(503)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(caller.call(fail))
+    with pytest.raises(CircuitOpen):
+        asyncio.run(caller.call(fail))
+
+    assert len(calls) == 2
+    assert caller.stats()["retries"] == 1
+    assert caller.stats()["breaker"]["state"] == "open"
+
+
+def test_client_errors_are_not_retried_and_do_not_trip_the_breaker():
+    caller = ResilientCaller("upstream", ResilienceConfig(retry_attempts=3, breaker_failure_threshold=1))
+    calls = []
+
+    def bad_request():
+        calls.append(True)
+        raise status_error(400)
+
+    for _ in range(2):
+        with pytest.raises(httpx.HTTPStatusError):
+            caller.call_sync(bad_request)
+
+    assert len(calls) == 2
+    assert caller.breaker.state == "closed"
+
+
+def test_is_retryable():
+    assert is_retryable(status_error(503))
+    assert is_retryable(status_error(429))
+    assert not is_retryable(status_error(404))
+    assert is_retryable(httpx.ConnectError("refused"))
+    assert not is_retryable(ValueError("bad input"))
@@ -0,0 +1,31 @@
+import httpx
+
+from common.resilience import ResilienceConfig
+from common.search import SearchBackend, SearchProvider
+
+
+class FlakyProvider(SearchProvider):
+    """Fails with a retryable error ``failures`` times, then answers."""
+
+    name = "flaky"
+
+    def __init__(self, failures: int):
+        self.failures = failures
+
+    def search_sync(self, query, max_results=10, **options):
+        if self.failures:
+            self.failures -= 1
+            raise httpx.ConnectError("connection refused")
+        return {"query": query, "results": [{"title": "t", "url": "https://example.com", "content": "c", "score": 1}]}
+
+
+def test_blocking_search_runs_the_attempt_hook_before_every_retry():
+    attempts = []
+    backend = SearchBackend([FlakyProvider(failures=2)],
+                            resilience=ResilienceConfig(retry_attempts=3, retry_base_delay=0, retry_max_delay=0),
+                            before_attempt_sync=attempts.append)
+
+    response = backend.search_sync("query", 5)
+
+    assert len(response["results"]) == 1
+    assert attempts == ["flaky", "flaky", "flaky"]
@@ -0,0 +1,61 @@
+from common.semantic_cache import HashingEmbedder, SemanticAnswerCache, SemanticCacheConfig, terms_match
+
+
+def similarity(a: str, b: str) -> float:
+    vectors = HashingEmbedder(512)([a, b])
+    return float(vectors[0] @ vectors[1])
+
+
+def test_paraphrase_hits():
+    cache = SemanticAnswerCache(SemanticCacheConfig(threshold=0.8))
+    cache.store("is tesla worth buying", "It depends on your horizon.", ["https://example.com/tsla"])
+
+    hit = cache.lookup("should I buy a tesla")
+
+    assert hit is not None
+    assert hit.answer == "It depends on your horizon."
+    assert hit.sources == ["https://example.com/tsla"]
+    assert hit.similarity >= 0.8
+
+
+def test_query_differing_only_in_a_year_misses():
+    cache = SemanticAnswerCache(SemanticCacheConfig(threshold=0.7))
+    cache.store("population of china in 2020", "1.41 billion")
+
+    # Close enough in embedding space to pass the threshold on its own...
+    assert similarity("population of china in 2020", "population of china in 2023") >= 0.7
+    # ...but the year differs, so the stored answer would be wrong
+    assert cache.lookup("population of china in 2023") is None
+    assert cache.stats()["term_mismatches"] == 1
+    assert cache.lookup("Population of China in 2020?") is not None
+
+
+def test_query_naming_another_entity_misses():
+    cache = SemanticAnswerCache(SemanticCacheConfig(threshold=0.5))
+    cache.store("weather in Paris today", "Sunny")
+
+    assert similarity("weather in Paris today", "weather in London today") >= 0.5
+    assert cache.lookup("weather in London today") is None
+
+
+def test_term_guard_can_be_disabled():
+    cache = SemanticAnswerCache(SemanticCacheConfig(threshold=0.7, match_terms=False))
+    cache.store("population of china in 2020", "1.41 billion")
+
+    assert cache.lookup("population of china in 2023") is not None
+
+
+def test_terms_match():
+    assert terms_match("is tesla worth buying", "should I buy a tesla")
+    assert terms_match("How tall is the Burj Khalifa?", "how tall is the burj khalifa")
+    assert terms_match("price of 1,000 shares", "price of 1000 shares")
+    assert not terms_match("best laptop 2024", "best laptop 2025")
+    assert not terms_match("Who is the CEO of Tesla?", "Who is the CEO of Apple?")
+
+
+def test_answers_are_partitioned_by_locale():
+    cache = SemanticAnswerCache()
+    cache.store("is tesla worth buying", "English answer", locale="en")
+
+    assert cache.lookup("is tesla worth buying", locale="de") is None
+    assert cache.lookup("is tesla worth buying", locale="en").answer == "English answer"
@@ -0,0 +1,203 @@
+import asyncio
+
+import pytest
+
+from common.shared import SQLiteStore
+from common.singleflight import SingleFlight, StreamFanout
+
+
+class Upstream:
+    """An upstream call that blocks until released, recording how it ended."""
+
+    def __init__(self, value="result"):
+        self.value = value
+        self.calls = 0
+        self.cancelled = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return self.value
+
+
+def test_concurrent_calls_share_one_upstream_call():
+    async def run():
+        flight, upstream = SingleFlight(), Upstream()
+        callers = [asyncio.ensure_future(flight.do("key", upstream)) for _ in range(3)]
+        await asyncio.sleep(0)
+        upstream.release.set()
+        return flight, upstream, await asyncio.gather(*callers)
+
+    flight, upstream, results = asyncio.run(run())
+
+    assert results == ["result"] * 3
+    assert upstream.calls == 1
+    stats = flight.stats()
+    assert (stats["leaders"], stats["joiners"], stats["in_flight"]) == (1, 2, 0)
+
+
+def test_cancelled_leader_leaves_the_call_running_for_joiners():
+    async def run():
+        flight, upstream = SingleFlight(), Upstream()
+        leader = asyncio.ensure_future(flight.do("key", upstream))
+        await asyncio.sleep(0)
+        joiner = asyncio.ensure_future(flight.do("key", upstream))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        upstream.release.set()
+        return flight, upstream, await joiner
+
+    flight, upstream, result = asyncio.run(run())
+
+    assert result == "result"
+    assert upstream.calls == 1
+    assert upstream.cancelled == 0
+    assert flight.abandoned == 0
+
+
+def test_last_waiter_leaving_cancels_the_call():
+    async def run():
+        flight, upstream = SingleFlight(), Upstream()
+        callers = [asyncio.ensure_future(flight.do("key", upstream)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0)
+        # The next caller starts a new call rather than joining the cancelled one
+        after = asyncio.ensure_future(flight.do("key", upstream))
+        await asyncio.sleep(0)
+        upstream.release.set()
+        return flight, upstream, await after
+
+    flight, upstream, result = asyncio.run(run())
+
+    assert upstream.cancelled == 1
+    assert flight.abandoned == 1
+    assert upstream.calls == 2
+    assert result == "result"
+
+
+def test_caller_arriving_as_the_last_waiter_leaves_starts_a_new_call():
+    async def run():
+        flight, upstream = SingleFlight(), Upstream()
+        caller = asyncio.ensure_future(flight.do("key", upstream))
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        caller.cancel()
+        # Let the caller abandon the call, but not the call observe its cancellation
+        await asyncio.sleep(0)
+        asyncio.get_running_loop().call_later(0.01, upstream.release.set)
+        result = await flight.do("key", upstream)
+        return flight, upstream, result
+
+    flight, upstream, result = asyncio.run(run())
+
+    assert result == "result"
+    assert upstream.calls == 2
+    assert upstream.cancelled == 1
+    assert flight.stats()["leaders"] == 2
+    assert flight.in_flight() == 0
+
+
+def test_errors_reach_every_waiter():
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream failed")
+
+    async def run():
+        flight = SingleFlight()
+        return await asyncio.gather(*(flight.do("key", failing) for _ in range(2)), return_exceptions=True)
+
+    results = asyncio.run(run())
+
+    assert [type(r) for r in results] == [ValueError, ValueError]
+
+
+def test_processes_sharing_a_store_make_one_upstream_call(tmp_path):
+    store = SQLiteStore(str(tmp_path / "shared.db"))
+
+    async def run():
+        # One flight per worker process, all on one store
+        flights, upstream = [SingleFlight(store=store, poll_interval=0.01) for _ in range(2)], Upstream()
+        callers = [asyncio.ensure_future(flight.do("key", upstream)) for flight in flights]
+        await asyncio.sleep(0.1)
+        upstream.release.set()
+        return flights, upstream, await asyncio.gather(*callers)
+
+    flights, upstream, results = asyncio.run(run())
+    store.close()
+
+    assert results == ["result", "result"]
+    assert upstream.calls == 1
+    assert sum(flight.remote_joins for flight in flights) == 1
+
+
+async def ticks(count, produced, cancelled):
+    try:
+        for i in range(count):
+            produced.append(i)
+            yield i
+            await asyncio.sleep(0.01)
+    except asyncio.CancelledError:
+        cancelled.append(True)
+        raise
+
+
+def test_late_subscriber_replays_then_follows_the_stream():
+    async def run():
+        fanout, produced, cancelled = StreamFanout(), [], []
+        first = fanout.subscribe("key", lambda: ticks(5, produced, cancelled))
+        received = [await first.__anext__(), await first.__anext__()]
+        late = [chunk async for chunk in fanout.subscribe("key", lambda: ticks(5, produced, cancelled))]
+        received += [chunk async for chunk in first]
+        return fanout, produced, received, late
+
+    fanout, produced, received, late = asyncio.run(run())
+
+    assert produced == [0, 1, 2, 3, 4]
+    assert received == late == [0, 1, 2, 3, 4]
+    assert fanout.stats()["streams_started"] == 1
+    assert fanout.stats()["joins"] == 1
+
+
+def test_stream_continues_when_its_first_subscriber_leaves():
+    async def run():
+        fanout, produced, cancelled = StreamFanout(), [], []
+        first = fanout.subscribe("key", lambda: ticks(5, produced, cancelled))
+        await first.__anext__()
+        second = fanout.subscribe("key", lambda: ticks(5, produced, cancelled))
+        await second.__anext__()
+        await first.aclose()
+        rest = [chunk async for chunk in second]
+        return produced, cancelled, rest
+
+    produced, cancelled, rest = asyncio.run(run())
+
+    assert rest == [1, 2, 3, 4]
+    assert produced == [0, 1, 2, 3, 4]
+    assert cancelled == []
+
+
+def test_last_subscriber_leaving_cancels_the_stream():
+    async def run():
+        fanout, produced, cancelled = StreamFanout(), [], []
+        stream = fanout.subscribe("key", lambda: ticks(100, produced, cancelled))
+        await stream.__anext__()
+        await stream.aclose()
+        await asyncio.sleep(0.05)
+        return fanout, produced, cancelled
+
+    fanout, produced, cancelled = asyncio.run(run())
+
+    assert cancelled == [True]
+    assert len(produced) < 100
+    assert fanout.in_flight() == 0